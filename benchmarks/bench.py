@@ -0,0 +1,308 @@
+"""
+MCPLLMBridge.process_message のエンドツーエンド負荷ベンチマーク
+
+ローカルのスタンドインサーバー（OpenAI互換・SerpAPI・にじボイス）を起動し、
+N個の同時セッションからZipf分布の話題で質問を投げて、ターンのレイテンシ
+（p50/p95/p99）、スループット、キャッシュヒット率、最大RSSを報告する。
+
+    python benchmarks/bench.py --sessions 16 --turns 10 --llm-latency-ms 300
+"""
+
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+from mcp import StdioServerParameters
+
+from fake_servers import FakeNijivoiceServer, FakeOpenAIServer, FakeSerpAPIServer, FakeServer, LatencyModel
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class ZipfWorkload:
+    """n_topics個の話題から、順位kの話題を1/k^sに比例した確率で選ぶ"""
+
+    def __init__(self, n_topics: int, s: float, rng: random.Random):
+        self.topics = [f"話題{rank:04d}" for rank in range(1, n_topics + 1)]
+        weights = [1.0 / rank ** s for rank in range(1, n_topics + 1)]
+        self.cumulative = list(itertools.accumulate(weights))
+        self.rng = rng
+
+    def next_query(self) -> str:
+        point = self.rng.random() * self.cumulative[-1]
+        topic = self.topics[bisect.bisect_left(self.cumulative, point)]
+        return f"「{topic}」について教えて"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """最近傍順位法のパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(p / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # LinuxはKB、macOSはバイト単位
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def hit_rate(hits: int, lookups: int) -> Optional[float]:
+    return round(hits / lookups, 3) if lookups else None
+
+
+# ベンチマークと再生が書き換える環境変数
+ENV_KEYS = (
+    "SERPAPI_KEY", "SERPAPI_BASE_URL", "SEARCH_CACHE_DB", "NIJIVOICE_API_KEY", "NIJIVOICE_API_BASE_URL",
+    "VOICE_MODE", "VOICE_CACHE_DIR", "SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET", "SPOTIFY_OPEN_BROWSER",
+    "SPOTIFY_TOKEN_CACHE", "TRACE_FILE", "SDL_AUDIODRIVER", "BLOB_STORE_DIR",
+)
+
+
+def configure_environment(args, workdir: str, openai: FakeServer, serpapi: FakeServer, nijivoice: FakeServer):
+    """ブリッジとツールがスタンドインサーバーを使うよう環境変数を設定する"""
+    os.environ.update({
+        "SERPAPI_KEY": "bench",
+        "SERPAPI_BASE_URL": serpapi.url("/search"),
+        "SEARCH_CACHE_DB": os.path.join(workdir, "search_cache.db"),
+        "NIJIVOICE_API_KEY": "bench",
+        "NIJIVOICE_API_BASE_URL": nijivoice.url("/v1"),
+        "VOICE_MODE": "true" if args.voice else "false",
+        "VOICE_CACHE_DIR": os.path.join(workdir, "voice_cache"),
+        "SPOTIFY_CLIENT_ID": "bench",
+        "SPOTIFY_CLIENT_SECRET": "bench",
+        "SPOTIFY_OPEN_BROWSER": "false",
+        "SPOTIFY_TOKEN_CACHE": os.path.join(workdir, "spotify_token"),
+        "TRACE_FILE": args.trace_file or "",
+        "SDL_AUDIODRIVER": "dummy",
+        "BLOB_STORE_DIR": os.path.join(workdir, "blob_store"),
+    })
+
+
+def rate_limits(args) -> Dict[str, Any]:
+    from mcp_llm_bridge.config import RateLimitConfig
+    return {
+        "openai": RateLimitConfig(requests_per_minute=args.openai_rpm, tokens_per_minute=args.openai_tpm),
+        "serpapi": RateLimitConfig(requests_per_minute=args.serpapi_rpm),
+        "nijivoice": RateLimitConfig(requests_per_minute=args.nijivoice_rpm),
+    }
+
+
+def hedging_config(args):
+    from mcp_llm_bridge.config import HedgingConfig
+    if args.hedge_percentile is None:
+        return HedgingConfig()
+    # 観測が揃うまでは中央値の3倍を待つ
+    return HedgingConfig(enabled=True, percentile=args.hedge_percentile, initial_delay_s=args.llm_latency_ms * 3 / 1000)
+
+
+def collect_hedging_stats(bridges) -> Dict[str, Any]:
+    totals = {"requests": 0, "hedged": 0, "hedge_wins": 0, "extra_tokens": 0}
+    for bridge in bridges:
+        stats = bridge.thinking_client.hedging.stats()
+        for key in totals:
+            totals[key] += stats[key]
+    totals["hedge_rate"] = round(totals["hedged"] / totals["requests"], 3) if totals["requests"] else 0.0
+    return totals
+
+
+def create_bridge(openai_url: str, play_ms: float, limits: Optional[Dict[str, Any]] = None, hedging: Any = None):
+    # 環境変数を設定してからインポートする（ツールは生成時に環境変数を読む）
+    from mcp_llm_bridge.bridge import MCPLLMBridge
+    from mcp_llm_bridge.config import BridgeConfig, HedgingConfig, LLMConfig
+
+    config = BridgeConfig(
+        mcp_server_params=StdioServerParameters(command="true", args=[]),
+        llm_config=LLMConfig(api_key="bench", model="gpt-4o", base_url=openai_url),
+        thinking_config=LLMConfig(api_key="bench", model="o1-mini", base_url=openai_url),
+        rate_limits=limits or {},
+        hedging=hedging or HedgingConfig()
+    )
+    bridge = MCPLLMBridge(config)
+    if bridge.voice_manager:
+        # 音声デバイスは使わず、再生時間だけを模倣する
+        async def play_audio(audio_data: bytes):
+            await asyncio.sleep(play_ms / 1000)
+        bridge.voice_manager.play_audio = play_audio
+    return bridge
+
+
+async def run_session(bridge, workload: ZipfWorkload, turns: int, latencies: List[float], errors: List[str]):
+    for _ in range(turns):
+        query = workload.next_query()
+        start = time.perf_counter()
+        try:
+            await bridge.process_message(query)
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def collect_cache_stats(bridges) -> Dict[str, Any]:
+    search = {"memory_hits": 0, "memory_misses": 0, "disk_hits": 0, "coalesced": 0}
+    voice = {"hits": 0, "misses": 0}
+    for bridge in bridges:
+        for key, value in bridge.search_tool.cache.stats().items():
+            if key in search:
+                search[key] += value
+        if bridge.voice_manager and bridge.voice_manager.cache is not None:
+            stats = bridge.voice_manager.cache.stats()
+            voice["hits"] += stats["hits"]
+            voice["misses"] += stats["misses"]
+    lookups = search["memory_hits"] + search["memory_misses"]
+    search["hit_rate"] = hit_rate(search["memory_hits"] + search["disk_hits"], lookups)
+    voice["hit_rate"] = hit_rate(voice["hits"], voice["hits"] + voice["misses"])
+    return {"search": search, "voice": voice}
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    openai = await FakeOpenAIServer(LatencyModel(args.llm_latency_ms, args.llm_sigma, random.Random(rng.random()))).start()
+    serpapi = await FakeSerpAPIServer(LatencyModel(args.search_latency_ms, args.search_sigma, random.Random(rng.random()))).start()
+    nijivoice = await FakeNijivoiceServer(LatencyModel(args.voice_latency_ms, args.voice_sigma, random.Random(rng.random()))).start()
+
+    bridges = []
+    with tempfile.TemporaryDirectory(prefix="mcp-bench-") as workdir:
+        try:
+            configure_environment(args, workdir, openai, serpapi, nijivoice)
+            from mcp_llm_bridge.logging_config import setup_logging
+            from mcp_llm_bridge.cassette import cassette
+            setup_logging(level=args.log_level)
+            if args.record:
+                # 負荷試験の通信をカセットに残し、replay.pyで再生できるようにする
+                cassette.configure("record", args.record)
+
+            from mcp_llm_bridge.ratelimit import limiters
+            limiters.reset()
+            limits = rate_limits(args)
+            hedging = hedging_config(args)
+            bridges = [create_bridge(openai.url("/v1"), args.play_ms, limits, hedging) for _ in range(args.sessions)]
+            workload = ZipfWorkload(args.topics, args.zipf, rng)
+            latencies: List[float] = []
+            errors: List[str] = []
+
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                run_session(bridge, workload, args.turns, latencies, errors) for bridge in bridges
+            ))
+            elapsed = time.perf_counter() - start
+
+            if args.voice:
+                await asyncio.gather(*(b.voice_manager.wait_until_idle() for b in bridges if b.voice_manager))
+
+            latencies.sort()
+            return {
+                "sessions": args.sessions,
+                "turns": len(latencies),
+                "errors": len(errors),
+                "elapsed_s": round(elapsed, 3),
+                "turns_per_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+                "latency_ms": {
+                    f"p{p}": round(percentile(latencies, p) * 1000, 1) for p in (50, 95, 99)
+                } | {"max": round(latencies[-1] * 1000, 1) if latencies else 0.0},
+                "cache": collect_cache_stats(bridges),
+                "upstream_requests": {
+                    "openai": openai.requests,
+                    "serpapi": serpapi.requests,
+                    "nijivoice": nijivoice.requests
+                },
+                "openai_models": dict(openai.models),
+                "rate_limits": {
+                    name: {key: stats[key] for key in ("queued", "throttled", "wait_ms_p95", "wait_ms_max")}
+                    for name, stats in limiters.stats().items()
+                },
+                "hedging": collect_hedging_stats(bridges),
+                "peak_rss_mb": peak_rss_mb()
+            }
+        finally:
+            for bridge in bridges:
+                await bridge.close()
+            if args.record:
+                cassette.configure("off")
+            for server in (openai, serpapi, nijivoice):
+                await server.close()
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    latency = report["latency_ms"]
+    cache = report["cache"]
+    lines = [
+        f"セッション数: {report['sessions']}  ターン数: {report['turns']}  エラー: {report['errors']}",
+        f"経過時間: {report['elapsed_s']}s  スループット: {report['turns_per_s']} turns/s",
+        f"ターンのレイテンシ: p50={latency['p50']}ms  p95={latency['p95']}ms  p99={latency['p99']}ms  max={latency['max']}ms",
+        f"検索キャッシュ: ヒット率={cache['search']['hit_rate']}  "
+        f"(memory={cache['search']['memory_hits']}, disk={cache['search']['disk_hits']}, coalesced={cache['search']['coalesced']})",
+        f"音声キャッシュ: ヒット率={cache['voice']['hit_rate']}",
+        "上流へのリクエスト: " + ", ".join(f"{k}={v}" for k, v in report["upstream_requests"].items()),
+        "OpenAIのモデル別リクエスト: " + ", ".join(f"{k}={v}" for k, v in report["openai_models"].items()),
+    ]
+    for name, stats in report["rate_limits"].items():
+        if stats["queued"] or stats["throttled"]:
+            lines.append(
+                f"レート制限の待ち（{name}）: {stats['queued']}件  p95={stats['wait_ms_p95']}ms  "
+                f"max={stats['wait_ms_max']}ms  429={stats['throttled']}"
+            )
+    hedging = report["hedging"]
+    if hedging["requests"]:
+        lines.append(
+            f"思考のヘッジ: {hedging['hedged']}/{hedging['requests']}件（ヘッジ率={hedging['hedge_rate']}）  "
+            f"ヘッジの勝ち={hedging['hedge_wins']}  追加トークン={hedging['extra_tokens']}"
+        )
+    lines.append(f"最大RSS: {report['peak_rss_mb']} MB")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="MCPLLMBridgeのエンドツーエンド負荷ベンチマーク")
+    parser.add_argument("--sessions", type=int, default=8, help="同時セッション数")
+    parser.add_argument("--turns", type=int, default=5, help="セッションあたりのターン数")
+    parser.add_argument("--topics", type=int, default=100, help="話題の種類数")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf分布の指数s")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-sigma", type=float, default=0.3)
+    parser.add_argument("--search-latency-ms", type=float, default=150.0)
+    parser.add_argument("--search-sigma", type=float, default=0.3)
+    parser.add_argument("--voice-latency-ms", type=float, default=200.0)
+    parser.add_argument("--voice-sigma", type=float, default=0.3)
+    parser.add_argument("--play-ms", type=float, default=50.0, help="1チャンクの模擬再生時間")
+    parser.add_argument("--openai-rpm", type=float, help="OpenAIのリクエスト数上限（毎分）")
+    parser.add_argument("--openai-tpm", type=float, help="OpenAIのトークン数上限（毎分）")
+    parser.add_argument("--serpapi-rpm", type=float, help="SerpAPIのリクエスト数上限（毎分）")
+    parser.add_argument("--nijivoice-rpm", type=float, help="にじボイスのリクエスト数上限（毎分）")
+    parser.add_argument("--hedge-percentile", type=float, help="思考のヘッジを有効にし、この分位点の遅延で2つ目の要求を出す（例: 0.9）")
+    parser.add_argument("--no-voice", dest="voice", action="store_false", help="音声合成を無効にする")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", default="", help="通信を記録するカセットファイル")
+    parser.add_argument("--trace-file", default="", help="スパンを書き出すJSONLファイル")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", dest="json_path", help="結果をJSONで書き出すファイル")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
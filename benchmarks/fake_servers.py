@@ -0,0 +1,185 @@
+"""
+ベンチマーク用のローカルなスタンドインサーバー
+OpenAI互換API・SerpAPI・にじボイスAPIを、遅延の分布を指定できる形で模倣する。
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import zlib
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+TOPIC_PATTERN = re.compile(r"「(.+?)」")
+
+
+@dataclass
+class LatencyModel:
+    """中央値とばらつき（対数正規分布のsigma）で応答遅延を決める"""
+    median_ms: float = 0.0
+    sigma: float = 0.0
+    rng: random.Random = field(default_factory=random.Random)
+
+    def sample(self) -> float:
+        """遅延（秒）を1つ取り出す"""
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(self.sigma * self.rng.gauss(0.0, 1.0)) / 1000
+
+    async def wait(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class FakeServer:
+    """aiohttpのTestServerで起動し、リクエスト数を数えるスタンドインの基底クラス"""
+
+    def __init__(self, latency: Optional[LatencyModel] = None):
+        self.latency = latency or LatencyModel()
+        self.requests = 0
+        self.server: Optional[TestServer] = None
+
+    def build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def start(self) -> "FakeServer":
+        self.server = TestServer(self.build_app())
+        await self.server.start_server()
+        return self
+
+    def url(self, path: str = "") -> str:
+        return str(self.server.make_url(path))
+
+    async def close(self):
+        if self.server is not None:
+            await self.server.close()
+
+
+class FakeOpenAIServer(FakeServer):
+    """ThinkingClientとLLMClientが受け付ける応答を返すOpenAI互換サーバー
+
+    初回の思考では「」で囲まれた話題をgoogle_searchする計画を返し、
+    ツール結果を含む思考では検索結果の件数を使った最終応答を返す。
+    """
+
+    def __init__(self, latency: Optional[LatencyModel] = None):
+        super().__init__(latency)
+        self.models: Counter = Counter()
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+    @staticmethod
+    def plan(prompt: str) -> Dict[str, Any]:
+        question = prompt.split("ユーザーからの質問:", 1)[-1]
+        match = TOPIC_PATTERN.search(question)
+        topic = match.group(1) if match else question.strip()[:20]
+        if "前回の実行結果:" in prompt:
+            return {
+                "needs_tool": False,
+                "task_completed": True,
+                "final_response": f"{topic}について調べました。いくつかの情報源が見つかりましたよ。"
+            }
+        phase = {
+            "phase_number": 1,
+            "operations": [{"type": "google_search", "parameters": {"query": topic, "num_results": 5}}],
+            "description": "話題を検索"
+        }
+        return {
+            "task_plan": {"overall_tasks": ["話題を検索", "回答を作成"], "total_phases": 2, "phases": [phase]},
+            "current_phase": phase,
+            "needs_tool": True,
+            "task_completed": False,
+            "final_response": None
+        }
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        self.models[body.get("model")] += 1
+        prompt = body["messages"][-1]["content"] or ""
+        await self.latency.wait()
+        content = json.dumps(self.plan(prompt), ensure_ascii=False)
+        prompt_tokens = sum(len(m.get("content") or "") for m in body["messages"]) // 2
+        completion_tokens = len(content) // 2
+        return web.json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "completion_tokens_details": {"reasoning_tokens": completion_tokens * 4}
+            }
+        })
+
+
+class FakeSerpAPIServer(FakeServer):
+    """SerpAPIのGoogle検索エンドポイントを模倣する"""
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/search", self.search)
+        return app
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        query = request.query.get("q", "")
+        num = int(request.query.get("num", "10"))
+        start = int(request.query.get("start", "0"))
+        await self.latency.wait()
+        slug = zlib.crc32(query.encode("utf-8")) % 100000
+        return web.json_response({
+            "organic_results": [
+                {
+                    "position": start + i + 1,
+                    "title": f"{query} - 記事{start + i + 1}",
+                    "link": f"https://example.com/{slug}/{start + i + 1}",
+                    "snippet": f"{query}に関する説明です。" * 3
+                }
+                for i in range(num)
+            ],
+            "answer_box": {"answer": f"{query}の概要"}
+        })
+
+
+class FakeNijivoiceServer(FakeServer):
+    """にじボイスAPIの音声生成と音声ファイルの配信を模倣する"""
+
+    def __init__(self, latency: Optional[LatencyModel] = None, audio_bytes: int = 16 * 1024):
+        super().__init__(latency)
+        self.audio_bytes = audio_bytes
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/voice-actors/{actor}/generate-voice", self.generate)
+        app.router.add_get("/audio/{index}", self.audio)
+        return app
+
+    async def generate(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await request.json()
+        await self.latency.wait()
+        return web.json_response({
+            "generatedVoice": {"audioFileUrl": str(request.url.with_path(f"/audio/{self.requests}"))}
+        })
+
+    async def audio(self, request: web.Request) -> web.Response:
+        return web.Response(body=b"\0" * self.audio_bytes, content_type="audio/mpeg")
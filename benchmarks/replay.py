@@ -0,0 +1,127 @@
+"""
+記録したカセットで会話をオフライン再実行し、ターンごとの所要時間とCPU時間を報告する
+
+    CASSETTE_MODE=record python -m mcp_llm_bridge.main      # 本番の会話を記録
+    PYTHONPATH=src python benchmarks/replay.py cassette.jsonl.gz --time-scale 0
+
+外部APIは呼ばずに、記録した応答を元の所要時間×time-scaleだけ待って返す。
+ブリッジの変更前後で同じカセットを再生すれば、レイテンシとCPU時間を比較できる。
+"""
+
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from mcp import StdioServerParameters
+
+from bench import peak_rss_mb, percentile
+
+
+def configure_environment(workdir: str):
+    """再生ではキャッシュを使わず、すべての外部呼び出しをカセットから返す"""
+    os.environ.update({
+        "SERPAPI_KEY": os.getenv("SERPAPI_KEY") or "replay",
+        "SEARCH_CACHE_DB": "",
+        "NIJIVOICE_API_KEY": os.getenv("NIJIVOICE_API_KEY") or "replay",
+        "VOICE_CACHE_DIR": "",
+        "SPOTIFY_CLIENT_ID": os.getenv("SPOTIFY_CLIENT_ID") or "replay",
+        "SPOTIFY_CLIENT_SECRET": os.getenv("SPOTIFY_CLIENT_SECRET") or "replay",
+        "SPOTIFY_OPEN_BROWSER": "false",
+        "SPOTIFY_TOKEN_CACHE": os.path.join(workdir, "spotify_token"),
+        "TRACE_FILE": "",
+        "SDL_AUDIODRIVER": "dummy",
+    })
+
+
+def create_bridge(play_ms: float):
+    from mcp_llm_bridge.bridge import MCPLLMBridge
+    from mcp_llm_bridge.config import BridgeConfig, LLMConfig
+
+    config = BridgeConfig(
+        mcp_server_params=StdioServerParameters(command="true", args=[]),
+        llm_config=LLMConfig(api_key="replay", model="gpt-4o"),
+        thinking_config=LLMConfig(api_key="replay", model="o1-mini")
+    )
+    bridge = MCPLLMBridge(config)
+    if bridge.voice_manager:
+        async def play_audio(audio_data: bytes):
+            await asyncio.sleep(play_ms / 1000)
+        bridge.voice_manager.play_audio = play_audio
+    return bridge
+
+
+async def replay(args) -> Dict[str, Any]:
+    from mcp_llm_bridge.cassette import cassette
+    from mcp_llm_bridge.logging_config import setup_logging
+
+    with tempfile.TemporaryDirectory(prefix="mcp-replay-") as workdir:
+        configure_environment(workdir)
+        setup_logging(level=args.log_level)
+        cassette.configure("replay", args.cassette, args.time_scale)
+        inputs = cassette.turn_inputs()
+        bridge = create_bridge(args.play_ms)
+        turns: List[Dict[str, float]] = []
+        try:
+            for user_input in inputs:
+                wall, cpu = time.perf_counter(), time.process_time()
+                await bridge.process_message(user_input)
+                if bridge.voice_manager:
+                    await bridge.voice_manager.wait_until_idle()
+                turns.append({
+                    "wall_ms": round((time.perf_counter() - wall) * 1000, 1),
+                    "cpu_ms": round((time.process_time() - cpu) * 1000, 1)
+                })
+        finally:
+            await bridge.close()
+            stats = cassette.stats()
+            cassette.configure("off")
+
+    wall_ms = sorted(turn["wall_ms"] for turn in turns)
+    return {
+        "cassette": args.cassette,
+        "time_scale": args.time_scale,
+        "turns": turns,
+        "wall_ms": {"total": round(sum(wall_ms), 1), "p50": percentile(wall_ms, 50), "p95": percentile(wall_ms, 95)},
+        "cpu_ms": round(sum(turn["cpu_ms"] for turn in turns), 1),
+        "cassette_stats": stats,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    stats = report["cassette_stats"]
+    lines = [f"ターン{i}: {turn['wall_ms']}ms（CPU {turn['cpu_ms']}ms）" for i, turn in enumerate(report["turns"], 1)]
+    lines += [
+        f"合計: {report['wall_ms']['total']}ms  p50={report['wall_ms']['p50']}ms  p95={report['wall_ms']['p95']}ms  "
+        f"CPU={report['cpu_ms']}ms  (time-scale={report['time_scale']})",
+        f"再生: {stats['replayed']}件（繰り返し {stats['repeats']}件）  代替: {stats['fallbacks']}件  不足: {stats['misses']}件",
+        f"最大RSS: {report['peak_rss_mb']} MB",
+    ]
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="記録したカセットで会話を再実行する")
+    parser.add_argument("cassette", help="CASSETTE_MODE=recordで記録したファイル")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="記録した所要時間に掛ける倍率（0で待たない）")
+    parser.add_argument("--play-ms", type=float, default=0.0, help="1チャンクの模擬再生時間")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", dest="json_path", help="結果をJSONで書き出すファイル")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(replay(args))
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
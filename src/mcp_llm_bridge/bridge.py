@@ -4,44 +4,32 @@ from mcp import ClientSession, StdioServerParameters
 from mcp_llm_bridge.mcp_client import MCPClient
 from mcp_llm_bridge.llm_client import LLMClient
 from mcp_llm_bridge.thinking_client import ThinkingClient
+from mcp_llm_bridge.intent import IntentRouter, extract_utterance
+from mcp_llm_bridge.retrieval import select_results
 from mcp_llm_bridge.schemas import ThinkingResponse, TaskPlan, TaskPhase, Operation, ExecutionResult
 import asyncio
 import json
 from mcp_llm_bridge.config import BridgeConfig
 import logging
-import colorlog
-from mcp_llm_bridge.tools import DatabaseQueryTool, GoogleSearchTool, HumanTool
-from mcp_llm_bridge.tools.spotify import SpotifyTool
+from mcp_llm_bridge.tools import BlobStore, DatabaseQueryTool, GoogleSearchTool, HumanTool, InputChannel
+from mcp_llm_bridge.tools.spotify import SpotifyTool, DEVICE_NOT_FOUND_MESSAGE
 from mcp_llm_bridge.voice_manager import VoiceManager
+from mcp_llm_bridge.tracing import tracer
+from mcp_llm_bridge.cassette import cassette
+from mcp_llm_bridge.ratelimit import limiters
+from mcp_llm_bridge.deadline import DeadlineExceeded, current_deadline, deadline_scope, paused, run_within
 
-def setup_logging():
-    """ロギングの設定を一度だけ行う"""
-    root_logger = logging.getLogger()
-    
-    # ハンドラーが既に設定されている場合はスキップ
-    if root_logger.handlers:
-        return
-        
-    handler = colorlog.StreamHandler()
-    handler.setFormatter(colorlog.ColoredFormatter(
-        "%(log_color)s%(levelname)s%(reset)s:     %(cyan)s%(name)s%(reset)s - %(message)s",
-        datefmt=None,
-        reset=True,
-        log_colors={
-            'DEBUG': 'cyan',
-            'INFO': 'green',
-            'WARNING': 'yellow',
-            'ERROR': 'red',
-            'CRITICAL': 'red,bg_white',
-        },
-        secondary_log_colors={},
-        style='%'
-    ))
-    root_logger.addHandler(handler)
-    root_logger.setLevel(logging.DEBUG)
-
-# ロギングの設定を行う
-setup_logging()
+NO_RESPONSE_MESSAGE = "申し訳ありません。応答を生成できませんでした。"
+NO_RESULT_MESSAGE = "申し訳ありません。結果を取得できませんでした。"
+PARTIAL_RESULT_PREFIX = "時間内に調べきれなかったので、分かったところまでお伝えします。\n\n"
+NO_PARTIAL_RESULT_MESSAGE = "申し訳ありません。時間内に結果を集められませんでした。もう一度お試しください。"
+
+# 途中までの結果から応答を作るときに使う結果の数と、1件あたりの最大文字数
+BEST_EFFORT_RESULTS = 3
+BEST_EFFORT_RESULT_CHARS = 600
+
+# 起動時に音声を事前合成しておく定型文
+CANNED_PHRASES = (NO_RESPONSE_MESSAGE, NO_RESULT_MESSAGE, DEVICE_NOT_FOUND_MESSAGE)
 
 # モジュールのロガーを取得
 logger = logging.getLogger(__name__)
@@ -49,15 +37,28 @@ logger = logging.getLogger(__name__)
 class MCPLLMBridge:
     """Bridge between MCP protocol and LLM client with structured thinking process"""
     
-    def __init__(self, config: BridgeConfig):
+    def __init__(self, config: BridgeConfig, human_channel: Optional[InputChannel] = None):
         self.config = config
+        # 上流APIごとのレート制限（同じプロセスのブリッジ間で共有する）
+        limiters.configure(config.rate_limits)
         self.mcp_client = MCPClient(config.mcp_server_params)
         self.llm_client = LLMClient(config.llm_config)
-        self.thinking_client = ThinkingClient(config.get_thinking_config())
+        # 思考は推論モデルと高速モデル（llm_config）をイテレーションごとに使い分け、遅い要求はヘッジする
+        self.thinking_client = ThinkingClient(
+            config.get_thinking_config(),
+            fast_config=config.llm_config,
+            routing=config.routing,
+            hedging=config.hedging,
+            retrieval=config.retrieval
+        )
+        # 定型のSpotify操作は思考モデルの計画を待たずにローカルで組み立てる
+        self.intent_router = IntentRouter(config.intents)
         self.query_tool = DatabaseQueryTool("test.db")
         self.search_tool = GoogleSearchTool()
-        self.human_tool = HumanTool()
+        self.human_tool = HumanTool(human_channel)
         self.spotify_tool = SpotifyTool()
+        # 大きなツール結果はプロンプトに直接入れず、ハンドルと要約で渡す
+        self.blob_store = BlobStore()
         
         # 音声マネージャーの初期化
         try:
@@ -73,13 +74,13 @@ class MCPLLMBridge:
         self.available_tools: List[Any] = []
         self.tool_name_mapping: Dict[str, str] = {}
         self.current_task_plan: Optional[TaskPlan] = None
-        self.spotify_state = {
-            "is_playing": False,
-            "current_track_id": None,
-            "current_device": None
-        }
         self.is_task_completed = False    # タスクが完了したかどうかを表すフラグ
 
+    @property
+    def spotify_state(self) -> Dict[str, Any]:
+        """Spotifyの再生状態（SpotifyToolと共有するキャッシュから取得）"""
+        return self.spotify_tool.state.snapshot()
+
     def _create_tool_prompt(self):
         """ツール実行用のプロンプトを生成"""
         tool_prompt = f"""
@@ -97,21 +98,48 @@ class MCPLLMBridge:
 - パラメータ:
   - query (string) - 検索クエリ文字列
   - num_results (integer, optional) - 取得する結果の数（1-10）
-- 戻り値: 検索結果のJSON形式データ
+  - fetch_pages (integer, optional) - 上位N件のページ本文を取得して抜粋を付ける（0-5）
+- 戻り値: 検索結果（results）と、あればanswer_box/knowledge_graph等の要点（highlights）のJSON形式データ
 
-3. human_interaction
+3. google_search_batch
+- 説明: 複数の検索クエリ（言い換え）や複数ページを同時に検索し、重複を除いた1つのランキングにまとめる
+- パラメータ:
+  - queries (array of string) - 検索クエリのリスト（最大5件）
+  - pages (integer, optional) - クエリごとに取得するページ数（1-3）
+  - max_results (integer, optional) - 返す結果の数（1-30）
+  - fetch_pages (integer, optional) - 上位N件のページ本文を取得して抜粋を付ける（0-5）
+- 戻り値: 統合された検索結果のJSON形式データ
+
+4. human_interaction
 - 説明: ユーザーに追加の質問をして情報を収集
-- パラメータ: question (string) - ユーザーへの質問文
-- 戻り値: ユーザーの回答を含むJSON形式データ
+- パラメータ:
+  - question (string) - ユーザーへの質問文
+  - questions (array, optional) - まとめて尋ねる複数の質問（最大5件）。各要素は id, question, type (text/choice/number/boolean), choices, default
+  - timeout (number, optional) - 回答を待つ最大秒数
+  - default_answer (string, optional) - タイムアウトした場合に使う回答（省略時はタイムアウトをエラーとして返す）
+- 戻り値: ユーザーの回答を含むJSON形式データ（既定の回答を使った場合はtimed_out: true）。questionsの場合はidごとの回答(answers)
 
-4. spotify
+5. spotify
 - 説明: Spotifyの操作を行う
 - パラメータ:
-  - action (string) - 実行するアクション（search/play/pause/current_track/add_to_queue）
+  - action (string) - 実行するアクション（search/tracks/play/pause/current_track/add_to_queue）
   - query (string, optional) - 検索クエリ（searchアクション用）
-  - track_id (string, optional) - トラックID（play/add_to_queueアクション用）
+  - limit (integer, optional) - 検索結果の件数（searchアクション用、1-10）
+  - track_id (string, optional) - トラックID（play/add_to_queue/tracksアクション用）
+  - track_ids (array of string, optional) - 複数のトラックID（play/add_to_queue/tracksアクション用、最大20件）
+  - context_uri (string, optional) - アルバム・プレイリストのURIまたはURL（playアクション用）
 - 戻り値: アクションの結果をJSON形式で返す
 
+6. blob_read
+- 説明: 大きな実行結果のハンドル（blob:...）から詳細を読み出す
+- パラメータ:
+  - handle (string) - 実行結果に含まれるハンドル
+  - key (string, optional) - 読み出す項目の名前（results, tracksなど。省略時は最初のリスト）
+  - start (integer, optional) - 読み出す位置（省略時0）
+  - limit (integer, optional) - 読み出す件数（1-50、省略時10。テキストやリスト以外の値の場合は文字数、最大4000）
+  - fields (array of string, optional) - 各項目から取り出すキー
+- 戻り値: 指定範囲の項目（items）と総数（total）のJSON形式データ。リスト以外の値はJSON文字列の指定範囲（json）と文字数（chars）
+
 【データベーススキーマ】
 {self.query_tool.get_schema_description()}
 
@@ -129,10 +157,14 @@ class MCPLLMBridge:
         """Initialize both clients and set up tools"""
         try:
             await self.mcp_client.connect()
+            self.spotify_tool.start()
+            if self.voice_manager:
+                self.voice_manager.prewarm(CANNED_PHRASES)
             
             # ツールの仕様を取得
             query_tool_spec = self.query_tool.get_tool_spec()
             search_tool_spec = self.search_tool.get_tool_spec()
+            search_batch_tool_spec = self.search_tool.get_batch_tool_spec()
             human_tool_spec = self.human_tool.get_tool_spec()
             spotify_tool_spec = self.spotify_tool.get_tool_spec()
             
@@ -140,12 +172,16 @@ class MCPLLMBridge:
             self.tool_name_mapping = {
                 "database_query": query_tool_spec["name"],
                 "google_search": search_tool_spec["name"],
+                "google_search_batch": search_batch_tool_spec["name"],
                 "human_interaction": human_tool_spec["name"],
                 "spotify": spotify_tool_spec["name"]
             }
             
             # 利用可能なツールを設定
-            self.available_tools = [query_tool_spec, search_tool_spec, human_tool_spec, spotify_tool_spec]
+            self.available_tools = [
+                query_tool_spec, search_tool_spec, search_batch_tool_spec,
+                human_tool_spec, spotify_tool_spec
+            ]
             
             # OpenAI形式のツール定義
             converted_tools = [
@@ -160,9 +196,37 @@ class MCPLLMBridge:
                                 "question": {
                                     "type": "string",
                                     "description": "ユーザーへの質問"
+                                },
+                                "questions": {
+                                    "type": "array",
+                                    "description": "まとめて尋ねる複数の質問（最大5件）",
+                                    "items": {
+                                        "type": "object",
+                                        "properties": {
+                                            "id": {"type": "string"},
+                                            "question": {"type": "string"},
+                                            "type": {
+                                                "type": "string",
+                                                "enum": ["text", "choice", "number", "boolean"]
+                                            },
+                                            "choices": {
+                                                "type": "array",
+                                                "items": {"type": "string"}
+                                            },
+                                            "default": {"type": "string"}
+                                        },
+                                        "required": ["question"]
+                                    }
+                                },
+                                "timeout": {
+                                    "type": "number",
+                                    "description": "回答を待つ最大秒数"
+                                },
+                                "default_answer": {
+                                    "type": "string",
+                                    "description": "タイムアウトした場合に使う回答"
                                 }
-                            },
-                            "required": ["question"]
+                            }
                         }
                     }
                 },
@@ -184,12 +248,58 @@ class MCPLLMBridge:
                                     "minimum": 1,
                                     "maximum": 10,
                                     "default": 5
+                                },
+                                "fetch_pages": {
+                                    "type": "integer",
+                                    "description": "上位N件のページ本文を取得して抜粋を付ける（0-5）",
+                                    "minimum": 0,
+                                    "maximum": 5,
+                                    "default": 0
                                 }
                             },
                             "required": ["query"]
                         }
                     }
                 },
+                {
+                    "type": "function",
+                    "function": {
+                        "name": "google_search_batch",
+                        "description": "複数の検索クエリ・ページを同時に検索し、重複を除いて統合した結果を取得",
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                "queries": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "検索クエリのリスト（最大5件）"
+                                },
+                                "pages": {
+                                    "type": "integer",
+                                    "description": "クエリごとに取得するページ数（1-3）",
+                                    "minimum": 1,
+                                    "maximum": 3,
+                                    "default": 1
+                                },
+                                "max_results": {
+                                    "type": "integer",
+                                    "description": "返す結果の数（1-30）",
+                                    "minimum": 1,
+                                    "maximum": 30,
+                                    "default": 10
+                                },
+                                "fetch_pages": {
+                                    "type": "integer",
+                                    "description": "上位N件のページ本文を取得して抜粋を付ける（0-5）",
+                                    "minimum": 0,
+                                    "maximum": 5,
+                                    "default": 0
+                                }
+                            },
+                            "required": ["queries"]
+                        }
+                    }
+                },
                 {
                     "type": "function",
                     "function": {
@@ -217,16 +327,32 @@ class MCPLLMBridge:
                             "properties": {
                                 "action": {
                                     "type": "string",
-                                    "enum": ["search", "play", "pause", "current_track", "add_to_queue"],
+                                    "enum": ["search", "tracks", "play", "pause", "current_track", "add_to_queue"],
                                     "description": "実行するアクション"
                                 },
                                 "query": {
                                     "type": "string",
                                     "description": "検索クエリ（searchアクション用）"
                                 },
+                                "limit": {
+                                    "type": "integer",
+                                    "description": "検索結果の件数（searchアクション用、1-10）",
+                                    "minimum": 1,
+                                    "maximum": 10,
+                                    "default": 5
+                                },
                                 "track_id": {
                                     "type": "string",
-                                    "description": "トラックID（play/add_to_queueアクション用）"
+                                    "description": "トラックID（play/add_to_queue/tracksアクション用）"
+                                },
+                                "track_ids": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "複数のトラックID（play/add_to_queue/tracksアクション用、最大20件）"
+                                },
+                                "context_uri": {
+                                    "type": "string",
+                                    "description": "アルバム・プレイリストのURIまたはURL（playアクション用）"
                                 }
                             },
                             "required": ["action"]
@@ -244,16 +370,33 @@ class MCPLLMBridge:
 
     async def process_message(self, user_input: str) -> str:
         """Process a user message through the bridge with structured thinking process"""
+        # 1回の処理を1トレースとして計測する（終了時にクリティカルパスを要約）
+        cassette.record_turn(user_input)
+        with tracer.span("process_message", **{"input.chars": len(user_input)}) as span, \
+                deadline_scope(self.config.deadline.turn_seconds):
+            response = await self._process_message(user_input)
+            span.set_attribute("task_completed", self.is_task_completed)
+            return response
+
+    async def _process_message(self, user_input: str) -> str:
+        accumulated_results: List[Dict[str, Any]] = []
         try:
+            # クエリ回数・推論モデルの予算はターンごと
+            self.llm_client.start_turn()
+            self.thinking_client.start_turn()
+
             # ユーザー発話をThinkingClientに記録
             self.thinking_client.add_user_message(user_input)
 
             iteration = 0
             max_iterations = 4
-            accumulated_results: List[Dict[str, Any]] = []
 
-            # 最初の思考プロセス (iteration=0)
-            thinking_response = await self.thinking_client.think(user_input)
+            # 最初の思考プロセス (iteration=0)。定型の操作は高速経路で計画する
+            fast_path = self.intent_router.route(user_input)
+            if fast_path:
+                thinking_response = fast_path.start()
+            else:
+                thinking_response = await self.thinking_client.think(user_input)
 
             while iteration < max_iterations:
                 logger.info(f"=== 実行イテレーション {iteration + 1}/{max_iterations} ===")
@@ -265,19 +408,17 @@ class MCPLLMBridge:
                     if not final_response:
                         final_response = self._format_final_response(accumulated_results)
                     if not final_response:
-                        final_response = "申し訳ありません。応答を生成できませんでした。"
+                        final_response = NO_RESPONSE_MESSAGE
 
-                    # 音声出力
-                    if final_response and self.voice_manager and self.voice_manager.is_voice_enabled():
-                        try:
-                            logger.debug("音声出力を開始します")
-                            self.voice_manager.process_text(final_response)
-                            logger.debug("音声出力が完了しました")
-                        except Exception as e:
-                            logger.error(f"音声出力でエラー: {str(e)}")
+                    # 音声出力（バックグラウンドで再生し、応答は待たずに返す）
+                    self._speak(final_response)
 
                     return final_response
 
+                # 残り時間が少なければ、次の段階に進まず集めた結果で答える
+                if self._out_of_time():
+                    return self._answer_best_effort(accumulated_results, "期限が近い")
+
                 # ツール実行が必要な場合
                 if thinking_response.needs_tool and thinking_response.current_phase:
                     current_results = await self._execute_phase(thinking_response.current_phase)
@@ -303,26 +444,37 @@ class MCPLLMBridge:
                         self.thinking_client.add_assistant_message(f"【要約】{jp_tool_summary}")
                     # -----------------------------------------------
 
-                    # ツール実行後に改めて思考プロセス
-                    thinking_response = await self.thinking_client.think(
-                        user_input,
-                        json.dumps(accumulated_results, ensure_ascii=False, indent=2),
-                        iteration + 1
-                    )
+                    # ツール実行後に改めて思考プロセス（高速経路で扱えない結果なら思考モデルに引き継ぐ）
+                    thinking_response = fast_path.next(current_results) if fast_path else None
+                    if thinking_response is None:
+                        fast_path = None
+                        if self._out_of_time():
+                            return self._answer_best_effort(accumulated_results, "期限が近い")
+                        prompt_results = await self.blob_store.compact_results(accumulated_results)
+                        # 今回のフェーズの結果はすべて渡し、それより前の結果は要求に関連する上位k件だけ渡す
+                        if self.config.retrieval.enabled:
+                            prompt_results = select_results(
+                                prompt_results,
+                                extract_utterance(user_input),
+                                self.config.retrieval.top_k,
+                                keep_last=len(current_results),
+                                config=self.config.retrieval
+                            )
+                        thinking_response = await self.thinking_client.think(
+                            user_input,
+                            json.dumps(prompt_results, ensure_ascii=False, indent=2, default=str),
+                            iteration + 1
+                        )
+                    elif thinking_response.final_response:
+                        self.thinking_client.add_assistant_message(thinking_response.final_response)
                 else:
                     # ツールが不要な場合は直接応答
                     final_response = thinking_response.final_response
                     if not final_response:
-                        final_response = "申し訳ありません。応答を生成できませんでした。"
+                        final_response = NO_RESPONSE_MESSAGE
 
-                    # 音声出力
-                    if final_response and self.voice_manager and self.voice_manager.is_voice_enabled():
-                        try:
-                            logger.debug("音声出力を開始します")
-                            self.voice_manager.process_text(final_response)
-                            logger.debug("音声出力が完了しました")
-                        except Exception as e:
-                            logger.error(f"音声出力でエラー: {str(e)}")
+                    # 音声出力（バックグラウンドで再生し、応答は待たずに返す）
+                    self._speak(final_response)
 
                     return final_response
 
@@ -331,69 +483,93 @@ class MCPLLMBridge:
             # max_iterationsを超えた場合
             if self.is_task_completed:
                 return final_response or "タスクが完了しました。"
-            else:
-                return "タスクを完了できませんでした。"
+            return self._answer_best_effort(accumulated_results, "イテレーションの上限")
 
+        except DeadlineExceeded as e:
+            return self._answer_best_effort(accumulated_results, str(e))
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}", exc_info=True)
             return f"申し訳ありません。処理中にエラーが発生しました: {str(e)}"
 
+    def _out_of_time(self) -> bool:
+        deadline = current_deadline()
+        return deadline is not None and deadline.expired(self.config.deadline.min_stage_seconds)
+
+    def _answer_best_effort(self, results: List[Dict[str, Any]], reason: str) -> str:
+        """計画を最後まで進められなかったときに、集めた結果から応答を作る"""
+        logger.warning(f"計画を打ち切り、集めた結果から応答します（{reason}）")
+        span = tracer.current_span()
+        if span is not None:
+            span.set_attribute("turn.best_effort", reason)
+        response = self._format_best_effort(results)
+        self._speak(response)
+        return response
+
+    def _speak(self, text: str):
+        """応答の読み上げをバックグラウンドのキューに積む"""
+        if text and self.voice_manager and self.voice_manager.is_voice_enabled():
+            try:
+                # 新しい応答は前の応答の読み上げに割り込む
+                self.voice_manager.speak(text, preempt=True)
+            except Exception as e:
+                logger.error(f"音声出力でエラー: {str(e)}")
+
     async def _execute_phase(self, phase: TaskPhase) -> List[ExecutionResult]:
         """Execute a single phase of operations"""
         results = []
         
         for operation in phase.operations:
-            try:
-                if operation.type == "spotify":
-                    action = operation.parameters.get("action")
+            attributes = {"tool.action": operation.parameters.get("action")} if operation.type == "spotify" else {}
+            with tracer.span(f"tool.{operation.type}", **attributes) as span:
+                try:
+                    if operation.type == "spotify":
+                        action = operation.parameters.get("action")
                     
-                    # 現在の状態をチェック
-                    if action == "play" and self.spotify_state["is_playing"]:
-                        # 既に再生中の場合はスキップ
-                        continue
-                    elif action == "pause":
-                        # 一時停止時は状態をリセット
-                        self.spotify_state = {
-                            "is_playing": False,
-                            "current_track_id": None,
-                            "current_device": None
-                        }
+                        # 同じ曲を既に再生中の場合はスキップ（状態はキャッシュから取得）
+                        if action == "play":
+                            try:
+                                await self.spotify_tool.state.playback()
+                            except Exception as e:
+                                logger.warning(f"Spotifyの再生状態を取得できませんでした: {str(e)}")
+                            state = self.spotify_state
+                            if state["is_playing"] and state["current_track_id"] == operation.parameters.get("track_id"):
+                                continue
                     
-                    # Spotifyツールを実行
-                    result = await self.spotify_tool.execute(operation.parameters)
+                        # Spotifyツールを実行（再生状態のキャッシュはツール側で更新される）
+                        result = await run_within(self.spotify_tool.execute(operation.parameters), span.name)
                     
-                    # 結果に基づいて状態を更新
-                    if result.get("status") == "playing":
-                        self.spotify_state = {
-                            "is_playing": True,
-                            "current_track_id": result.get("track_id"),
-                            "current_device": result.get("device")
-                        }
-                    
-                elif operation.type == "human_interaction":
-                    result = await self.human_tool.execute(operation.parameters)
-                elif operation.type == "google_search":
-                    result = await self.search_tool.execute(operation.parameters)
-                elif operation.type == "database_query":
-                    result = await self.query_tool.execute(operation.parameters)
-                else:
-                    raise ValueError(f"Unknown operation type: {operation.type}")
+                    elif operation.type == "human_interaction":
+                        # ユーザーの回答を待つ間はターンの期限を止める
+                        with paused():
+                            result = await self.human_tool.execute(operation.parameters)
+                    elif operation.type == "google_search":
+                        result = await run_within(self.search_tool.execute(operation.parameters), span.name)
+                    elif operation.type == "google_search_batch":
+                        result = await run_within(self.search_tool.execute_batch(operation.parameters), span.name)
+                    elif operation.type == "database_query":
+                        result = await run_within(self.query_tool.execute(operation.parameters), span.name)
+                    elif operation.type == "blob_read":
+                        result = await self.blob_store.execute(operation.parameters)
+                    else:
+                        raise ValueError(f"Unknown operation type: {operation.type}")
                 
-                execution_result = ExecutionResult(
-                    operation_type=operation.type,
-                    success=True,
-                    result=result,
-                    error=None
-                )
+                    execution_result = ExecutionResult(
+                        operation_type=operation.type,
+                        success=True,
+                        result=result,
+                        error=None
+                    )
                 
-            except Exception as e:
-                logger.error(f"Operation execution failed: {str(e)}")
-                execution_result = ExecutionResult(
-                    operation_type=operation.type,
-                    success=False,
-                    result=None,
-                    error=str(e)
-                )
+                except Exception as e:
+                    logger.error(f"Operation execution failed: {str(e)}")
+                    execution_result = ExecutionResult(
+                        operation_type=operation.type,
+                        success=False,
+                        result=None,
+                        error=str(e)
+                    )
+            
+                span.set_attribute("tool.success", execution_result.success)
             
             results.append(execution_result)
             
@@ -410,23 +586,10 @@ class MCPLLMBridge:
             last_result = results[-1]
             
             # Google検索結果の場合
-            if last_result["operation_type"] == "google_search":
-                try:
-                    search_results = last_result["result"]
-                    if isinstance(search_results, str):
-                        search_results = json.loads(search_results)
-                    
-                    response = "検索結果:\n\n"
-                    for item in search_results:
-                        if isinstance(item, dict):
-                            title = item.get('title', '')
-                            snippet = item.get('snippet', '')
-                            if title and snippet:
-                                response += f"・{title}\n{snippet}\n\n"
-                    
-                    return response.strip()
-                except:
-                    pass
+            if last_result["operation_type"] in ("google_search", "google_search_batch"):
+                response = self._format_search_result(last_result["result"])
+                if response is not None:
+                    return response
             
             # その他の結果の場合はデフォルトフォーマットを使用
             try:
@@ -437,18 +600,93 @@ class MCPLLMBridge:
                 return str(last_result["result"])
         
         # エラーまたは結果がない場合
-        return "申し訳ありません。結果を取得できませんでした。"
+        return NO_RESULT_MESSAGE
+
+    @staticmethod
+    def _format_search_result(search_results: Any) -> Optional[str]:
+        """検索結果を要点と各結果のタイトル・抜粋の一覧にする（形式が違えばNone）"""
+        try:
+            if isinstance(search_results, str):
+                search_results = json.loads(search_results)
+            highlights = {}
+            if isinstance(search_results, dict):
+                highlights = search_results.get("highlights") or {}
+                search_results = search_results.get("results", [])
+            
+            response = ""
+            answer_box = highlights.get("answer_box") or {}
+            if answer := answer_box.get("answer") or answer_box.get("snippet"):
+                response += f"回答: {answer}\n\n"
+            knowledge_graph = highlights.get("knowledge_graph") or {}
+            if description := knowledge_graph.get("description"):
+                response += f"{knowledge_graph.get('title', '')}: {description}\n\n"
+
+            response += "検索結果:\n\n"
+            for item in search_results:
+                if isinstance(item, dict):
+                    title = item.get('title', '')
+                    snippet = item.get('snippet', '')
+                    if title and snippet:
+                        response += f"・{title}\n{snippet}\n\n"
+            
+            return response.strip()
+        except Exception:
+            return None
+
+    def _format_best_effort(self, results: List[Dict[str, Any]]) -> str:
+        """成功した結果の新しいものから順に、読める形にまとめる"""
+        parts: List[str] = []
+        for result in reversed(results):
+            if len(parts) >= BEST_EFFORT_RESULTS:
+                break
+            if not result["success"] or not result["result"]:
+                continue
+            text = self._format_result(result)
+            if text and text not in parts:
+                parts.append(text[:BEST_EFFORT_RESULT_CHARS])
+        if not parts:
+            return NO_PARTIAL_RESULT_MESSAGE
+        return PARTIAL_RESULT_PREFIX + "\n\n".join(parts)
+
+    def _format_result(self, result: Dict[str, Any]) -> Optional[str]:
+        """1件のツール結果を応答用のテキストにする（ユーザーへの質問の回答は含めない）"""
+        operation_type, value = result["operation_type"], result["result"]
+        if operation_type in ("google_search", "google_search_batch"):
+            return self._format_search_result(value)
+        if operation_type == "database_query" and isinstance(value, list):
+            lines = [f"データベースから{len(value)}件見つかりました。"]
+            lines += ["・" + ", ".join(f"{k}: {v}" for k, v in row.items()) for row in value[:5] if isinstance(row, dict)]
+            return "\n".join(lines)
+        if operation_type == "spotify" and isinstance(value, dict):
+            if value.get("error"):
+                return None
+            if tracks := value.get("tracks"):
+                return "Spotifyの検索結果:\n" + "\n".join(f"・{t['name']} / {t['artist']}" for t in tracks[:5])
+            if track := value.get("track"):
+                return f"再生中の曲: {track['name']} / {track['artist']}"
+            return None
+        if operation_type == "human_interaction":
+            return None
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
 
     async def close(self):
         """Clean up resources"""
         await self.mcp_client.__aexit__(None, None, None)
-
-    def summarize_context(self) -> str:
+        await self.search_tool.close()
+        self.spotify_tool.close()
+        self.human_tool.close()
+        if self.voice_manager:
+            await self.voice_manager.close()
+        await self.llm_client.client.close()
+        await self.thinking_client.close()
+
+    def summarize_context(self, query: Optional[str] = None) -> str:
         """
         これまでの会話・ツール結果などを要約して返す。
         ThinkingClientの会話履歴と実行結果を利用。
+        queryを渡すと、それに関連する過去の会話・結果を選んで載せる。
         """
-        return self.thinking_client.get_conversation_summary()
+        return self.thinking_client.get_conversation_summary(query)
 
 class BridgeManager:
     """Manager class for handling the bridge lifecycle"""
@@ -475,8 +713,8 @@ class BridgeManager:
             return False
         return self.bridge.is_task_completed
 
-    def summarize_context(self) -> str:
+    def summarize_context(self, query: Optional[str] = None) -> str:
         """bridgeのsummarize_contextを呼び出し、要約を取得。"""
         if not self.bridge:
             return ""
-        return self.bridge.summarize_context()
+        return self.bridge.summarize_context(query)
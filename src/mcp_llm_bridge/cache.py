@@ -0,0 +1,327 @@
+"""
+Caching primitives shared by the MCP LLM Bridge tools.
+Provides query normalisation, an in-memory LRU tier with TTLs, an on-disk SQLite tier,
+a two-tier cache that coalesces concurrent lookups for the same key and a size-bounded
+directory cache for binary blobs.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalise a free-text query for use as a cache key.
+
+    NFKC folds full-width/half-width variants (e.g. ＡＢＣ１２３ and ｶﾀｶﾅ),
+    casefold() removes case differences and runs of whitespace (including the
+    ideographic space) collapse to a single ASCII space.
+    """
+    folded = unicodedata.normalize("NFKC", query).casefold()
+    return " ".join(folded.split())
+
+
+class TTLCache:
+    """In-memory LRU cache whose entries expire after a fixed TTL"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value or None if it is missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None):
+        """Store a value, evicting the least recently used entry when full"""
+        if expires_at is None:
+            expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        """Remove a single entry"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk cache tier storing JSON values in a SQLite table"""
+
+    def __init__(self, db_path: str, ttl: float = 86400.0):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Return (expires_at, value) for a live entry, otherwise None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= time.time():
+            self.delete(key)
+            return None
+        return expires_at, json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> float:
+        """Store a JSON-serialisable value and return its expiry time"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, payload, expires_at)
+            )
+            self._conn.commit()
+        return expires_at
+
+    def delete(self, key: str):
+        """Remove a single entry"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying connection"""
+        with self._lock:
+            self._conn.close()
+
+
+class _LeaderCancelled(Exception):
+    """The coalesced fetch was cancelled by the caller that started it"""
+
+
+class TieredCache:
+    """Memory LRU tier in front of an optional SQLite tier, with in-flight coalescing"""
+
+    def __init__(self, memory: TTLCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.disk_hits = 0
+        self.coalesced = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Look a key up in memory first, then on disk (promoting disk hits)"""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is None:
+            return None
+        entry = await asyncio.to_thread(self.disk.get, key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        self.disk_hits += 1
+        self.memory.set(key, value, expires_at=expires_at)
+        return value
+
+    async def set(self, key: str, value: Any):
+        """Store a value in both tiers"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value)
+            except Exception as e:
+                logger.warning(f"Failed to persist cache entry: {str(e)}")
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return a cached value, or run fetch() once for all concurrent callers of key"""
+        while True:
+            value = await self.get(key)
+            if value is not None:
+                return value
+
+            future = self._in_flight.get(key)
+            if future is None:
+                return await self._fetch(key, fetch)
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # The caller running the fetch was cancelled, not us: fetch again
+                continue
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            # Waiters were not cancelled themselves, so hand them a retryable error instead
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            if value is not None:
+                await self.set(key, value)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for both tiers"""
+        return {
+            "memory_hits": self.memory.hits,
+            "memory_misses": self.memory.misses,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "entries": len(self.memory)
+        }
+
+    def close(self):
+        """Close the disk tier"""
+        if self.disk is not None:
+            self.disk.close()
+
+
+class DiskLRUCache:
+    """Directory of binary blobs capped by total size, evicting least recently used files
+
+    Each entry is stored as one file named after its key. Recency survives restarts
+    through file modification times, which are bumped on every hit.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 50 * 1024 * 1024, suffix: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _load(self):
+        """Rebuild the LRU order from the files already on disk"""
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.endswith(self.suffix) or entry.name.startswith("."):
+                continue
+            stat = entry.stat()
+            key = entry.name[:len(entry.name) - len(self.suffix)] if self.suffix else entry.name
+            found.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the stored bytes or None, marking the entry as recently used"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                self.total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def set(self, key: str, data: bytes):
+        """Store bytes atomically, then evict old entries until under max_bytes"""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.directory)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, self._path(key))
+            except OSError as e:
+                logger.warning(f"Failed to write cache file: {str(e)}")
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                return
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters, hit rate and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes
+        }
@@ -0,0 +1,268 @@
+"""
+LLMとツールの通信の記録・再生（カセット）
+CASSETTE_MODE=record では、think()/invoke() の要求と応答、検索・Spotify・音声合成・
+DBクエリ・ユーザーへの質問の入出力を、所要時間とともに CASSETTE_FILE
+（gzip圧縮したJSONL）に記録する。ターンごとのユーザー入力も記録する。
+CASSETTE_MODE=replay では、記録した応答を元の所要時間×CASSETTE_TIME_SCALE だけ
+待ってから返すので、有料APIを呼ばずに同じ会話をオフラインで再実行できる。
+
+再生時は要求の内容（ハッシュ）で記録を探し、見つからなければ同じ種類の
+未使用の記録を記録順に使う（プロンプトを変更したブリッジの比較用）。
+"""
+
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from collections import deque
+from dataclasses import dataclass
+import asyncio
+import atexit
+import base64
+import builtins
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+FORMAT_VERSION = 1
+
+
+class CassetteMiss(LookupError):
+    """再生時に、要求に対応する記録がカセットに残っていない"""
+
+
+def request_key(kind: str, request: Any) -> str:
+    """要求の種類と内容から記録の照合キーを作る"""
+    canonical = json.dumps([kind, request], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:24]
+
+
+def encode_bytes(data: Optional[bytes]) -> Optional[str]:
+    return base64.b64encode(data).decode("ascii") if data is not None else None
+
+
+def decode_bytes(text: Optional[str]) -> Optional[bytes]:
+    return base64.b64decode(text) if text is not None else None
+
+
+def encode_completion(completion: ChatCompletion) -> Dict[str, Any]:
+    return completion.model_dump(mode="json", exclude_unset=True)
+
+
+def decode_completion(data: Dict[str, Any]) -> ChatCompletion:
+    return ChatCompletion.model_validate(data)
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+@dataclass
+class Entry:
+    """カセット内の1回分の記録"""
+    seq: int
+    kind: str
+    key: str
+    duration_ms: float
+    response: Any = None
+    error: Optional[Dict[str, str]] = None
+    used: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"seq": self.seq, "kind": self.kind, "key": self.key, "ms": round(self.duration_ms, 1)}
+        if self.error is not None:
+            data["error"] = self.error
+        else:
+            data["response"] = self.response
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Entry":
+        return cls(
+            seq=data["seq"],
+            kind=data["kind"],
+            key=data["key"],
+            duration_ms=data.get("ms", 0.0),
+            response=data.get("response"),
+            error=data.get("error")
+        )
+
+    def raise_error(self):
+        """記録した例外を再送出する（組み込みの例外型以外はRuntimeError）"""
+        error_type = getattr(builtins, self.error.get("type", ""), None)
+        if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+            error_type = RuntimeError
+        raise error_type(self.error.get("message", ""))
+
+
+class Cassette:
+    """外部との通信を記録・再生する
+
+    modeを渡さなければ、最初の呼び出し時に環境変数から設定を読む
+    （.envの読み込み後に参照するため）。
+    """
+
+    def __init__(self, mode: Optional[str] = None, path: Optional[str] = None, time_scale: float = 1.0):
+        self.mode = OFF
+        self.path: Optional[str] = None
+        self.time_scale = time_scale
+        self._configured = False
+        self._writer = None
+        self._seq = 0
+        self._by_key: Dict[str, Deque[Entry]] = {}
+        self._by_kind: Dict[str, Deque[Entry]] = {}
+        self._last_by_key: Dict[str, Entry] = {}
+        self._stats = {"recorded": 0, "replayed": 0, "repeats": 0, "fallbacks": 0, "misses": 0}
+        if mode is not None:
+            self.configure(mode, path, time_scale)
+
+    def configure(self, mode: str, path: Optional[str] = None, time_scale: float = 1.0):
+        """モードを切り替える（記録中のファイルは閉じる）"""
+        mode = (mode or OFF).lower()
+        if mode not in (OFF, RECORD, REPLAY):
+            raise ValueError(f"CASSETTE_MODEが不正です: {mode}")
+        if mode != OFF and not path:
+            raise ValueError("カセットのファイルが指定されていません")
+        self.close()
+        self.mode, self.path, self.time_scale = mode, path, time_scale
+        self._configured = True
+        self._seq = 0
+        self._by_key, self._by_kind, self._last_by_key = {}, {}, {}
+        self._stats = {key: 0 for key in self._stats}
+        if mode == REPLAY:
+            self._load(path)
+        elif mode == RECORD:
+            self._writer = gzip.open(path, "wt", encoding="utf-8")
+            self._write({"cassette": FORMAT_VERSION, "recorded_at": time.time()})
+            logger.info(f"カセットへの記録を開始: {path}")
+
+    def _ensure_configured(self):
+        if not self._configured:
+            self.configure(
+                os.getenv("CASSETTE_MODE", OFF),
+                os.getenv("CASSETTE_FILE", "cassette.jsonl.gz"),
+                float(os.getenv("CASSETTE_TIME_SCALE", "1.0"))
+            )
+
+    @property
+    def active(self) -> bool:
+        self._ensure_configured()
+        return self.mode != OFF
+
+    def _load(self, path: str):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                data = json.loads(line)
+                if "kind" not in data:
+                    continue
+                entry = Entry.from_dict(data)
+                self._by_key.setdefault(entry.key, deque()).append(entry)
+                self._by_kind.setdefault(entry.kind, deque()).append(entry)
+        count = sum(len(entries) for entries in self._by_kind.values())
+        logger.info(f"カセットを読み込みました: {path}（{count}件）")
+
+    def _write(self, data: Dict[str, Any]):
+        self._writer.write(json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+
+    def _take(self, kind: str, key: str) -> Entry:
+        """照合キーが一致する記録、無ければ同じ種類の次の記録を取り出す
+
+        一致する記録を使い切った要求には最後に返した応答を繰り返す
+        （記録時と再生時でキャッシュのヒットが異なる場合など）。
+        """
+        for entries, fallback in ((self._by_key.get(key), False), (self._by_kind.get(kind), True)):
+            while entries:
+                entry = entries.popleft()
+                if entry.used or entry.kind != kind:
+                    continue
+                entry.used = True
+                if fallback:
+                    self._stats["fallbacks"] += 1
+                    logger.warning(f"カセットに一致する{kind}の記録が無いため、記録順の応答で代替します")
+                else:
+                    self._last_by_key[key] = entry
+                return entry
+            if not fallback and key in self._last_by_key:
+                self._stats["repeats"] += 1
+                return self._last_by_key[key]
+        self._stats["misses"] += 1
+        raise CassetteMiss(f"カセットに{kind}の記録が残っていません")
+
+    async def call(
+        self,
+        kind: str,
+        request: Any,
+        fn: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], Any] = _identity,
+        decode: Callable[[Any], Any] = _identity
+    ) -> Any:
+        """fnを実行して記録する。再生時はfnを呼ばずに記録した応答を返す
+
+        requestは照合キーの計算にだけ使い、カセットには保存しない。
+        encode/decodeで応答をJSONに変換する。
+        """
+        self._ensure_configured()
+        if self.mode == OFF:
+            return await fn()
+
+        key = request_key(kind, request)
+        if self.mode == REPLAY:
+            entry = self._take(kind, key)
+            delay = entry.duration_ms * self.time_scale / 1000
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._stats["replayed"] += 1
+            if entry.error is not None:
+                entry.raise_error()
+            return decode(entry.response)
+
+        start = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as e:
+            self._record(kind, key, start, error={"type": type(e).__name__, "message": str(e)})
+            raise
+        self._record(kind, key, start, response=encode(result))
+        return result
+
+    def _record(self, kind: str, key: str, start: float, response: Any = None, error: Optional[Dict[str, str]] = None):
+        self._seq += 1
+        entry = Entry(self._seq, kind, key, (time.perf_counter() - start) * 1000, response, error)
+        try:
+            self._write(entry.to_dict())
+            self._stats["recorded"] += 1
+        except Exception as e:
+            logger.warning(f"カセットへの記録に失敗: {str(e)}")
+
+    def record_turn(self, user_input: str):
+        """ターンのユーザー入力を記録する（再生時に会話を再実行するため）"""
+        self._ensure_configured()
+        if self.mode != RECORD:
+            return
+        self._seq += 1
+        self._write({"seq": self._seq, "kind": "turn", "key": "", "ms": 0.0, "response": user_input})
+
+    def turn_inputs(self) -> List[str]:
+        """再生中のカセットに記録されたユーザー入力（記録順）"""
+        self._ensure_configured()
+        return [entry.response for entry in self._by_kind.get("turn", ())]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            logger.info(f"カセットを保存しました: {self.path}（{self._stats['recorded']}件）")
+
+
+cassette = Cassette()
+atexit.register(cassette.close)
@@ -1,6 +1,6 @@
 # src/mcp_llm_bridge/config.py
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Dict, Optional
 from mcp import StdioServerParameters
 
 @dataclass
@@ -12,6 +12,56 @@ class LLMConfig:
     temperature: float = 0.7
     max_tokens: int = 2000
 
+@dataclass
+class RateLimitConfig:
+    """Request and token quotas for one upstream API (None means unlimited)"""
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    burst_seconds: float = 1.0  # how many seconds of quota may be spent at once
+
+@dataclass
+class RoutingConfig:
+    """Per-iteration model routing between the reasoning and fast models"""
+    enabled: bool = True
+    simple_tokens: int = 60  # questions up to this size count as simple
+    large_result_tokens: int = 4000  # tool results above this size go to the reasoning model
+    latency_target_s: float = 8.0  # above this observed latency, simple questions avoid the reasoning model
+    max_reasoning_calls_per_turn: int = 2
+    ewma_alpha: float = 0.3
+
+@dataclass
+class HedgingConfig:
+    """Opt-in hedged think() requests that race a second model when the first one is slow"""
+    enabled: bool = False
+    target: Optional[LLMConfig] = None  # model/endpoint for the hedge (default: the fast model)
+    percentile: float = 0.9  # hedge once a request is slower than this latency percentile
+    min_samples: int = 10  # initial_delay_s is used until this many latencies are observed
+    initial_delay_s: float = 10.0
+    min_delay_s: float = 1.0
+    window: int = 200  # latencies kept per model
+
+@dataclass
+class DeadlineConfig:
+    """Turn-level deadline shared by every LLM call, tool operation and TTS request in a turn"""
+    turn_seconds: Optional[float] = 90.0  # None disables the deadline
+    min_stage_seconds: float = 3.0  # with less time left, stop iterating and answer with what we have
+
+@dataclass
+class RetrievalConfig:
+    """BM25 selection of relevant session messages and tool results for think() prompts"""
+    enabled: bool = True
+    top_k: int = 5  # relevant items (and earlier results of the turn) kept per think() call
+    recent_messages: int = 2  # latest messages always kept for conversational continuity
+    k1: float = 1.2
+    b: float = 0.75
+
+@dataclass
+class IntentConfig:
+    """Local fast path for simple Spotify commands that skips the planner"""
+    enabled: bool = True
+    min_confidence: float = 0.8  # below this score the planner handles the turn
+    max_chars: int = 40  # longer utterances always go to the planner
+
 @dataclass
 class BridgeConfig:
     """Configuration for the MCP-LLM Bridge"""
@@ -19,6 +69,12 @@ class BridgeConfig:
     llm_config: LLMConfig  # Function Calling用の設定
     thinking_config: Optional[LLMConfig] = None  # 思考プロセス用の設定
     system_prompt: Optional[str] = None
+    rate_limits: Dict[str, RateLimitConfig] = field(default_factory=dict)  # 上流API名（openai, serpapi, nijivoice, spotify）ごとの上限
+    routing: RoutingConfig = field(default_factory=RoutingConfig)  # think()のモデル選択
+    hedging: HedgingConfig = field(default_factory=HedgingConfig)  # think()のヘッジ要求
+    deadline: DeadlineConfig = field(default_factory=DeadlineConfig)  # ターンの期限
+    intents: IntentConfig = field(default_factory=IntentConfig)  # 定型操作の高速経路
+    retrieval: RetrievalConfig = field(default_factory=RetrievalConfig)  # 思考に渡す文脈の選択
     
     def get_thinking_config(self) -> LLMConfig:
         """思考プロセス用の設定を取得（デフォルトはllm_configを使用）"""
@@ -0,0 +1,102 @@
+"""
+ターンの期限と、各段階への残り時間の受け渡し
+process_message は deadline_scope() の中で実行され、思考・LLM・ツール・音声合成の
+各呼び出しは run_within() / remaining_budget() で残り時間だけを使う。
+期限はcontextvarsで引き継ぐので、ターンの中で作ったタスクにも同じ期限が掛かる。
+
+ユーザーの回答を待っている間は paused() で時計を止める（回答までの時間は
+システムの遅さではないので、ターンの予算から差し引かない）。
+"""
+
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import inspect
+import time
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """ターンの期限までに処理が終わらなかった"""
+
+
+class Deadline:
+    """ターンの期限（時計はtime.monotonic）"""
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - self.clock())
+
+    def expired(self, margin: float = 0.0) -> bool:
+        """残りがmargin秒以下になったか"""
+        return self.remaining() <= margin
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """ブロック内の経過時間を期限に足す（ユーザーの回答待ちなど）"""
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.at += self.clock() - started
+
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("turn_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """ブロック内（とその中で作ったタスク）にseconds秒の期限を掛ける（Noneなら期限なし）"""
+    deadline = Deadline(seconds) if seconds is not None else None
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget(default: Optional[float] = None) -> Optional[float]:
+    """defaultと期限までの残り時間の短い方（どちらも無ければNone）"""
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    return remaining if default is None else min(default, remaining)
+
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """現在の期限の時計を止める（期限が無ければ何もしない）"""
+    deadline = current_deadline()
+    if deadline is None:
+        yield
+        return
+    with deadline.paused():
+        yield
+
+
+async def run_within(awaitable: Awaitable[T], stage: str) -> T:
+    """awaitableを期限までの残り時間で実行する（間に合わなければ取り消してDeadlineExceeded）"""
+    deadline = current_deadline()
+    if deadline is None:
+        return await awaitable
+    if deadline.expired():
+        if inspect.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded(f"ターンの期限を過ぎたため{stage}を実行しませんでした")
+    try:
+        return await asyncio.wait_for(awaitable, deadline.remaining())
+    except TimeoutError:
+        # 呼び出し先のタイムアウトは期限切れとは区別する
+        if not deadline.expired():
+            raise
+        raise DeadlineExceeded(f"{stage}がターンの期限までに終わりませんでした") from None
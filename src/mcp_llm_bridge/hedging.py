@@ -0,0 +1,65 @@
+"""
+think() のヘッジ要求（遅い応答に備えて2つ目の要求を並走させる）
+モデルごとに観測したレイテンシの分位点（既定でp90）を過ぎても応答が無ければ、
+別のモデル・エンドポイントに同じプロンプトを送り、先にThinkingResponseとして
+解析できた応答を使う（もう一方は取り消す）。
+
+ヘッジで増えた要求の数とトークン数（取り消した要求はプロンプトの概算）を
+stats() で集計するので、ヘッジ率と追加の費用を見ながら分位点を調整できる。
+"""
+
+from typing import Any, Deque, Dict
+from collections import deque
+import logging
+import math
+
+from mcp_llm_bridge.config import HedgingConfig
+
+logger = logging.getLogger(__name__)
+
+
+class HedgePolicy:
+    """ヘッジを出すまでの待ち時間の決定と、ヘッジの費用の集計"""
+
+    def __init__(self, config: HedgingConfig):
+        self.config = config
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "extra_requests": 0, "extra_tokens": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def delay(self, model: str) -> float:
+        """modelへの要求がこの秒数を過ぎても返らなければヘッジを出す"""
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < self.config.min_samples:
+            return self.config.initial_delay_s
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, math.ceil(len(ordered) * self.config.percentile) - 1)
+        return max(self.config.min_delay_s, ordered[index])
+
+    def observe(self, model: str, seconds: float):
+        """応答までの時間を記録する（取り消した要求はそこまでの経過時間）"""
+        samples = self._latencies.get(model)
+        if samples is None:
+            samples = self._latencies[model] = deque(maxlen=self.config.window)
+        samples.append(seconds)
+
+    def record(self, hedged: bool, hedge_won: bool = False, extra_requests: int = 0, extra_tokens: int = 0):
+        """1回のthink()の結果を集計する"""
+        self._stats["requests"] += 1
+        if hedged:
+            self._stats["hedged"] += 1
+        if hedge_won:
+            self._stats["hedge_wins"] += 1
+        self._stats["extra_requests"] += extra_requests
+        self._stats["extra_tokens"] += extra_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self._stats["requests"]
+        return {
+            **self._stats,
+            "hedge_rate": round(self._stats["hedged"] / requests, 3) if requests else 0.0,
+            "delay_s": {model: round(self.delay(model), 3) for model in self._latencies}
+        }
@@ -0,0 +1,264 @@
+"""
+定型のSpotify操作をO1の計画なしで実行する高速経路
+「音楽止めて」「今何の曲？」「○○を再生して」のような単純な指示は、
+正規表現とキーワードのスコアで意図を判定し、ThinkingResponse（実行フェーズ）を
+ローカルで組み立てる。ツールの結果から次のフェーズや最終応答もローカルで決めるので、
+ターンはネットワーク越しの思考なしで完了する。
+
+確信度がしきい値に届かない発話、複数の指示を含む発話、曲の選択に判断が要る発話
+（「なんでもいいから有名な曲」など）は None を返し、通常どおり思考モデルが計画する。
+ネットワークにはアクセスしない。
+"""
+
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+import logging
+import re
+import unicodedata
+
+from mcp_llm_bridge.config import IntentConfig
+from mcp_llm_bridge.schemas import ExecutionResult, Operation, TaskPhase, TaskPlan, ThinkingResponse
+from mcp_llm_bridge.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+PAUSE = "spotify_pause"
+CURRENT_TRACK = "spotify_current_track"
+PLAY = "spotify_play"
+
+# main.py は会話の要約の後ろにこの見出しを付けて発話を渡す
+UTTERANCE_MARKER = "ユーザーの入力:"
+
+MUSIC_WORDS = re.compile(r"spotify|スポティファイ|スポティ|音楽|曲|ミュージック|music|song|track")
+# 手順の質問や検索の依頼は操作ではない
+QUESTION_WORDS = re.compile(r"方法|どうやって|やり方|なぜ|なんで|how to|why|調べ|検索|ググ|google")
+# 文の途中の区切りや接続詞があれば複数の指示とみなす
+COMPOUND = re.compile(r"[。！？!?\n]|それから|そのあと|その後|あとで|and then")
+
+PAUSE_STRONG = re.compile(r"一時停止|ポーズ|pause")
+PAUSE_WEAK = re.compile(r"止めて|とめて|停止|ストップ|stop")
+# 対象を言わない停止の指示（「止めて」「一時停止」など）は再生中の音楽を指すとみなす
+BARE_PAUSE = re.compile(
+    r"^(一時停止|ポーズ|pause|止めて|とめて|停止|ストップ|stop)(して|する)?(ください|くれ|よ|ね)?$"
+)
+PLAY_VERBS = re.compile(r"再生して|かけて|流して|聴かせて|聞かせて|\bplay\b")
+
+CURRENT_TRACK_PATTERNS = re.compile(
+    r"(何|なん|なに)の曲|(何|なに)が(流れ|かかっ|再生され)|(再生中|今|いま)の曲(は|って|何|なに|なん|$)"
+    r"|この曲(は|って)?(何|なに|なん|誰|だれ)|(今|いま|この)(流れてる|かかってる)?曲の?(名前|名)"
+    r"|what('s| is) (playing|this song)|current (song|track)|now playing"
+)
+# 現在の曲に触れていても、操作の依頼なら別の意図
+ACTION_WORDS = re.compile(r"止め|とめ|停止|再生して|かけて|流して|次|スキップ|\b(play|pause|stop|skip)\b")
+
+PLAY_JA = re.compile(
+    r"^(?:(?:spotify|スポティファイ)で)?(?P<query>.+?)(?:の曲)?を?(?:(?:spotify|スポティファイ)で)?"
+    r"(?:再生して|かけて|流して|聴かせて|聞かせて|再生)(?:ください|くれ|ほしい|よ|ね)?$"
+)
+PLAY_EN = re.compile(r"^play (?P<query>.+?)(?: on spotify)?$")
+# 曲の選び方に判断が要る依頼は思考モデルに任せる
+VAGUE_QUERY = re.compile(
+    r"なんでも|何でも|何か|なにか|適当|おすすめ|オススメ|有名|人気|好きな|いい感じ|次|前|続き"
+    r"|something|anything|random|next|previous|^(音楽|曲|spotify|スポティファイ|music|song|it)$"
+)
+# 音楽以外も「かけて」「流して」「再生して」「止めて」の対象になる（電話、トイレ、エアコン、動画など）
+NON_MUSIC = re.compile(
+    r"電話|でんわ|トイレ|お湯|風呂|エアコン|暖房|冷房|クーラー|掃除機|洗濯|アイロン|アラーム|タイマー|目覚まし"
+    r"|電気|ライト|ニュース|動画|ビデオ|映画|番組|テレビ|ラジオ|ポッドキャスト|録画|録音"
+    r"|youtube|ユーチューブ|video|movie|news|podcast|radio|game|ゲーム"
+)
+# 曲名の指定らしさ: 括弧で囲んだタイトル（「XのY」は「今日の予定」なども含むので手がかりにしない）
+QUOTED_TITLE = re.compile(r"「.+?」|『.+?』|\".+?\"")
+MAX_QUERY_CHARS = 30
+
+
+def extract_utterance(text: str) -> str:
+    """会話の要約を含む入力から、今回の発話だけを取り出す"""
+    _, marker, utterance = text.rpartition(UTTERANCE_MARKER)
+    return utterance if marker else text
+
+
+def normalize(text: str) -> str:
+    """全角・半角と大文字・小文字をそろえ、前後の空白と文末の記号を取り除く"""
+    text = unicodedata.normalize("NFKC", text).lower().strip()
+    text = re.sub(r"^(ねえ|ねぇ|ちょっと|hey|ok)[、, ]*", "", text)
+    return re.sub(r"[。．.！!？?♪〜~ー\s]+$", "", text).strip()
+
+
+@dataclass
+class IntentMatch:
+    """判定した意図"""
+    intent: str
+    confidence: float
+    slots: Dict[str, str] = field(default_factory=dict)
+
+
+class FastPath:
+    """1ターン分の定型の実行計画（ツールの結果から次のフェーズか最終応答を決める）"""
+
+    def __init__(self, match: IntentMatch):
+        self.match = match
+        self._track: Optional[Dict[str, Any]] = None
+
+    @property
+    def intent(self) -> str:
+        return self.match.intent
+
+    def start(self) -> ThinkingResponse:
+        """最初のフェーズ（思考モデルの初回の応答の代わり）"""
+        if self.intent == PAUSE:
+            phase = self._phase(1, "再生を一時停止する", {"action": "pause"})
+        elif self.intent == CURRENT_TRACK:
+            phase = self._phase(1, "再生中の曲を確認する", {"action": "current_track"})
+        else:
+            phase = self._phase(1, "曲を検索する", {"action": "search", "query": self.match.slots["query"], "limit": 1})
+        total_phases = 2 if self.intent == PLAY else 1
+        plan = TaskPlan(
+            overall_tasks=[phase.description] + (["検索した曲を再生する"] if self.intent == PLAY else []),
+            total_phases=total_phases,
+            phases=[phase]
+        )
+        return ThinkingResponse(task_plan=plan, current_phase=phase, needs_tool=True, task_completed=False)
+
+    def next(self, results: List[ExecutionResult]) -> Optional[ThinkingResponse]:
+        """ツールの結果から次の応答を決める。定型で扱えない結果なら None（思考モデルに任せる）"""
+        result = results[-1].result if results and results[-1].success else None
+        if self.intent == PLAY and self._track is not None and not results:
+            # 同じ曲を再生中のため、ブリッジが再生をスキップした
+            return self._done(f"{self._describe(self._track)}を再生中です！")
+        if not isinstance(result, dict):
+            return None
+
+        if self.intent == PAUSE:
+            if result.get("status") == "paused":
+                return self._done("音楽を一時停止しました。")
+            return None
+
+        if self.intent == CURRENT_TRACK:
+            status = result.get("status")
+            if status == "no_track_playing":
+                return self._done("今は何も再生していません。")
+            if status in ("playing", "paused") and result.get("track"):
+                track = self._describe(result["track"])
+                return self._done(f"今流れているのは{track}です！" if status == "playing" else f"{track}が一時停止中です。")
+            return None
+
+        if self._track is None:
+            tracks = result.get("tracks")
+            if tracks is None:
+                return None
+            if not tracks:
+                return self._done(f"「{self.match.slots['query']}」に一致する曲が見つかりませんでした。")
+            self._track = tracks[0]
+            phase = self._phase(2, "検索した曲を再生する", {"action": "play", "track_id": self._track["id"]})
+            return ThinkingResponse(current_phase=phase, needs_tool=True, task_completed=False)
+
+        if result.get("status") == "playing":
+            return self._done(f"{self._describe(self._track)}を再生しました！")
+        if result.get("status") == "device_not_found":
+            return self._done(result["error"])
+        return None
+
+    @staticmethod
+    def _phase(number: int, description: str, parameters: Dict[str, Any]) -> TaskPhase:
+        return TaskPhase(
+            phase_number=number,
+            operations=[Operation(type="spotify", parameters=parameters)],
+            description=description
+        )
+
+    @staticmethod
+    def _done(final_response: str) -> ThinkingResponse:
+        return ThinkingResponse(needs_tool=False, task_completed=True, final_response=final_response)
+
+    @staticmethod
+    def _describe(track: Dict[str, Any]) -> str:
+        artist = track.get("artist")
+        return f"{artist}の「{track.get('name')}」" if artist else f"「{track.get('name')}」"
+
+
+class IntentRouter:
+    """発話の意図をルールとキーワードで判定し、確信度の高い定型操作だけを高速経路に回す"""
+
+    def __init__(self, config: Optional[IntentConfig] = None):
+        self.config = config or IntentConfig()
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        """最も確信度の高い意図（しきい値未満・判定できない場合は None）"""
+        utterance = normalize(extract_utterance(text))
+        if not utterance or len(utterance) > self.config.max_chars:
+            return None
+        if COMPOUND.search(utterance) or QUESTION_WORDS.search(utterance):
+            return None
+
+        candidates = [
+            candidate for candidate in (
+                self._match_pause(utterance),
+                self._match_current_track(utterance),
+                self._match_play(utterance)
+            ) if candidate is not None
+        ]
+        if not candidates:
+            return None
+        best = max(candidates, key=lambda candidate: candidate.confidence)
+        return best if best.confidence >= self.config.min_confidence else None
+
+    def route(self, text: str) -> Optional[FastPath]:
+        """高速経路で扱える発話なら、そのターンの実行計画を返す"""
+        if not self.config.enabled:
+            return None
+        match = self.match(text)
+        span = tracer.current_span()
+        if match is None:
+            if span is not None:
+                span.set_attribute("intent.fast_path", False)
+            return None
+        if span is not None:
+            span.set_attributes({
+                "intent.fast_path": True,
+                "intent.name": match.intent,
+                "intent.confidence": round(match.confidence, 2)
+            })
+        logger.info(f"高速経路で処理します: {match.intent}（確信度 {match.confidence:.2f}） {match.slots}")
+        return FastPath(match)
+
+    @staticmethod
+    def _match_pause(utterance: str) -> Optional[IntentMatch]:
+        if PLAY_VERBS.search(utterance) or NON_MUSIC.search(utterance):
+            return None
+        # 「動画を一時停止して」のように音楽以外を止める依頼もあるので、停止の語だけでは足りない
+        if PAUSE_STRONG.search(utterance):
+            score = 0.6
+        elif PAUSE_WEAK.search(utterance):
+            score = 0.5
+        else:
+            return None
+        if BARE_PAUSE.match(utterance):
+            score = 0.85
+        elif MUSIC_WORDS.search(utterance):
+            score += 0.3
+        return IntentMatch(PAUSE, min(score, 1.0))
+
+    @staticmethod
+    def _match_current_track(utterance: str) -> Optional[IntentMatch]:
+        if not CURRENT_TRACK_PATTERNS.search(utterance) or ACTION_WORDS.search(utterance):
+            return None
+        return IntentMatch(CURRENT_TRACK, 0.9)
+
+    @staticmethod
+    def _match_play(utterance: str) -> Optional[IntentMatch]:
+        matched = PLAY_JA.match(utterance) or PLAY_EN.match(utterance)
+        if not matched:
+            return None
+        query = matched.group("query").strip(" 、,「」『』\"'")
+        if not query or len(query) > MAX_QUERY_CHARS or VAGUE_QUERY.search(query):
+            return None
+        if NON_MUSIC.search(query):
+            return None
+        # 「Xをかけて」だけでは音楽の話か分からないので、音楽の手がかりが無ければ思考モデルに任せる
+        score = 0.6
+        if QUOTED_TITLE.search(utterance):
+            score = 0.85
+        if MUSIC_WORDS.search(utterance):
+            score = 0.95
+        return IntentMatch(PLAY, score, {"query": query})
@@ -1,29 +1,16 @@
 # src/mcp_llm_bridge/llm_client.py
 from typing import Dict, List, Any, Optional
+import json
 import openai
 from mcp_llm_bridge.config import LLMConfig
+from mcp_llm_bridge.tracing import tracer, record_usage
+from mcp_llm_bridge.logging_config import Payload
+from mcp_llm_bridge.cassette import cassette, encode_completion, decode_completion
+from mcp_llm_bridge.ratelimit import estimate_tokens, limited_completion
+from mcp_llm_bridge.deadline import run_within
 import logging
-import colorlog
 
-handler = colorlog.StreamHandler()
-handler.setFormatter(colorlog.ColoredFormatter(
-    "%(log_color)s%(levelname)s%(reset)s:     %(cyan)s%(name)s%(reset)s - %(message)s",
-    datefmt=None,
-    reset=True,
-    log_colors={
-        'DEBUG': 'cyan',
-        'INFO': 'green',
-        'WARNING': 'yellow',
-        'ERROR': 'red',
-        'CRITICAL': 'red,bg_white',
-    },
-    secondary_log_colors={},
-    style='%'
-))
-
-logger = colorlog.getLogger(__name__)
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
 class LLMResponse:
     """Standardized response format focusing on tool handling"""
@@ -38,10 +25,10 @@ class LLMResponse:
         self.content = self.message.content if self.message.content is not None else ""
         self.tool_calls = self.message.tool_calls if hasattr(self.message, "tool_calls") else None
         
-        # Debug logging
-        logger.debug(f"Raw completion: {completion}")
-        logger.debug(f"Message content: {self.content}")
-        logger.debug(f"Tool calls: {self.tool_calls}")
+        # Debug logging（出力されるときだけ整形する）
+        logger.debug("Raw completion: %s", Payload(lambda: str(completion)))
+        logger.debug("Message content: %s", Payload(self.content))
+        logger.debug("Tool calls: %s", Payload(self.tool_calls))
         
     def get_message(self) -> Dict[str, Any]:
         """Get standardized message format"""
@@ -56,11 +43,11 @@ class LLMResponse:
 class LLMClient:
     """Client for interacting with OpenAI-compatible LLMs"""
     
-    MAX_QUERIES_PER_CONVERSATION = 3  # GPT-4oの制限
+    MAX_QUERIES_PER_TURN = 3  # 1ターンあたりのGPT-4o呼び出しの上限（start_turn()でリセット）
     
     def __init__(self, config: LLMConfig):
         self.config = config
-        self.client = openai.OpenAI(
+        self.client = openai.AsyncOpenAI(
             api_key=config.api_key,
             base_url=config.base_url
         )
@@ -70,6 +57,10 @@ class LLMClient:
         self.last_tool_calls = None
         self.query_count = 0
         
+    def start_turn(self):
+        """ターンの開始時にクエリの予算をリセットする"""
+        self.query_count = 0
+
     def _prepare_messages(self) -> List[Dict[str, Any]]:
         """Prepare messages for API call"""
         formatted_messages = []
@@ -85,13 +76,13 @@ class LLMClient:
     
     async def invoke_with_prompt(self, prompt: str) -> LLMResponse:
         """Send a single prompt to the LLM"""
-        if self.query_count >= self.MAX_QUERIES_PER_CONVERSATION:
-            logger.warning(f"クエリ制限（{self.MAX_QUERIES_PER_CONVERSATION}回）に達しました")
+        if self.query_count >= self.MAX_QUERIES_PER_TURN:
+            logger.warning(f"クエリ制限（{self.MAX_QUERIES_PER_TURN}回）に達しました")
             return LLMResponse(type('obj', (object,), {
                 "choices": [type('obj', (object,), {
                     "finish_reason": "stop",
                     "message": type('obj', (object,), {
-                        "content": f"クエリ制限（{self.MAX_QUERIES_PER_CONVERSATION}回）に達したため、これ以上の質問を処理できません。",
+                        "content": f"クエリ制限（{self.MAX_QUERIES_PER_TURN}回）に達したため、このターンではこれ以上の質問を処理できません。",
                         "tool_calls": None
                     })
                 })]
@@ -129,38 +120,48 @@ class LLMClient:
             # ツール結果を処理したので、last_tool_callsをクリア
             self.last_tool_calls = None
         
-        if self.query_count >= self.MAX_QUERIES_PER_CONVERSATION:
-            logger.warning(f"クエリ制限（{self.MAX_QUERIES_PER_CONVERSATION}回）に達しました")
+        if self.query_count >= self.MAX_QUERIES_PER_TURN:
+            logger.warning(f"クエリ制限（{self.MAX_QUERIES_PER_TURN}回）に達しました")
             return LLMResponse(type('obj', (object,), {
                 "choices": [type('obj', (object,), {
                     "finish_reason": "stop",
                     "message": type('obj', (object,), {
-                        "content": f"クエリ制限（{self.MAX_QUERIES_PER_CONVERSATION}回）に達したため、これ以上の質問を処理できません。",
+                        "content": f"クエリ制限（{self.MAX_QUERIES_PER_TURN}回）に達したため、このターンではこれ以上の質問を処理できません。",
                         "tool_calls": None
                     })
                 })]
             }))
         
         self.query_count += 1
-        logger.info(f"クエリ実行回数: {self.query_count}/{self.MAX_QUERIES_PER_CONVERSATION}")
+        logger.info(f"クエリ実行回数: {self.query_count}/{self.MAX_QUERIES_PER_TURN}")
         
         try:
             try:
-                logger.debug(f"送信するメッセージ: {self._prepare_messages()}")
-                logger.debug(f"利用可能なツール: {self.tools}")
-                completion = self.client.chat.completions.create(
-                    model=self.config.model,
-                    messages=self._prepare_messages(),
-                    tools=self.tools if self.tools else None,
-                    temperature=self.config.temperature,
-                    max_tokens=self.config.max_tokens
-                )
-                logger.debug(f"APIレスポンス: {completion}")
+                messages = self._prepare_messages()
+                logger.debug("送信するメッセージ: %s", Payload(messages))
+                logger.debug("利用可能なツール: %s", Payload(self.tools))
+                with tracer.span("llm.invoke", **{"llm.model": self.config.model}) as span:
+                    completion = await run_within(cassette.call(
+                        "invoke",
+                        {"model": self.config.model, "messages": messages, "tools": self.tools},
+                        lambda: limited_completion(
+                            lambda: self.client.chat.completions.create(
+                                model=self.config.model,
+                                messages=messages,
+                                tools=self.tools if self.tools else None,
+                                temperature=self.config.temperature,
+                                max_tokens=self.config.max_tokens
+                            ),
+                            estimate_tokens(json.dumps(messages, ensure_ascii=False, default=str))
+                        ),
+                        encode=encode_completion,
+                        decode=decode_completion
+                    ), "llm.invoke")
+                    record_usage(span, completion)
+                logger.debug("APIレスポンス: %s", Payload(lambda: str(completion)))
             except Exception as e:
                 logger.error(f"API呼び出しエラー: {str(e)}")
                 raise
-            logger.debug(f"使用可能なツール: {self.tools}")
-            logger.debug(f"送信されたメッセージ: {self._prepare_messages()}")
         except Exception as e:
             logger.error(f"API呼び出しエラー: {str(e)}")
             raise
@@ -0,0 +1,174 @@
+"""
+ロギングの一元設定
+ルートロガーにはQueueHandlerだけを付け、整形済みのレコードを別スレッドの
+QueueListenerが端末（colorlog）やファイルに書き出す。イベントループ上では
+ファイルや端末への書き込みを行わない。
+
+レベルは LOG_LEVEL（全体）と LOG_LEVELS（"モジュール名=レベル" のカンマ区切り）で指定する。
+大きなペイロードは Payload で包んで %s で渡すと、出力されるレコードでだけ
+整形され、LOG_PAYLOAD_MAX_CHARS で切り詰め、LOG_PAYLOAD_SAMPLE_RATE で間引かれる。
+"""
+
+from typing import Any, Dict, List, Optional
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+import colorlog
+
+LOG_FORMAT = "%(log_color)s%(levelname)s%(reset)s:     %(cyan)s%(name)s%(reset)s - %(message)s"
+FILE_FORMAT = "%(asctime)s %(levelname)s %(name)s - %(message)s"
+LOG_COLORS = {
+    'DEBUG': 'cyan',
+    'INFO': 'green',
+    'WARNING': 'yellow',
+    'ERROR': 'red',
+    'CRITICAL': 'red,bg_white',
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_lock = threading.Lock()
+
+
+class Payload:
+    """ログに出すときにだけ整形される大きな値
+
+    valueに引数なしの呼び出し可能オブジェクトを渡すと、その呼び出しも
+    出力時まで遅延される。抑制されたレコードでは何も計算しない。
+    """
+
+    max_chars = 2000
+
+    def __init__(self, value: Any, max_chars: Optional[int] = None):
+        self.value = value
+        self.max_chars = max_chars if max_chars is not None else Payload.max_chars
+        self._text: Optional[str] = None
+
+    def __str__(self) -> str:
+        # 複数のハンドラーに渡っても整形は1回だけ
+        if self._text is None:
+            self._text = self._format()
+        return self._text
+
+    def _format(self) -> str:
+        value = self.value() if callable(self.value) else self.value
+        if isinstance(value, str):
+            text = value
+        else:
+            try:
+                text = json.dumps(value, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                text = repr(value)
+        if self.max_chars and len(text) > self.max_chars:
+            text = f"{text[:self.max_chars]}...（{len(text) - self.max_chars}文字省略）"
+        return text
+
+    __repr__ = __str__
+
+
+class PayloadSampler(logging.Filter):
+    """Payloadを含むレコードを一定の割合だけ通すフィルタ
+
+    1/rate 件に1件を通す決定的な間引きなので、ログの量は割合どおりになる。
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self._credit = 0.0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0:
+            return True
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if not any(isinstance(arg, Payload) for arg in args):
+            return True
+        with self._lock:
+            self._credit += self.rate
+            if self._credit >= 1.0:
+                self._credit -= 1.0
+                return True
+        return False
+
+
+def parse_module_levels(spec: str) -> Dict[str, int]:
+    """"mcp_llm_bridge.llm_client=DEBUG,aiohttp=WARNING" をレベルの辞書にする"""
+    levels: Dict[str, int] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = (part.strip() for part in item.split("=", 1))
+        if name and level:
+            levels[name] = logging.getLevelName(level.upper()) if not level.isdigit() else int(level)
+    return {name: level for name, level in levels.items() if isinstance(level, int)}
+
+
+def _build_handlers(log_file: Optional[str]) -> List[logging.Handler]:
+    console = colorlog.StreamHandler()
+    console.setFormatter(colorlog.ColoredFormatter(LOG_FORMAT, reset=True, log_colors=LOG_COLORS))
+    handlers: List[logging.Handler] = [console]
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+        handlers.append(file_handler)
+    return handlers
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    module_levels: Optional[Dict[str, int]] = None,
+    handlers: Optional[List[logging.Handler]] = None
+) -> logging.handlers.QueueListener:
+    """ルートロガーをQueueHandler経由の出力に設定する（2回目以降は設定を更新するだけ）"""
+    global _listener, _queue_handler
+    with _lock:
+        root = logging.getLogger()
+        root.setLevel(level or os.getenv("LOG_LEVEL", "INFO").upper())
+        levels = parse_module_levels(os.getenv("LOG_LEVELS", ""))
+        levels.update(module_levels or {})
+        for name, module_level in levels.items():
+            logging.getLogger(name).setLevel(module_level)
+        Payload.max_chars = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", str(Payload.max_chars)))
+
+        if _listener is not None and handlers is None:
+            return _listener
+        if _listener is not None:
+            _stop_listener()
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(PayloadSampler(float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))))
+        if _queue_handler is not None:
+            root.removeHandler(_queue_handler)
+        root.addHandler(queue_handler)
+        _queue_handler = queue_handler
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, *(handlers or _build_handlers(os.getenv("LOG_FILE"))), respect_handler_level=True
+        )
+        _listener.start()
+        return _listener
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def shutdown_logging():
+    """キューに残ったレコードを書き出してリスナーを止める"""
+    with _lock:
+        _stop_listener()
+
+
+atexit.register(shutdown_logging)
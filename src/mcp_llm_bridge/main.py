@@ -3,34 +3,17 @@ import os
 import asyncio
 from dotenv import load_dotenv
 from mcp import StdioServerParameters
-from mcp_llm_bridge.config import BridgeConfig, LLMConfig
+from mcp_llm_bridge.config import BridgeConfig, LLMConfig, RateLimitConfig
 from mcp_llm_bridge.bridge import BridgeManager
-import colorlog
+from mcp_llm_bridge.logging_config import setup_logging
 import logging
 
-handler = colorlog.StreamHandler()
-handler.setFormatter(colorlog.ColoredFormatter(
-    "%(log_color)s%(levelname)s%(reset)s:     %(cyan)s%(name)s%(reset)s - %(message)s",
-    datefmt=None,
-    reset=True,
-    log_colors={
-        'DEBUG': 'cyan',
-        'INFO': 'green',
-        'WARNING': 'yellow',
-        'ERROR': 'red',
-        'CRITICAL': 'red,bg_white',
-    },
-    secondary_log_colors={},
-    style='%'
-))
-
-logger = colorlog.getLogger(__name__)
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
 async def main():
     # 環境変数の読み込み
     load_dotenv()
+    setup_logging()
 
     # プロジェクトルートディレクトリの取得
     project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
@@ -56,7 +39,14 @@ async def main():
             model="o1-mini",  # O1モデル
             base_url=None,
             max_tokens=32768  # O1モデルの推奨設定
-        )
+        ),
+        # 上流APIごとのレート制限（契約しているプランの上限に合わせる）
+        rate_limits={
+            "openai": RateLimitConfig(requests_per_minute=500, tokens_per_minute=200000, burst_seconds=5),
+            "serpapi": RateLimitConfig(requests_per_minute=60),
+            "nijivoice": RateLimitConfig(requests_per_minute=60),
+            "spotify": RateLimitConfig(requests_per_minute=120)
+        }
     )
     
     logger.info(f"Starting bridge with thinking model: {config.thinking_config.model}")
@@ -74,11 +64,14 @@ async def main():
             print("== 要約 ==")
             print(current_summary)
 
-            user_input = input("\nEnter your prompt (or 'quit' to exit): ")
+            # 入力待ちの間も音声の再生などが進むよう、入力は別スレッドで待つ
+            user_input = await asyncio.to_thread(input, "\nEnter your prompt (or 'quit' to exit): ")
             if user_input.lower() in ['quit', 'exit', 'q']:
                 break
 
-            combined_input = f"{current_summary}\n\nユーザーの入力: {user_input}"
+            # 思考モデルには、直近の会話と今回の入力に関連する過去の情報を選んだ要約を渡す
+            prompt_summary = bridge.summarize_context(user_input)
+            combined_input = f"{prompt_summary}\n\nユーザーの入力: {user_input}"
 
             logger.info(f"=== Iteration {iteration_count} start ===")
 
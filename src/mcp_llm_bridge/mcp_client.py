@@ -3,27 +3,10 @@ import logging
 from typing import Any, List
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
-import colorlog
+from mcp_llm_bridge.tracing import tracer
+from mcp_llm_bridge.logging_config import Payload
 
-handler = colorlog.StreamHandler()
-handler.setFormatter(colorlog.ColoredFormatter(
-    "%(log_color)s%(levelname)s%(reset)s:     %(cyan)s%(name)s%(reset)s - %(message)s",
-    datefmt=None,
-    reset=True,
-    log_colors={
-        'DEBUG': 'cyan',
-        'INFO': 'green',
-        'WARNING': 'yellow',
-        'ERROR': 'red',
-        'CRITICAL': 'red,bg_white',
-    },
-    secondary_log_colors={},
-    style='%'
-))
-
-logger = colorlog.getLogger(__name__)
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
 class MCPClient:
     """Client for interacting with MCP servers"""
@@ -61,8 +44,9 @@ class MCPClient:
             raise RuntimeError("Not connected to MCP server")
             
         logger.debug("Requesting available tools from MCP server")
-        tools = await self.session.list_tools()
-        logger.debug(f"Received tools from MCP server: {tools}")
+        with tracer.span("mcp.list_tools"):
+            tools = await self.session.list_tools()
+        logger.debug("Received tools from MCP server: %s", Payload(lambda: str(tools)))
         return tools
 
     async def call_tool(self, tool_name: str, arguments: dict) -> Any:
@@ -70,7 +54,8 @@ class MCPClient:
         if not self.session:
             raise RuntimeError("Not connected to MCP server")
             
-        logger.debug(f"Calling MCP tool '{tool_name}' with arguments: {arguments}")
-        result = await self.session.call_tool(tool_name, arguments=arguments)
-        logger.debug(f"Tool result: {result}")
+        logger.debug("Calling MCP tool '%s' with arguments: %s", tool_name, Payload(arguments))
+        with tracer.span("mcp.call_tool", **{"mcp.tool": tool_name}):
+            result = await self.session.call_tool(tool_name, arguments=arguments)
+        logger.debug("Tool result: %s", Payload(lambda: str(result)))
         return result
\ No newline at end of file
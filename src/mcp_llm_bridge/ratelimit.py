@@ -0,0 +1,282 @@
+"""
+上流APIごとのレート制限と優先度付きの待ち行列
+OpenAI・SerpAPI・にじボイス・Spotifyへの呼び出しは、上流ごとに共有する
+トークンバケット（リクエスト数とトークン数）を通す。上限に達したときは
+優先度の高い呼び出し（ユーザーが応答を待っているターン）から順に通し、
+先読みやバックグラウンドの処理は後回しにする。
+
+優先度はcontextvarsで引き継ぐので、priority_scope() の中で作ったタスクの
+呼び出しはすべてその優先度になる。待ち時間はスパン（ratelimit.<上流名>）と
+limiters.stats() で確認できる。
+"""
+
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+
+import openai
+
+from mcp_llm_bridge.config import RateLimitConfig
+from mcp_llm_bridge.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+OPENAI = "openai"
+SERPAPI = "serpapi"
+NIJIVOICE = "nijivoice"
+SPOTIFY = "spotify"
+
+# 429の応答にRetry-Afterが無い場合に上流への呼び出しを止める秒数
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class Priority(IntEnum):
+    """小さいほど先に通す"""
+    INTERACTIVE = 0  # ユーザーが応答を待っているターン
+    PREFETCH = 1     # ターン中の先読み（デバイスのウォームアップなど）
+    BACKGROUND = 2   # 定期更新・定型文の事前合成など
+
+
+_priority: ContextVar[Priority] = ContextVar("ratelimit_priority", default=Priority.INTERACTIVE)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+@contextmanager
+def priority_scope(priority: Priority):
+    """ブロック内（とその中で作ったタスク）の呼び出しの優先度を設定する"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    """プロンプトのトークン数の概算（英数字は4文字、それ以外は1文字で1トークン）"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    try:
+        return max(0.0, float(value)) if value is not None else DEFAULT_RETRY_AFTER
+    except ValueError:
+        return DEFAULT_RETRY_AFTER
+
+
+class TokenBucket:
+    """1秒あたりrateずつ補充され、capacityまで貯まるバケツ
+
+    使用量は後から精算するため、残量は負になることがある。
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.level = capacity
+        self._updated = clock()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """amountを取り出せるようになるまでの秒数（容量を超える量は満杯まで待つ）"""
+        self._refill(now)
+        shortfall = min(amount, self.capacity) - self.level
+        return shortfall / self.rate if shortfall > 0 else 0.0
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.level = min(self.capacity, self.level - amount)
+
+
+class Grant:
+    """取得した呼び出し枠（トークン数の精算と429の報告に使う）"""
+
+    def __init__(self, limiter: "RateLimiter", tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+
+    def settle(self, actual_tokens: Optional[int]):
+        """見積もったトークン数を実際の使用量で精算する"""
+        if actual_tokens is None:
+            return
+        self.limiter.adjust_tokens(actual_tokens - self.tokens)
+        self.tokens = actual_tokens
+
+    def throttled(self, retry_after: Optional[float] = None):
+        self.limiter.throttled(retry_after)
+
+
+class RateLimiter:
+    """1つの上流APIへの呼び出しを、リクエスト数・トークン数の上限内で優先度順に通す"""
+
+    def __init__(self, name: str, config: Optional[RateLimitConfig] = None, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.config = config or RateLimitConfig()
+        self.clock = clock
+        self.requests = self._bucket(self.config.requests_per_minute)
+        self.tokens = self._bucket(self.config.tokens_per_minute)
+        self._blocked_until = 0.0
+        self._waiters: List[List[Any]] = []  # [priority, seq, tokens, future]
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._recent_waits: Deque[float] = deque(maxlen=1000)
+        self._stats = {"acquired": 0, "queued": 0, "throttled": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def _bucket(self, per_minute: Optional[float]) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        rate = per_minute / 60
+        return TokenBucket(rate, max(1.0, rate * self.config.burst_seconds), self.clock)
+
+    @property
+    def unlimited(self) -> bool:
+        return self.requests is None and self.tokens is None
+
+    def _delay(self, tokens: int, now: float) -> float:
+        delay = max(0.0, self._blocked_until - now)
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1, now))
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return delay
+
+    def _consume(self, tokens: int, now: float):
+        if self.requests is not None:
+            self.requests.consume(1, now)
+        if self.tokens is not None and tokens:
+            self.tokens.consume(tokens, now)
+
+    async def acquire(self, tokens: int = 0, priority: Optional[Priority] = None) -> Grant:
+        """呼び出し枠を取得する。上限に達していれば優先度順に待つ"""
+        self._stats["acquired"] += 1
+        if self.unlimited and self._blocked_until <= self.clock():
+            return Grant(self, tokens)
+        now = self.clock()
+        if not self._waiters and self._delay(tokens, now) <= 0:
+            self._consume(tokens, now)
+            self._record_wait(0.0)
+            return Grant(self, tokens)
+
+        priority = current_priority() if priority is None else priority
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), tokens, future])
+        self._stats["queued"] += 1
+        start = self.clock()
+        with tracer.span(f"ratelimit.{self.name}", **{"ratelimit.priority": priority.name}) as span:
+            self._dispatch()
+            try:
+                await future
+            finally:
+                if not future.done():
+                    future.cancel()
+                # 待ちを取り消した場合も、後ろの呼び出しを進める
+                self._dispatch()
+            wait = self.clock() - start
+            span.set_attribute("ratelimit.wait_ms", round(wait * 1000, 1))
+        self._record_wait(wait)
+        return Grant(self, tokens)
+
+    def _dispatch(self):
+        """先頭の待ちから順に、上限内に収まるものを通す"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters:
+            priority, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            now = self.clock()
+            delay = self._delay(tokens, now)
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._consume(tokens, now)
+            future.set_result(None)
+
+    def _record_wait(self, wait: float):
+        wait_ms = wait * 1000
+        self._recent_waits.append(wait_ms)
+        self._stats["wait_ms_total"] += wait_ms
+        self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+
+    def adjust_tokens(self, delta: int):
+        if self.tokens is not None and delta:
+            self.tokens.consume(delta, self.clock())
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """上流から429が返ったので、しばらく呼び出しを止める"""
+        retry_after = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+        self._stats["throttled"] += 1
+        self._blocked_until = max(self._blocked_until, self.clock() + retry_after)
+        logger.warning(f"{self.name}のレート制限に達しました。{retry_after:.1f}秒間呼び出しを止めます")
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._recent_waits)
+        p95 = waits[min(len(waits) - 1, math.ceil(len(waits) * 0.95) - 1)] if waits else 0.0
+        return {
+            **{k: round(v, 1) if isinstance(v, float) else v for k, v in self._stats.items()},
+            "wait_ms_p95": round(p95, 1),
+            "waiting": sum(1 for waiter in self._waiters if not waiter[3].done())
+        }
+
+
+class RateLimiterRegistry:
+    """上流API名ごとのRateLimiter（プロセス内で共有する）"""
+
+    def __init__(self):
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def configure(self, limits: Dict[str, RateLimitConfig]):
+        """上限を設定する（同じ設定の上流は状態を引き継ぐ）"""
+        for name, config in limits.items():
+            current = self._limiters.get(name)
+            if current is None or current.config != config:
+                self._limiters[name] = RateLimiter(name, config)
+
+    def get(self, name: str) -> RateLimiter:
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            limiter = self._limiters[name] = RateLimiter(name)
+        return limiter
+
+    async def acquire(self, name: str, tokens: int = 0) -> Grant:
+        return await self.get(name).acquire(tokens)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+    def reset(self):
+        self._limiters.clear()
+
+
+limiters = RateLimiterRegistry()
+
+
+async def limited_completion(create: Callable[[], Awaitable[Any]], prompt_tokens: int) -> Any:
+    """OpenAIの呼び出しをレート制限に通し、実際のトークン数で精算する"""
+    grant = await limiters.acquire(OPENAI, prompt_tokens)
+    try:
+        completion = await create()
+    except openai.RateLimitError as e:
+        grant.throttled(parse_retry_after(e.response.headers.get("retry-after")))
+        raise
+    usage = getattr(completion, "usage", None)
+    grant.settle(getattr(usage, "total_tokens", None))
+    return completion
@@ -0,0 +1,171 @@
+"""
+セッション内の会話とツール結果のBM25索引
+会話のメッセージとツール結果をプロセス内の転置インデックスに登録し、think() のたびに
+今回の要求に関連する上位k件だけをプロンプトに入れる。直近の数件だけを残す方式では
+落ちてしまう以前の調査結果も、関連があれば拾える。
+
+日本語は分かち書きせず、漢字・ひらがな・カタカナの連続を文字バイグラムに分けて索引する
+（英数字は単語単位）。外部のサービスや辞書は使わない。
+"""
+
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+from collections import Counter
+from dataclasses import dataclass
+import json
+import math
+import re
+import unicodedata
+
+from mcp_llm_bridge.config import RetrievalConfig
+
+# 英数字の単語、または日本語の文字（ひらがな・カタカナ・漢字）の連続
+_TOKEN = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+")
+# 索引する1件あたりの最大文字数（大きな結果の後半はスコアにほとんど効かない）
+MAX_INDEX_CHARS = 4000
+
+
+def tokenize(text: str) -> List[str]:
+    """英数字は単語、日本語は文字バイグラム（1文字だけの連続はその文字）に分ける"""
+    tokens: List[str] = []
+    for run in _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold()):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def result_text(result: Any) -> str:
+    """ツール結果を索引用のテキストにする（JSONのキー名は含めず値だけを並べる）"""
+    values: List[str] = []
+
+    def walk(value: Any):
+        if isinstance(value, dict):
+            for item in value.values():
+                walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+        elif value is not None:
+            values.append(str(value))
+
+    walk(result)
+    return " ".join(values)[:MAX_INDEX_CHARS]
+
+
+class BM25Index:
+    """追加のみのBM25転置インデックス"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._lengths: Dict[Hashable, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: Hashable, text: str):
+        counts = Counter(tokenize(text))
+        self._lengths[doc_id] = sum(counts.values())
+        self._total_length += self._lengths[doc_id]
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+    def search(self, query: str, k: int, exclude: Iterable[Hashable] = ()) -> List[Tuple[Hashable, float]]:
+        """スコアの高い順に最大k件（スコアが0の文書は返さない）"""
+        if not self._lengths:
+            return []
+        excluded = set(exclude)
+        n = len(self._lengths)
+        average = self._total_length / n or 1.0
+        scores: Dict[Hashable, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if doc_id in excluded:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+@dataclass
+class MemoryItem:
+    """索引したメッセージまたはツール結果"""
+    id: int
+    kind: str  # "user" / "assistant" / "result"
+    text: str
+    payload: Any = None
+
+
+class SessionMemory:
+    """セッション中のメッセージとツール結果を索引し、要求に関連するものを取り出す"""
+
+    def __init__(self, config: Optional[RetrievalConfig] = None):
+        self.config = config or RetrievalConfig()
+        self.index = BM25Index(self.config.k1, self.config.b)
+        self.items: List[MemoryItem] = []
+        # think() には毎回それまでの結果がまとめて渡されるので、同じ結果は一度だけ登録する
+        self._results: Dict[str, MemoryItem] = {}
+
+    def add(self, kind: str, text: str, payload: Any = None) -> MemoryItem:
+        item = MemoryItem(len(self.items), kind, text, payload)
+        self.items.append(item)
+        self.index.add(item.id, text)
+        return item
+
+    def add_result(self, result: Dict[str, Any]) -> Optional[MemoryItem]:
+        """ツール結果を登録する（登録済みの結果と、select_resultsが省略した結果の概要は登録しない）"""
+        if "omitted" in result:
+            return None
+        key = json.dumps(result, ensure_ascii=False, sort_keys=True, default=str)
+        if key not in self._results:
+            text = f"{result.get('operation_type', '')} {result_text(result.get('result'))}"
+            self._results[key] = self.add("result", text, result)
+        return self._results[key]
+
+    def relevant(self, query: str, k: Optional[int] = None, exclude: Iterable[int] = ()) -> List[MemoryItem]:
+        """queryに関連する上位k件（記録した順に並べ直す）"""
+        hits = self.index.search(query, self.config.top_k if k is None else k, exclude)
+        return sorted((self.items[doc_id] for doc_id, _ in hits), key=lambda item: item.id)
+
+
+def select_results(
+    results: List[Dict[str, Any]],
+    query: str,
+    k: int,
+    keep_last: int = 0,
+    config: Optional[RetrievalConfig] = None
+) -> List[Dict[str, Any]]:
+    """直近keep_last件と、queryに関連する上位k件の結果だけを残し、他は概要だけにする"""
+    if len(results) <= k + keep_last:
+        return results
+    config = config or RetrievalConfig()
+    index = BM25Index(config.k1, config.b)
+    candidates = len(results) - keep_last
+    for position, result in enumerate(results[:candidates]):
+        index.add(position, f"{result.get('operation_type', '')} {result_text(result.get('result'))}")
+    keep = {position for position, _ in index.search(query, k)}
+    keep.update(range(candidates, len(results)))
+
+    selected = []
+    for position, result in enumerate(results):
+        if position in keep:
+            selected.append(result)
+        else:
+            summary = result_text(result.get("result")) or result.get("error") or ""
+            stub = {
+                "operation_type": result.get("operation_type"),
+                "success": result.get("success"),
+                "omitted": summary[:80]
+            }
+            # 保存済みの大きな結果は、ハンドルを残してblob_readで読み直せるようにする
+            if isinstance(result.get("result"), dict) and "blob" in result["result"]:
+                stub["blob"] = result["result"]["blob"]
+            selected.append(stub)
+    return selected
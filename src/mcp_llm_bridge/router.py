@@ -0,0 +1,105 @@
+"""
+think() のイテレーションごとのモデル選択
+初回の計画立案や大きなツール結果の分析は推論モデル（thinking_config）、
+ツール実行後の要約など単純な要求は高速モデル（llm_config）に送る。
+推論モデルの観測レイテンシ（EWMA）が目標を超えている間は、短い質問の
+初回の計画も高速モデルで行う。推論モデルの呼び出し回数はターンごとに上限を設ける。
+"""
+
+from typing import Any, Dict, Optional
+from dataclasses import dataclass
+import logging
+
+from mcp_llm_bridge.config import LLMConfig, RoutingConfig
+from mcp_llm_bridge.ratelimit import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+REASONING = "reasoning"
+FAST = "fast"
+HEDGE = "hedge"  # HedgingConfig.targetへのヘッジ要求（ルーターは選ばない）
+
+
+@dataclass
+class Route:
+    """1回のthink()に使うモデル"""
+    tier: str
+    config: LLMConfig
+    reason: str
+
+
+class ModelRouter:
+    """要求の複雑さ・イテレーション・観測レイテンシから推論モデルと高速モデルを選ぶ"""
+
+    def __init__(self, reasoning: LLMConfig, fast: Optional[LLMConfig] = None, config: Optional[RoutingConfig] = None):
+        self.reasoning = reasoning
+        self.fast = fast
+        self.config = config or RoutingConfig()
+        self._latency: Dict[str, Optional[float]] = {REASONING: None, FAST: None}
+        self._reasoning_calls = 0
+        self._fast_failed = False
+        self._counts = {REASONING: 0, FAST: 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled and self.fast is not None and self.fast.model != self.reasoning.model
+
+    def start_turn(self):
+        """ターンごとの予算と失敗の記録をリセットする"""
+        self._reasoning_calls = 0
+        self._fast_failed = False
+
+    def latency(self, tier: str) -> Optional[float]:
+        """観測したレイテンシの指数移動平均（秒）"""
+        return self._latency[tier]
+
+    def choose(
+        self,
+        iteration: int,
+        question: str,
+        tool_result: Optional[str] = None,
+        remaining_phases: int = 0
+    ) -> Route:
+        route = self._choose(iteration, question, tool_result, remaining_phases)
+        if route.tier == REASONING:
+            self._reasoning_calls += 1
+        self._counts[route.tier] += 1
+        logger.info(f"思考モデルの選択: {route.config.model}（{route.reason}）")
+        return route
+
+    def _choose(self, iteration: int, question: str, tool_result: Optional[str], remaining_phases: int) -> Route:
+        if not self.enabled:
+            return Route(REASONING, self.reasoning, "ルーティング無効")
+        if self._fast_failed:
+            return Route(REASONING, self.reasoning, "高速モデルの応答を解析できなかった")
+        if self._reasoning_calls >= self.config.max_reasoning_calls_per_turn:
+            return Route(FAST, self.fast, "推論モデルのターン予算を使い切った")
+
+        if iteration == 0 or not tool_result:
+            slow = self._latency[REASONING] is not None and self._latency[REASONING] > self.config.latency_target_s
+            if slow and estimate_tokens(question) <= self.config.simple_tokens:
+                return Route(FAST, self.fast, "単純な質問で推論モデルが遅い")
+            return Route(REASONING, self.reasoning, "初回の計画立案")
+
+        if estimate_tokens(tool_result) > self.config.large_result_tokens:
+            return Route(REASONING, self.reasoning, "大きなツール結果の分析")
+        if remaining_phases > 0:
+            return Route(REASONING, self.reasoning, f"残り{remaining_phases}フェーズの計画")
+        return Route(FAST, self.fast, "ツール実行後の要約")
+
+    def observe(self, route: Route, seconds: float):
+        """応答までの時間を記録する"""
+        previous = self._latency[route.tier]
+        alpha = self.config.ewma_alpha
+        self._latency[route.tier] = seconds if previous is None else alpha * seconds + (1 - alpha) * previous
+
+    def record_failure(self, route: Route):
+        """応答を解析できなかった。高速モデルなら、このターンの残りは推論モデルを使う"""
+        if route.tier == FAST:
+            self._fast_failed = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": dict(self._counts),
+            "latency_s": {tier: round(value, 3) if value is not None else None for tier, value in self._latency.items()}
+        }
@@ -1,10 +1,21 @@
 from typing import Dict, List, Any, Optional, Union
 import json
 import openai
-from mcp_llm_bridge.config import LLMConfig
+from mcp_llm_bridge.config import HedgingConfig, LLMConfig, RetrievalConfig, RoutingConfig
+from mcp_llm_bridge.hedging import HedgePolicy
+from mcp_llm_bridge.intent import extract_utterance
+from mcp_llm_bridge.retrieval import SessionMemory
+from mcp_llm_bridge.deadline import run_within
 from mcp_llm_bridge.schemas import ThinkingResponse, TaskPlan, TaskPhase, Operation
+from mcp_llm_bridge.tracing import tracer, record_usage
+from mcp_llm_bridge.logging_config import Payload
+from mcp_llm_bridge.cassette import cassette, encode_completion, decode_completion
+from mcp_llm_bridge.ratelimit import estimate_tokens, limited_completion
+from mcp_llm_bridge.router import FAST, HEDGE, REASONING, ModelRouter, Route
+import asyncio
 import logging
 import re
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -64,12 +75,36 @@ def fix_json_content(content: str) -> str:
 class ThinkingClient:
     """O1モデル用の思考プロセス専用クライアント"""
     
-    def __init__(self, config: LLMConfig):
+    def __init__(
+        self,
+        config: LLMConfig,
+        fast_config: Optional[LLMConfig] = None,
+        routing: Optional[RoutingConfig] = None,
+        hedging: Optional[HedgingConfig] = None,
+        retrieval: Optional[RetrievalConfig] = None
+    ):
         self.config = config
-        self.client = openai.OpenAI(
+        self.client = openai.AsyncOpenAI(
             api_key=config.api_key,
             base_url=config.base_url
         )
+        # ツール実行後の要約などに使う高速モデル（同じエンドポイントならクライアントを共有）
+        self.fast_client = self.client
+        if fast_config and (fast_config.api_key, fast_config.base_url) != (config.api_key, config.base_url):
+            self.fast_client = openai.AsyncOpenAI(api_key=fast_config.api_key, base_url=fast_config.base_url)
+        self.router = ModelRouter(config, fast_config, routing)
+        # 遅い要求に並走させるヘッジ（既定は無効）
+        self.hedging = HedgePolicy(hedging or HedgingConfig())
+        self.hedge_client = self.fast_client
+        target = self.hedging.config.target
+        if target is not None and (target.api_key, target.base_url) != (config.api_key, config.base_url):
+            self.hedge_client = openai.AsyncOpenAI(api_key=target.api_key, base_url=target.base_url)
+        elif target is not None:
+            self.hedge_client = self.client
+        # 要約に入れる過去の会話・結果を選ぶためのセッション内索引
+        self.memory = SessionMemory(retrieval)
+        # conversation_history の各メッセージに対応する索引の項目ID
+        self._message_items: List[Optional[int]] = []
         self.task_plan: Optional[TaskPlan] = None
         self.conversation_history: List[Dict[str, str]] = []  # 会話履歴を保持するリスト
         self.tool_results: List[Dict[str, Any]] = []  # ツール実行結果を保持するリスト
@@ -120,7 +155,10 @@ class ThinkingClient:
 # 利用可能なツール
 1. human_interaction
    - parameters: {"question": "質問文"}
-   - 制約: 1フェーズで1つの質問のみ
+     または {"questions": [{"id": "回答のキー", "question": "質問文", "choices": ["選択肢1", "選択肢2"], "type": "text|choice|number|boolean"}]}
+   - questions（フォームモード）: 不足している情報が複数ある場合は、1回の操作でまとめて質問する（最大5件）
+     choicesを付けると選択式になり、回答はidごとの型付きの値（answers）で返る
+   - 制約: 同じフェーズで他のツールと組み合わせない。聞き漏れが無いように必要な質問を一度に尋ねる
 
 2. database_query
    - parameters: {"query": "SQLクエリ"}
@@ -128,29 +166,50 @@ class ThinkingClient:
    - 制約: 適切なSQLite構文、シングルクォートを使用
 
 3. google_search
-   - parameters: {"query": "検索文", "num_results": 件数}
-   - 制約: num_resultsは1-10の範囲
+   - parameters: {"query": "検索文", "num_results": 件数, "fetch_pages": 件数}
+   - fetch_pages: 上位N件のページ本文を取得し、質問に関連する抜粋(excerpt)を付ける（省略時0）
+   - 制約: num_resultsは1-10、fetch_pagesは0-5の範囲
+   - 結果のhighlightsにはanswer_box（直接の回答）、knowledge_graph、top_stories、related_questionsが含まれる
+     highlightsで回答できる場合は追加の検索をせずにタスクを完了すること
 
-4. spotify
+4. google_search_batch
+   - parameters: {"queries": ["検索文1", "検索文2"], "pages": ページ数, "max_results": 件数, "fetch_pages": 件数}
+   - 言い換えた複数のクエリや、10件を超える結果が必要な場合に使用（1回の操作で完結）
+   - 制約: queriesは最大5件、pagesは1-3、max_resultsは1-30の範囲
+
+5. spotify
    - parameters: 
      - action: 実行するアクション（必須）
        - "search": 楽曲検索
          - query: 検索クエリ（必須）
+         - limit: 件数（1-10、省略時5）
+       - "tracks": 複数の楽曲情報をまとめて取得
+         - track_ids: 楽曲IDのリスト（必須）
        - "play": 楽曲再生
-         - track_id: 再生する楽曲のID（必須）
+         - track_id: 再生する楽曲のID、またはtrack_ids: 続けて再生する楽曲IDのリスト
+         - context_uri: アルバム・プレイリストを再生する場合のURIまたはURL
        - "pause": 再生一時停止
        - "current_track": 現在再生中の楽曲情報取得
        - "add_to_queue": キューに楽曲追加
-         - track_id: 追加する楽曲のID（必須）
+         - track_id: 追加する楽曲のID、またはtrack_ids: 順に追加する楽曲IDのリスト
    - 制約: 
      - actionは必須
      - searchにはqueryが必須
-     - play/add_to_queueにはtrack_idが必須
+     - playにはtrack_id・track_ids・context_uriのいずれかが必須
+     - add_to_queue/tracksにはtrack_idまたはtrack_idsが必須
+     - 複数曲を扱うときは操作を分けず、track_idsで1回にまとめる（最大20件）
+
+6. blob_read
+   - parameters: {"handle": "blob:...", "key": "results", "start": 0, "limit": 10, "fields": ["title", "link"]}
+   - 大きな実行結果は {"blob": "blob:...", "chars": 文字数, "digest": {件数・列の統計・先頭の項目}} の形で渡される
+   - digestで答えられない詳細が必要な場合だけ、必要な範囲・キーを指定して読み出す
+   - リスト以外の値はJSON文字列として start/limit（文字数、最大4000）の範囲だけが返る
+   - 制約: limitは1-50の範囲。human_interactionを除く他のツールと組み合わせ可能
 
 # 実行ルール
 1. 1フェーズで最大3つまでの操作
 2. human_interactionは単独で使用
-3. database_queryとgoogle_searchは組み合わせ可能
+3. database_query、google_search、google_search_batchは組み合わせ可能
 4. spotifyは他のツールと組み合わせ可能（human_interactionを除く）
 5. 最大5フェーズまで
 6. 各フェーズは明確な目的が必要
@@ -176,6 +235,8 @@ class ThinkingClient:
             "role": "user",
             "content": message
         })
+        # 前回の要約を含む入力全体ではなく、ユーザーの発話だけを索引する
+        self._message_items.append(self.memory.add("user", extract_utterance(message)).id)
         logger.info(f"ユーザーの入力: {message}")
 
     def add_assistant_message(self, message: str):
@@ -184,6 +245,9 @@ class ThinkingClient:
             "role": "assistant",
             "content": message
         })
+        # 要約はそれ自体が過去の内容の写しなので索引しない
+        item = None if message.startswith("【要約】") else self.memory.add("assistant", message)
+        self._message_items.append(item.id if item else None)
         logger.info(f"アシスタントの応答: {message}")
 
     def add_tool_result(self, result: Union[Dict[str, Any], List[Dict[str, Any]]]):
@@ -191,11 +255,15 @@ class ThinkingClient:
         # リストの場合は各要素を個別に処理
         if isinstance(result, list):
             for item in result:
+                if isinstance(item, dict):
+                    self.memory.add_result(item)
                 simplified = self._simplify_tool_result(item)
                 self.tool_results.append(simplified)
                 logger.info(f"ツール実行結果: {json.dumps(simplified, ensure_ascii=False, indent=2)}")
         else:
             # 単一の結果の場合
+            if isinstance(result, dict):
+                self.memory.add_result(result)
             simplified = self._simplify_tool_result(result)
             self.tool_results.append(simplified)
             logger.info(f"ツール実行結果: {json.dumps(simplified, ensure_ascii=False, indent=2)}")
@@ -235,6 +303,8 @@ class ThinkingClient:
                             "found_tracks": len(tracks),
                             "first_track": tracks[0]["name"] if tracks else None
                         }
+                elif "blob" in result_data:  # 保存した大きな結果のハンドル
+                    simplified["result"] = {"blob": result_data["blob"], "digest": result_data.get("digest")}
                 elif "status" in result_data:  # Spotify再生状態
                     simplified["result"] = {
                         "status": result_data["status"],
@@ -247,15 +317,22 @@ class ThinkingClient:
 
         return simplified
 
-    def get_conversation_summary(self) -> str:
-        """会話履歴の要約を生成"""
+    def get_conversation_summary(self, query: Optional[str] = None) -> str:
+        """会話履歴の要約を生成
+
+        queryを渡すと、直近の数件に加えて、queryに関連する過去のメッセージと
+        ツール結果を索引から選んで載せる（最近の3件の結果の代わり）。
+        """
         if not self.conversation_history:
             summary = "会話履歴はありません。"
             logger.info(summary)
             return summary
 
-        # 直近の会話（最大5件）を取得
-        recent_history = self.conversation_history[-5:]
+        retrieval = self.memory.config
+        use_retrieval = query is not None and retrieval.enabled
+        # 直近の会話（最大5件、関連検索をするときはrecent_messages件）を取得
+        recent_count = retrieval.recent_messages if use_retrieval else 5
+        recent_history = self.conversation_history[-recent_count:] if recent_count > 0 else []
         
         # ツール実行回数を取得
         tool_count = len(self.tool_results)
@@ -283,8 +360,25 @@ class ThinkingClient:
             f"- ツール実行回数: {tool_count}"
         ])
 
+        if use_retrieval:
+            # 直近に載せたメッセージ以外から、今回の要求に関連するものを追加
+            recent_ids = [item for item in self._message_items[-recent_count:] if item is not None] if recent_count > 0 else []
+            related = self.memory.relevant(extract_utterance(query), exclude=recent_ids)
+            if related:
+                summary_lines.append("- 関連する過去の情報:")
+            for item in related:
+                content = item.text
+                if len(content) > 200:
+                    content = content[:200] + "...(省略)"
+                if item.kind == "result":
+                    status = "成功" if item.payload.get("success") else "失敗"
+                    summary_lines.append(f"  ・{item.payload.get('operation_type', 'unknown')}: {status} - {content}")
+                else:
+                    role = "ユーザー" if item.kind == "user" else "アシスタント"
+                    summary_lines.append(f"  ・{role}: {content}")
+
         # 最新のツール実行結果を追加（最大3件）
-        if self.tool_results:
+        elif self.tool_results:
             summary_lines.append("- 最近の実行結果:")
             for result in self.tool_results[-3:]:
                 if result.get("success"):
@@ -307,6 +401,203 @@ class ThinkingClient:
         logger.info(f"\n{summary}")
         return summary
     
+    def start_turn(self):
+        """ターンの開始時に、モデル選択のターンごとの予算をリセットする"""
+        self.router.start_turn()
+
+    def _remaining_phases(self, iteration: int) -> int:
+        """計画上、このイテレーションの後に残っているツール実行フェーズの数"""
+        if not self.task_plan:
+            return 0
+        return max(0, self.task_plan.total_phases - iteration - 1)
+
+    def _create_completion(self, route: Route, prompt: str):
+        messages = [{"role": "user", "content": prompt}]
+        if route.tier == REASONING:
+            client, reasoning = self.client, True
+        elif route.tier == HEDGE:
+            # 推論モデルを別のエンドポイントでヘッジする場合は推論モデルのパラメータで送る
+            client, reasoning = self.hedge_client, route.config.model == self.config.model
+        else:
+            client, reasoning = self.fast_client, False
+        if reasoning:
+            return client.chat.completions.create(
+                model=route.config.model,
+                messages=messages,
+                max_completion_tokens=32768
+            )
+        return client.chat.completions.create(
+            model=route.config.model,
+            messages=messages,
+            max_tokens=route.config.max_tokens,
+            temperature=route.config.temperature
+        )
+
+    def _hedge_route(self, route: Route) -> Optional[Route]:
+        """routeの要求が遅いときに並走させる要求先（ヘッジしない場合はNone）"""
+        if not self.hedging.enabled:
+            return None
+        if self.hedging.config.target is not None:
+            return Route(HEDGE, self.hedging.config.target, "ヘッジ")
+        # 既定では推論モデルの要求だけを高速モデルでヘッジする
+        if route.tier == REASONING and self.router.enabled:
+            return Route(FAST, self.router.fast, "ヘッジ")
+        return None
+
+    async def _request(self, route: Route, prompt: str):
+        """1回の思考APIリクエスト（ターンの残り時間で打ち切り、所要時間をモデル選択とヘッジの待ち時間に反映する）"""
+        started = time.perf_counter()
+        try:
+            completion = await run_within(cassette.call(
+                "think",
+                {"model": route.config.model, "prompt": prompt},
+                lambda: limited_completion(
+                    lambda: self._create_completion(route, prompt),
+                    estimate_tokens(prompt)
+                ),
+                encode=encode_completion,
+                decode=decode_completion
+            ), "think")
+        except asyncio.CancelledError:
+            # ヘッジに負けて取り消された要求は、少なくともここまでかかっている
+            self._observe(route, time.perf_counter() - started)
+            raise
+        self._observe(route, time.perf_counter() - started)
+        return completion
+
+    def _observe(self, route: Route, seconds: float):
+        if route.tier != HEDGE:
+            self.router.observe(route, seconds)
+        self.hedging.observe(route.config.model, seconds)
+
+    async def _attempt(self, route: Route, prompt: str, hedge: bool):
+        with tracer.span("think.request", **{"llm.model": route.config.model, "think.hedge": hedge}) as span:
+            completion = await self._request(route, prompt)
+            record_usage(span, completion)
+            return completion
+
+    async def _hedged_request(self, route: Route, hedge_route: Route, prompt: str):
+        """routeへの要求が遅ければhedge_routeにも送り、先に解析できた応答を使う
+
+        どちらの応答も解析できなければ先に届いた応答を返す（呼び出し側の既定の処理に任せる）。
+        """
+        tasks = {asyncio.create_task(self._attempt(route, prompt, hedge=False)): route}
+        delay = self.hedging.delay(route.config.model)
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            logger.info(f"思考APIの応答が{delay:.1f}秒を超えたため{hedge_route.config.model}にも要求します")
+            tasks[asyncio.create_task(self._attempt(hedge_route, prompt, hedge=True))] = hedge_route
+
+        pending = set(tasks)
+        winner = fallback = None
+        error: Optional[BaseException] = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None and self._is_valid(task.result()):
+                        winner = task
+                    elif fallback is None:
+                        fallback = task
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+        chosen = winner or fallback
+        extra = [task for task in tasks if task is not chosen]
+        self.hedging.record(
+            hedged=len(tasks) > 1,
+            hedge_won=chosen is not None and tasks[chosen] is hedge_route,
+            extra_requests=len(extra),
+            extra_tokens=sum(self._spent_tokens(task, prompt) for task in extra)
+        )
+        if chosen is None:
+            raise error
+        return tasks[chosen], chosen.result()
+
+    @staticmethod
+    def _spent_tokens(task: asyncio.Task, prompt: str) -> int:
+        """使わなかった要求のトークン数（取り消した要求はプロンプトの概算）"""
+        if task.cancelled() or task.exception() is not None:
+            return estimate_tokens(prompt)
+        usage = getattr(task.result(), "usage", None)
+        return getattr(usage, "total_tokens", None) or estimate_tokens(prompt)
+
+    def _is_valid(self, completion: Any) -> bool:
+        """応答がThinkingResponseとして解析できるか"""
+        try:
+            response_dict = self._parse_response(completion.choices[0].message.content)
+            return response_dict is not None and ThinkingResponse(**response_dict) is not None
+        except Exception:
+            return False
+
+    @staticmethod
+    def _parse_response(response_content: str) -> Optional[Dict[str, Any]]:
+        """応答からJSONを取り出す（JSONが含まれなければNone、壊れていれば例外）"""
+        # マークダウンのコードブロック記法を除去
+        content = response_content.strip()
+        if '```json' in content:
+            parts = content.split('```json')
+            if len(parts) > 1:
+                content = parts[1]
+        if '```' in content:
+            parts = content.split('```')
+            if len(parts) > 1:
+                content = parts[0]
+        content = content.strip()
+        
+        # JSON形式の応答を探す
+        json_start = content.find('{')
+        json_end = content.rfind('}') + 1
+        
+        if json_start >= 0 and json_end > json_start:
+            json_content = content[json_start:json_end].strip()
+            
+            try:
+                # JSONコンテンツの修正
+                json_content = fix_json_content(json_content)
+                
+                # final_responseのテキスト処理
+                temp_dict = json.loads(json_content)
+                if temp_dict.get('final_response'):
+                    final_response = temp_dict['final_response']
+                    # リストの場合は文字列に変換
+                    if isinstance(final_response, list):
+                        final_response = json.dumps(final_response, ensure_ascii=False)
+                    # 文字列の場合は改行を処理
+                    elif isinstance(final_response, str):
+                        final_response = final_response.replace('\n', '\\n')
+                    temp_dict['final_response'] = final_response
+                    json_content = json.dumps(temp_dict)
+            except Exception as e:
+                logger.error(f"JSON前処理でエラー: {str(e)}")
+                raise
+            
+            response_dict = json.loads(json_content)
+            
+            # 必須フィールドの確認と追加
+            if 'needs_tool' not in response_dict:
+                response_dict['needs_tool'] = False
+            if 'current_phase' not in response_dict:
+                response_dict['current_phase'] = None
+            
+            # final_responseの改行を復元
+            if response_dict.get('final_response'):
+                response_dict['final_response'] = response_dict['final_response'].replace('\\n', '\n')
+            return response_dict
+        return None
+
+    async def close(self):
+        await self.client.close()
+        if self.fast_client is not self.client:
+            await self.fast_client.close()
+        if self.hedge_client not in (self.client, self.fast_client):
+            await self.hedge_client.close()
+
     async def think(self, context: str, tool_result: Optional[str] = None, iteration: int = 0) -> ThinkingResponse:
         """思考プロセスの実行"""
         logger.info(f"=== O1モデルの思考プロセス開始 (イテレーション: {iteration}) ===")
@@ -350,77 +641,33 @@ task_planとcurrent_phaseの両方を含むJSONで応答してください。
 必ずカンマで要素を区切り、SQLクエリではシングルクォートを使用してください。
 """
         
+        route = self.router.choose(iteration, context, tool_result, self._remaining_phases(iteration))
         try:
-            logger.info("O1 APIリクエスト開始")
-            completion = self.client.chat.completions.create(
-                model=self.config.model,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }],
-                max_completion_tokens=32768
-            )
-            logger.info("O1 APIリクエスト完了")
+            logger.info(f"思考APIリクエスト開始 ({route.config.model})")
+            attributes = {"llm.model": route.config.model, "think.iteration": iteration, "think.route": route.tier}
+            with tracer.span("think", **attributes) as span:
+                hedge_route = self._hedge_route(route)
+                if hedge_route is None:
+                    completion = await self._request(route, prompt)
+                    record_usage(span, completion)
+                else:
+                    route, completion = await self._hedged_request(route, hedge_route, prompt)
+                    span.set_attributes({"llm.model": route.config.model, "think.winner": route.tier})
+            logger.info("思考APIリクエスト完了")
             
             # レスポンスの解析と構造化
             response_content = completion.choices[0].message.content
-            logger.debug(f"生の応答内容: {response_content}")
+            logger.debug("生の応答内容: %s", Payload(response_content))
 
             try:
-                # マークダウンのコードブロック記法を除去
-                content = response_content.strip()
-                if '```json' in content:
-                    parts = content.split('```json')
-                    if len(parts) > 1:
-                        content = parts[1]
-                if '```' in content:
-                    parts = content.split('```')
-                    if len(parts) > 1:
-                        content = parts[0]
-                content = content.strip()
-                
-                # JSON形式の応答を探す
-                json_start = content.find('{')
-                json_end = content.rfind('}') + 1
-                
-                if json_start >= 0 and json_end > json_start:
-                    json_content = content[json_start:json_end].strip()
-                    
-                    try:
-                        # JSONコンテンツの修正
-                        json_content = fix_json_content(json_content)
-                        
-                        # final_responseのテキスト処理
-                        temp_dict = json.loads(json_content)
-                        if temp_dict.get('final_response'):
-                            final_response = temp_dict['final_response']
-                            # リストの場合は文字列に変換
-                            if isinstance(final_response, list):
-                                final_response = json.dumps(final_response, ensure_ascii=False)
-                            # 文字列の場合は改行を処理
-                            elif isinstance(final_response, str):
-                                final_response = final_response.replace('\n', '\\n')
-                            temp_dict['final_response'] = final_response
-                            json_content = json.dumps(temp_dict)
-                    except Exception as e:
-                        logger.error(f"JSON前処理でエラー: {str(e)}")
-                        raise
-                    
-                    response_dict = json.loads(json_content)
-                    
-                    # 必須フィールドの確認と追加
-                    if 'needs_tool' not in response_dict:
-                        response_dict['needs_tool'] = False
-                    if 'current_phase' not in response_dict:
-                        response_dict['current_phase'] = None
-                    
-                    # final_responseの改行を復元
+                response_dict = self._parse_response(response_content)
+                if response_dict is not None:
+                    # アシスタントの応答として記録
                     if response_dict.get('final_response'):
-                        response_dict['final_response'] = response_dict['final_response'].replace('\\n', '\n')
-                        # アシスタントの応答として記録
                         self.add_assistant_message(response_dict['final_response'])
                 else:
                     # JSON形式でない場合は、構造化された応答を生成
+                    self.router.record_failure(route)
                     response_dict = {
                         "current_phase": {
                             "phase_number": 1,
@@ -457,7 +704,8 @@ task_planとcurrent_phaseの両方を含むJSONで応答してください。
                 
             except Exception as e:
                 logger.error(f"応答の解析でエラー: {str(e)}")
-                logger.error(f"問題のある応答内容: {response_content}")
+                logger.error("問題のある応答内容: %s", Payload(response_content))
+                self.router.record_failure(route)
                 
                 try:
                     # JSON解析エラーの詳細を記録
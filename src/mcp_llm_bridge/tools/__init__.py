@@ -1,5 +1,8 @@
 from .database import DatabaseQueryTool, DatabaseSchema
 from .search import GoogleSearchTool
 from .human import HumanTool
+from .blob_store import BlobStore
+from .input_channel import InputChannel, StdinInputChannel, QueueInputChannel
 
-__all__ = ['DatabaseQueryTool', 'DatabaseSchema', 'GoogleSearchTool', 'HumanTool']
\ No newline at end of file
+__all__ = ['DatabaseQueryTool', 'DatabaseSchema', 'GoogleSearchTool', 'HumanTool', 'BlobStore',
+           'InputChannel', 'StdinInputChannel', 'QueueInputChannel']
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Out-of-band storage for large tool results.
+Results whose JSON form exceeds a size threshold are stored under a content-addressed
+handle and replaced in the planner prompt by the handle plus a digest (item counts,
+column statistics and the top items). The blob_read operation dereferences or slices
+a handle when the planner needs the detail.
+"""
+
+from typing import Any, Dict, List, Optional
+from collections import Counter
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from mcp_llm_bridge.cache import DiskLRUCache, TTLCache
+
+logger = logging.getLogger(__name__)
+
+HANDLE_PREFIX = "blob:"
+# Results of these operations are never moved out of the prompt
+INLINE_OPERATIONS = ("blob_read", "human_interaction")
+MAX_READ_ITEMS = 50
+MAX_READ_CHARS = 4000
+PREVIEW_CHARS = 80
+
+
+def _truncate(value: Any, limit: int = PREVIEW_CHARS) -> Any:
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + "…"
+    return value
+
+
+def _preview(item: Any) -> Any:
+    """A short version of one item: scalar fields only, long strings truncated"""
+    if isinstance(item, dict):
+        return {
+            key: _truncate(value) for key, value in list(item.items())[:8]
+            if value is None or isinstance(value, (str, int, float, bool))
+        }
+    return _truncate(item if isinstance(item, (str, int, float, bool)) else json.dumps(item, ensure_ascii=False, default=str))
+
+
+def _column_stats(values: List[Any]) -> Dict[str, Any]:
+    present = [value for value in values if value is not None]
+    stats: Dict[str, Any] = {"non_null": len(present)}
+    numbers = [value for value in present if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    if numbers and len(numbers) == len(present):
+        stats.update(min=min(numbers), max=max(numbers), mean=round(sum(numbers) / len(numbers), 3))
+    else:
+        counts = Counter(_truncate(str(value), 40) for value in present)
+        stats.update(distinct=len(counts), top=[value for value, _ in counts.most_common(3)])
+    return stats
+
+
+def _digest_list(items: List[Any], top: int) -> Dict[str, Any]:
+    digest: Dict[str, Any] = {"count": len(items)}
+    if items and all(isinstance(item, dict) for item in items):
+        columns: List[str] = []
+        for item in items:
+            columns.extend(key for key in item if key not in columns)
+        digest["columns"] = {
+            column: _column_stats([item.get(column) for item in items])
+            for column in columns[:20]
+        }
+    digest["top"] = [_preview(item) for item in items[:top]]
+    return digest
+
+
+def digest(value: Any, top: int = 5) -> Dict[str, Any]:
+    """Summarise a result: counts, per-column statistics and the first items"""
+    if isinstance(value, list):
+        return {"type": "list", **_digest_list(value, top)}
+    if isinstance(value, dict):
+        summary: Dict[str, Any] = {"type": "object", "keys": list(value)[:20]}
+        for key, item in value.items():
+            if isinstance(item, list):
+                summary[key] = _digest_list(item, top)
+            elif isinstance(item, dict):
+                summary[key] = {"keys": list(item)[:10]}
+        return summary
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return {"type": "text", "chars": len(text), "head": text[:200]}
+
+
+class BlobStore:
+    """Content-addressed store for large tool results, readable through blob_read"""
+
+    def __init__(self, directory: Optional[str] = None):
+        directory = os.getenv("BLOB_STORE_DIR", "blob_store") if directory is None else directory
+        self.inline_max_chars = int(os.getenv("BLOB_INLINE_MAX_CHARS", "4000"))
+        self.digest_items = int(os.getenv("BLOB_DIGEST_ITEMS", "5"))
+        # Recently stored blobs are served from memory; the directory keeps them across turns and restarts
+        self.memory = TTLCache(max_entries=64, ttl=3600.0)
+        self.disk: Optional[DiskLRUCache] = None
+        if directory:
+            try:
+                max_bytes = int(os.getenv("BLOB_STORE_MAX_BYTES", str(100 * 1024 * 1024)))
+                self.disk = DiskLRUCache(directory, max_bytes=max_bytes, suffix=".json")
+            except OSError as e:
+                logger.warning(f"Blob store directory is unavailable, keeping blobs in memory: {str(e)}")
+
+    @staticmethod
+    def handle_for(data: str) -> str:
+        return HANDLE_PREFIX + hashlib.sha256(data.encode("utf-8")).hexdigest()[:24]
+
+    async def put(self, value: Any) -> str:
+        """Store a JSON-serialisable value and return its handle"""
+        data = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+        handle = self.handle_for(data)
+        key = handle[len(HANDLE_PREFIX):]
+        if self.memory.get(key) is None:
+            self.memory.set(key, value)
+            if self.disk is not None and key not in self.disk:
+                await asyncio.to_thread(self.disk.set, key, data.encode("utf-8"))
+        return handle
+
+    async def get(self, handle: str) -> Any:
+        """Return the stored value for a handle"""
+        if not isinstance(handle, str) or not handle.startswith(HANDLE_PREFIX):
+            raise ValueError(f"Invalid blob handle: {handle}")
+        key = handle[len(HANDLE_PREFIX):]
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        data = await asyncio.to_thread(self.disk.get, key) if self.disk is not None else None
+        if data is None:
+            raise ValueError(f"Unknown blob handle: {handle}")
+        value = json.loads(data)
+        self.memory.set(key, value)
+        return value
+
+    async def compact(self, value: Any) -> Any:
+        """Return the value itself if small, otherwise a handle with a digest"""
+        chars = len(json.dumps(value, ensure_ascii=False, default=str))
+        if chars <= self.inline_max_chars:
+            return value
+        return {
+            "blob": await self.put(value),
+            "chars": chars,
+            "digest": digest(value, self.digest_items)
+        }
+
+    async def compact_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Copy of accumulated results with large result payloads replaced by handles"""
+        compacted = []
+        for result in results:
+            if result.get("result") is not None and result.get("operation_type") not in INLINE_OPERATIONS:
+                result = {**result, "result": await self.compact(result["result"])}
+            compacted.append(result)
+        return compacted
+
+    @staticmethod
+    def _to_json(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _read_text(handle: str, text: str, start: int, params: Dict[str, Any], field: str) -> Dict[str, Any]:
+        """A slice of text (or of a value's JSON) capped at MAX_READ_CHARS characters"""
+        limit = max(1, min(int(params.get("limit", 2000)), MAX_READ_CHARS))
+        return {"handle": handle, "chars": len(text), "start": start, field: text[start:start + limit]}
+
+    async def execute(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Dereference a handle, optionally slicing a list and selecting fields
+
+        params: handle (required), key (which field of an object to read), start, limit
+        and fields (keys to keep in each item). Text blobs, and objects or fields that are
+        not lists, are sliced by characters (of their JSON) so a read never inlines the
+        whole blob.
+        """
+        handle = params.get("handle")
+        if not handle:
+            raise ValueError("handle parameter is required")
+        value = await self.get(handle)
+        start = max(0, int(params.get("start", 0)))
+
+        if isinstance(value, str):
+            return self._read_text(handle, value, start, params, "text")
+
+        items, key = value, params.get("key")
+        if isinstance(value, dict):
+            if key is None:
+                key = next((k for k, v in value.items() if isinstance(v, list)), None)
+            elif key not in value:
+                raise ValueError(f"Blob {handle} has no key named {key}")
+            elif not isinstance(value[key], list):
+                # A field that is not a list is read as a slice of its JSON
+                result = self._read_text(handle, self._to_json(value[key]), start, params, "json")
+                result["key"] = key
+                return result
+            if key is None:
+                return self._read_text(handle, self._to_json(value), start, params, "json")
+            items = value[key]
+        if not isinstance(items, list):
+            return self._read_text(handle, self._to_json(value), start, params, "json")
+
+        limit = max(1, min(int(params.get("limit", 10)), MAX_READ_ITEMS))
+        selected = items[start:start + limit]
+        if fields := params.get("fields"):
+            selected = [
+                {field: item.get(field) for field in fields} if isinstance(item, dict) else item
+                for item in selected
+            ]
+        result = {"handle": handle, "total": len(items), "start": start, "items": selected}
+        if key is not None:
+            result["key"] = key
+        return result
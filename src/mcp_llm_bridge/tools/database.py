@@ -7,6 +7,7 @@ from typing import Dict, List, Any
 from dataclasses import dataclass
 import sqlite3
 import logging
+from mcp_llm_bridge.cassette import cassette
 
 @dataclass
 class DatabaseSchema:
@@ -97,7 +98,15 @@ class DatabaseQueryTool:
             
         if not self.validate_query(query):
             raise ValueError("Query references invalid columns")
-            
+
+        return await cassette.call(
+            "database",
+            {"db": self.db_path, "query": query},
+            lambda: self._run_query(query)
+        )
+
+    async def _run_query(self, query: str) -> List[Dict[str, Any]]:
+        """Run the query against the SQLite database"""
         conn = sqlite3.connect(self.db_path)
         try:
             cursor = conn.cursor()
@@ -1,7 +1,16 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import os
 import json
+import time
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from .input_channel import InputChannel, StdinInputChannel
+from mcp_llm_bridge.cassette import cassette
+
+# フォームの回答が不正な場合に聞き直す回数
+MAX_FORM_RETRIES = 2
+TRUE_WORDS = {"はい", "うん", "yes", "y", "true", "1", "ok"}
+FALSE_WORDS = {"いいえ", "いや", "no", "n", "false", "0"}
 
 @dataclass
 class HumanToolResponse:
@@ -9,13 +18,95 @@ class HumanToolResponse:
     answer: str
     success: bool = True
     error: str = ""
+    timed_out: bool = False
+
+@dataclass
+class FormQuestion:
+    """フォームモードの1問分の定義"""
+    id: str
+    question: str
+    type: str = "text"  # text / choice / number / boolean
+    choices: List[str] = field(default_factory=list)
+    default: Any = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], index: int) -> "FormQuestion":
+        question = str(data.get("question") or "").strip()
+        if not question:
+            raise ValueError(f"{index + 1}番目の質問が空です")
+        choices = [str(choice) for choice in data.get("choices") or []]
+        question_type = data.get("type") or ("choice" if choices else "text")
+        if question_type not in ("text", "choice", "number", "boolean"):
+            raise ValueError(f"未対応の質問タイプです: {question_type}")
+        if question_type == "choice" and not choices:
+            raise ValueError(f"選択式の質問に選択肢がありません: {question}")
+        return cls(
+            id=str(data.get("id") or f"q{index + 1}"),
+            question=question,
+            type=question_type,
+            choices=choices,
+            default=data.get("default")
+        )
+
+    def prompt(self) -> str:
+        """ユーザーに表示する質問文"""
+        if self.type == "choice":
+            options = "  ".join(f"{i}) {choice}" for i, choice in enumerate(self.choices, start=1))
+            return f"{self.question}\n   {options}"
+        if self.type == "boolean":
+            return f"{self.question}（はい/いいえ）"
+        return self.question
+
+    def parse(self, text: str) -> Any:
+        """回答を質問タイプに合わせた値に変換（不正な回答はValueError）"""
+        text = text.strip()
+        if not text:
+            raise ValueError("回答が入力されていません")
+        if self.type == "choice":
+            if text in self.choices:
+                return text
+            if text.isdigit() and 1 <= int(text) <= len(self.choices):
+                return self.choices[int(text) - 1]
+            raise ValueError(f"1から{len(self.choices)}の番号か選択肢で答えてください")
+        if self.type == "number":
+            try:
+                number = float(text.replace(",", ""))
+            except ValueError:
+                raise ValueError("数値で答えてください")
+            return int(number) if number.is_integer() else number
+        if self.type == "boolean":
+            if text.lower() in TRUE_WORDS:
+                return True
+            if text.lower() in FALSE_WORDS:
+                return False
+            raise ValueError("はい/いいえで答えてください")
+        return text
+
+    def parse_default(self, value: Any) -> Any:
+        """既定の回答を、入力された回答と同じ型の値に変換（不正な値はValueError）"""
+        if self.type == "number" and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        if self.type == "boolean" and isinstance(value, bool):
+            return value
+        return self.parse(str(value))
+
 
 class HumanTool:
-    """人間とのインタラクションを管理するMCPツール"""
+    """人間とのインタラクションを管理するMCPツール
+
+    質問の表示と回答の受け取りはInputChannelに任せる。既定は端末の標準入力。
+    タイムアウトした場合は既定の回答があればそれを使い、無ければエラーを返す。
+    questionsを渡すとフォームモードになり、複数の質問を1回のやり取りで尋ねて
+    質問IDごとの型付きの回答を返す。
+    """
     
-    def __init__(self):
+    def __init__(self, channel: Optional[InputChannel] = None):
         self.name = "human_interaction"
         self.description = "ユーザーに追加の質問をして情報を収集するツール"
+        self.channel = channel or StdinInputChannel()
+        timeout = os.getenv("HUMAN_INPUT_TIMEOUT")
+        self.timeout = float(timeout) if timeout else None
+        self.default_answer = os.getenv("HUMAN_INPUT_DEFAULT") or None
         
     def get_tool_spec(self) -> Dict[str, Any]:
         """ツールの仕様を返す"""
@@ -28,38 +119,78 @@ class HumanTool:
                     "question": {
                         "type": "string",
                         "description": "ユーザーへの質問"
+                    },
+                    "questions": {
+                        "type": "array",
+                        "description": "まとめて尋ねる複数の質問（フォームモード、最大5件）",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {"type": "string", "description": "回答を識別するキー"},
+                                "question": {"type": "string", "description": "質問文"},
+                                "type": {
+                                    "type": "string",
+                                    "enum": ["text", "choice", "number", "boolean"],
+                                    "description": "回答の型（choicesがあれば省略時choice、なければtext）"
+                                },
+                                "choices": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "選択肢"
+                                },
+                                "default": {"description": "タイムアウトした場合に使う回答"}
+                            },
+                            "required": ["question"]
+                        }
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "description": "回答を待つ最大秒数（省略時は設定値、未設定なら無制限）"
+                    },
+                    "default_answer": {
+                        "type": "string",
+                        "description": "タイムアウトした場合に使う回答（省略時はタイムアウトをエラーとして返す）"
                     }
                 },
-                "required": ["question"]
+                "anyOf": [{"required": ["question"]}, {"required": ["questions"]}]
             }
         }
         
     async def execute(self, args: Dict[str, Any]) -> str:
         """ツールを実行し、ユーザーからの応答を待つ"""
         try:
+            if args.get('questions'):
+                return await self._execute_form(args)
+
             # パラメータの検証
             if 'question' not in args or not args['question'].strip():
                 raise ValueError("質問が指定されていないか、空の質問です")
 
-            # チャットスタイルで質問を表示
-            print("\n🤖 " + args['question'])
-            print("👤 ", end='', flush=True)
-            
+            timeout = args.get('timeout', self.timeout)
+            default_answer = args.get('default_answer', self.default_answer)
+
             # ユーザーからの入力を待つ
-            response = await self._get_user_input()
+            try:
+                response = await self._get_user_input(args['question'], timeout)
+                timed_out = False
+            except asyncio.TimeoutError:
+                if default_answer is None:
+                    raise ValueError(f"{timeout}秒以内に回答がありませんでした")
+                response, timed_out = default_answer, True
             
             # 空の回答をチェック
             if not response.strip():
                 raise ValueError("回答が入力されていません")
             
             # 応答をJSON形式で返す
-            result = HumanToolResponse(answer=response)
-            return json.dumps({
-                "result": {
-                    "answer": result.answer,
-                    "success": result.success
-                }
-            }, ensure_ascii=False)
+            result = HumanToolResponse(answer=response, timed_out=timed_out)
+            payload = {
+                "answer": result.answer,
+                "success": result.success
+            }
+            if result.timed_out:
+                payload["timed_out"] = True
+            return json.dumps({"result": payload}, ensure_ascii=False)
             
         except Exception as e:
             error_result = HumanToolResponse(
@@ -73,7 +204,77 @@ class HumanTool:
                 "error": error_result.error
             }, ensure_ascii=False)
     
-    async def _get_user_input(self) -> str:
-        """非同期でユーザー入力を取得"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, input)
\ No newline at end of file
+    async def _execute_form(self, args: Dict[str, Any]) -> str:
+        """複数の質問を1回のやり取りで尋ね、型付きの回答をまとめて返す"""
+        raw_questions = args['questions']
+        if not isinstance(raw_questions, list) or len(raw_questions) > 5:
+            raise ValueError("questionsは最大5件のリストで指定してください")
+        questions = [FormQuestion.from_dict(q, i) for i, q in enumerate(raw_questions)]
+        if len({q.id for q in questions}) != len(questions):
+            raise ValueError("質問のidが重複しています")
+
+        timeout = args.get('timeout', self.timeout)
+        default_answer = args.get('default_answer', self.default_answer)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        prompts = [q.prompt() for q in questions]
+        replies = await cassette.call(
+            "human_form",
+            {"questions": prompts},
+            lambda: self.channel.ask_form(prompts, timeout)
+        )
+
+        answers: Dict[str, Any] = {}
+        defaulted: List[str] = []
+        for question, reply in zip(questions, replies):
+            error = None
+            for attempt in range(MAX_FORM_RETRIES + 1):
+                if reply is None:
+                    break
+                try:
+                    answers[question.id] = question.parse(reply)
+                    break
+                except ValueError as e:
+                    error = str(e)
+                if attempt == MAX_FORM_RETRIES:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    reply = None
+                    break
+                try:
+                    reply = await self._get_user_input(f"{question.prompt()}\n（{error}）", remaining)
+                except asyncio.TimeoutError:
+                    reply = None
+            if question.id in answers:
+                continue
+
+            fallback = question.default if question.default is not None else default_answer
+            if fallback is None:
+                if reply is None:
+                    raise ValueError(f"{timeout}秒以内に「{question.question}」への回答がありませんでした")
+                raise ValueError(f"「{question.question}」の回答が不正です: {error}")
+            # 既定の回答も入力された回答と同じ形で返す
+            try:
+                answers[question.id] = question.parse_default(fallback)
+            except ValueError as e:
+                raise ValueError(f"「{question.question}」の既定の回答が不正です: {str(e)}")
+            defaulted.append(question.id)
+
+        payload: Dict[str, Any] = {"answers": answers, "success": True}
+        if defaulted:
+            # 時間切れや不正な回答のため既定の回答を使った質問
+            payload["defaulted"] = defaulted
+        return json.dumps({"result": payload}, ensure_ascii=False)
+
+    async def _get_user_input(self, question: str, timeout: Optional[float] = None) -> str:
+        """チャネル経由で質問し、回答を待つ"""
+        return await cassette.call(
+            "human",
+            {"question": question},
+            lambda: self.channel.ask(question, timeout)
+        )
+
+    def close(self):
+        """入力チャネルを閉じる"""
+        self.channel.close()
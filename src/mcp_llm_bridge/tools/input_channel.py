@@ -0,0 +1,174 @@
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import codecs
+import itertools
+import os
+import select
+import sys
+import time
+
+
+class InputChannel:
+    """ユーザーへの質問と回答の受け取りを抽象化する非同期チャネル
+
+    回答待ちはスレッドを使わずFutureを待つだけなので、多数の質問を同時に
+    保留してもスレッドは増えない。ask()にtimeoutを渡すとasyncio.TimeoutErrorになる。
+    """
+
+    async def ask(self, question: str, timeout: Optional[float] = None) -> str:
+        """質問を送り、回答を待つ"""
+        return await asyncio.wait_for(self._ask(question), timeout)
+
+    async def _ask(self, question: str) -> str:
+        raise NotImplementedError
+
+    async def ask_form(self, questions: List[str], timeout: Optional[float] = None) -> List[Optional[str]]:
+        """複数の質問をまとめて尋ね、回答のリストを返す
+
+        timeoutはフォーム全体の制限時間。時間内に回答されなかった質問はNoneになる。
+        既定では1問ずつ順にask()する。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        answers: List[Optional[str]] = [None] * len(questions)
+        for index, question in enumerate(questions):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                answers[index] = await self.ask(question, remaining)
+            except asyncio.TimeoutError:
+                break
+        return answers
+
+    def close(self):
+        """チャネルが持つリソースを解放"""
+
+
+class StdinInputChannel(InputChannel):
+    """端末（標準入力）で質問するチャネル
+
+    質問中だけ標準入力のファイルディスクリプタをイベントループに登録し、
+    読めるようになったら1行ずつ取り出す。add_readerが使えないイベントループ
+    （WindowsのProactorEventLoopなど）ではスレッドで1行読む方式に切り替える。
+    """
+
+    def __init__(self, fd: Optional[int] = None):
+        self.fd = fd
+        self._buffer = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._lines: Optional[asyncio.Queue] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _fileno(self) -> int:
+        return sys.stdin.fileno() if self.fd is None else self.fd
+
+    async def _ask(self, question: str) -> str:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._lines = asyncio.Queue()
+        # 端末は1つなので、質問は1件ずつ順番に表示する
+        async with self._lock:
+            # 前の質問がタイムアウトした後に届いた回答を、次の質問の回答にしない
+            self._discard_pending()
+            print("\n🤖 " + question)
+            print("👤 ", end='', flush=True)
+            return await self._read_line()
+
+    async def ask_form(self, questions: List[str], timeout: Optional[float] = None) -> List[Optional[str]]:
+        print(f"\n🤖 {len(questions)}つ質問させてください。")
+        return await super().ask_form(questions, timeout)
+
+    def _discard_pending(self):
+        """読み取り済みの行と、まだ読んでいない入力を捨てる"""
+        while not self._lines.empty():
+            self._lines.get_nowait()
+        self._buffer = ""
+        fd = self._fileno()
+        try:
+            while select.select([fd], [], [], 0)[0]:
+                if not os.read(fd, 4096):
+                    break
+        except (OSError, ValueError):
+            # selectが使えない入力（Windowsのコンソールなど）は捨てずに進む
+            pass
+
+    async def _read_line(self) -> str:
+        loop = asyncio.get_running_loop()
+        fd = self._fileno()
+        try:
+            loop.add_reader(fd, self._on_readable, fd)
+        except (NotImplementedError, ValueError, OSError):
+            return (await asyncio.to_thread(sys.stdin.readline)).rstrip("\n")
+        try:
+            return await self._lines.get()
+        finally:
+            loop.remove_reader(fd)
+
+    def _on_readable(self, fd: int):
+        try:
+            data = os.read(fd, 4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        if not data:
+            # 入力が閉じられた場合は残りを最後の行として渡す
+            asyncio.get_running_loop().remove_reader(fd)
+            self._lines.put_nowait(self._buffer + self._decoder.decode(b"", final=True))
+            self._buffer = ""
+            return
+        self._buffer += self._decoder.decode(data)
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self._lines.put_nowait(line.rstrip("\r"))
+
+
+class QueueInputChannel(InputChannel):
+    """キュー経由で質問を外部（WebSocketハンドラなど）に渡すサーバー向けチャネル
+
+    質問は(question_id, question)としてoutgoingキューに積まれる。外部から
+    answer(question_id, text)を呼ぶと、その質問を待っているask()が戻る。
+    ask_form()では質問のリストを1件として積み、回答も文字列のリストで受け取る。
+    """
+
+    def __init__(self):
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    async def _ask(self, question: Any) -> Any:
+        question_id = str(next(self._ids))
+        future = asyncio.get_running_loop().create_future()
+        self._pending[question_id] = future
+        try:
+            self.outgoing.put_nowait((question_id, question))
+            return await future
+        finally:
+            self._pending.pop(question_id, None)
+
+    async def ask_form(self, questions: List[str], timeout: Optional[float] = None) -> List[Optional[str]]:
+        try:
+            answers = await asyncio.wait_for(self._ask(list(questions)), timeout)
+        except asyncio.TimeoutError:
+            return [None] * len(questions)
+        answers = list(answers)[:len(questions)]
+        return answers + [None] * (len(questions) - len(answers))
+
+    async def next_question(self) -> Tuple[str, Any]:
+        """次の質問(question_id, question)を取り出す（フォームの場合questionはリスト）"""
+        return await self.outgoing.get()
+
+    def answer(self, question_id: str, text: Any) -> bool:
+        """質問に回答する（フォームには文字列のリストで回答）。待っている質問が無ければFalse"""
+        future = self._pending.get(question_id)
+        if future is None or future.done():
+            return False
+        future.set_result(text)
+        return True
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def close(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
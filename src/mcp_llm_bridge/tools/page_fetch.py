@@ -0,0 +1,217 @@
+"""
+Page fetching stage for search results.
+Fetches result URLs concurrently, streams each body under a byte cap, extracts the main
+text incrementally and returns short excerpts relevant to the search query.
+"""
+
+from typing import Callable, Dict, List, Any
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+import asyncio
+import codecs
+import logging
+import math
+import re
+import aiohttp
+from mcp_llm_bridge.cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Elements whose content is never part of the main text
+SKIP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "iframe", "canvas",
+    "nav", "header", "footer", "aside", "form", "button", "select"
+}
+
+# Elements that end a block of text
+BLOCK_TAGS = {
+    "p", "div", "li", "ul", "ol", "br", "tr", "td", "th", "table", "section", "article",
+    "main", "blockquote", "pre", "dd", "dt", "h1", "h2", "h3", "h4", "h5", "h6"
+}
+
+CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+class TextExtractor(HTMLParser):
+    """Incremental HTML to text-block extractor; feed() it chunks as they arrive"""
+
+    def __init__(self, max_chars: int = 20000):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title = ""
+        self.blocks: List[str] = []
+        self._current: List[str] = []
+        self._skip_depth = 0
+        self._in_title = False
+        self._chars = 0
+
+    @property
+    def full(self) -> bool:
+        """True once enough text has been collected"""
+        return self._chars >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data.strip()
+        elif not self._skip_depth and not self.full:
+            self._current.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        text = " ".join("".join(self._current).split())
+        self._current = []
+        if len(text) >= 2:
+            self.blocks.append(text)
+            self._chars += len(text)
+
+
+def query_terms(query: str) -> List[str]:
+    """Split a query into match terms, using character bigrams for CJK words"""
+    terms = []
+    for word in normalize_query(query).split():
+        if CJK_RE.search(word) and len(word) > 2:
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+
+def select_excerpt(blocks: List[str], query: str, max_chars: int) -> str:
+    """Pick the blocks most relevant to the query, in document order, within max_chars"""
+    if not blocks:
+        return ""
+    terms = query_terms(query)
+    scored = []
+    for index, block in enumerate(blocks):
+        folded = normalize_query(block)
+        hits = sum(folded.count(term) for term in terms)
+        if hits:
+            scored.append((hits / (1 + math.log(len(block))), index))
+
+    if scored:
+        chosen = [index for _, index in sorted(scored, reverse=True)]
+    else:
+        # Nothing matched: fall back to the lead of the page
+        chosen = list(range(len(blocks)))
+
+    picked = []
+    used = 0
+    for index in chosen:
+        block = blocks[index]
+        remaining = max_chars - used
+        if remaining <= 20:
+            break
+        if len(block) > remaining:
+            block = block[:remaining - 1] + "…"
+        picked.append((index, block))
+        used += len(block) + 1
+    return "\n".join(block for _, block in sorted(picked))
+
+
+class PageFetcher:
+    """Fetches pages concurrently with global and per-host limits"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], aiohttp.ClientSession],
+        max_bytes: int = 512 * 1024,
+        max_concurrency: int = 5,
+        per_host: int = 2,
+        timeout: float = 8.0,
+        excerpt_chars: int = 600
+    ):
+        self.session_factory = session_factory
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.excerpt_chars = excerpt_chars
+        self.per_host = per_host
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).hostname or ""
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self._host_semaphores[host]
+
+    async def fetch_excerpts(self, results: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+        """Return copies of results with an excerpt (or fetch_error) for each linked page"""
+        async def run(result: Dict[str, Any]) -> Dict[str, Any]:
+            enriched = dict(result)
+            link = result.get("link")
+            if not link:
+                return enriched
+            try:
+                excerpt = await self.fetch_excerpt(link, query)
+                if excerpt:
+                    enriched["excerpt"] = excerpt
+                else:
+                    enriched["fetch_error"] = "No readable text"
+            except Exception as e:
+                logger.info(f"Page fetch failed for {link}: {str(e)}")
+                enriched["fetch_error"] = str(e) or type(e).__name__
+            return enriched
+
+        return list(await asyncio.gather(*(run(result) for result in results)))
+
+    async def fetch_excerpt(self, url: str, query: str) -> str:
+        """Fetch a single page and return the excerpt most relevant to query"""
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise ValueError("Unsupported URL scheme")
+
+        async with self._semaphore, self._host_semaphore(url):
+            extractor = await asyncio.wait_for(self._stream_text(url), self.timeout)
+        return select_excerpt(extractor.blocks, query, self.excerpt_chars)
+
+    async def _stream_text(self, url: str) -> TextExtractor:
+        session = self.session_factory()
+        headers = {
+            "User-Agent": "Mozilla/5.0 (compatible; mcp-llm-bridge)",
+            "Accept": "text/html,application/xhtml+xml,text/plain;q=0.8"
+        }
+        async with session.get(url, headers=headers, allow_redirects=True) as response:
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status}")
+            content_type = response.headers.get("Content-Type", "")
+            if content_type and not content_type.startswith(("text/", "application/xhtml")):
+                raise ValueError(f"Unsupported content type: {content_type.split(';')[0]}")
+
+            try:
+                decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+            extractor = TextExtractor()
+            received = 0
+            async for chunk in response.content.iter_chunked(16 * 1024):
+                chunk = chunk[:self.max_bytes - received]
+                received += len(chunk)
+                extractor.feed(decoder.decode(chunk))
+                if received >= self.max_bytes or extractor.full:
+                    break
+            extractor.feed(decoder.decode(b"", final=True))
+            extractor.close()
+            return extractor
@@ -3,12 +3,196 @@ Google Search tool for MCP LLM Bridge using SerpAPI.
 Provides functionality to perform Google searches and return formatted results.
 """
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+from dataclasses import dataclass, field, asdict
 import os
+import asyncio
 import logging
+import sqlite3
 import aiohttp
 import json
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+from mcp_llm_bridge.cache import SQLiteCache, TieredCache, TTLCache, normalize_query
+from mcp_llm_bridge.tools.page_fetch import PageFetcher
+from mcp_llm_bridge.cassette import cassette
+from mcp_llm_bridge.ratelimit import SERPAPI, limiters, parse_retry_after
+
+# Bump when the cached payload format changes so stale on-disk entries are ignored
+CACHE_VERSION = 2
+
+# Reciprocal rank fusion constant (Cormack et al.); larger values flatten the rank weights
+RRF_K = 60
+
+# Query parameters that never change the page content
+TRACKING_PARAMS = {"gclid", "fbclid", "yclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+# Knowledge graph keys that are structural rather than facts about the entity
+KNOWLEDGE_GRAPH_SKIP_KEYS = {
+    "title", "type", "description", "source", "kgmid", "knowledge_graph_search_link",
+    "serpapi_knowledge_graph_search_link", "header_images", "image", "thumbnail", "entity_type"
+}
+
+
+@dataclass
+class AnswerBox:
+    """Direct answer shown above the organic results"""
+    answer: Optional[str] = None
+    title: Optional[str] = None
+    snippet: Optional[str] = None
+    link: Optional[str] = None
+
+
+@dataclass
+class KnowledgeGraph:
+    """Entity panel shown beside the organic results"""
+    title: Optional[str] = None
+    type: Optional[str] = None
+    description: Optional[str] = None
+    attributes: Dict[str, str] = field(default_factory=dict)
+    link: Optional[str] = None
+
+
+@dataclass
+class TopStory:
+    """News item from the top stories carousel"""
+    title: Optional[str] = None
+    source: Optional[str] = None
+    date: Optional[str] = None
+    link: Optional[str] = None
+
+
+@dataclass
+class RelatedQuestion:
+    """Entry from the "People also ask" block"""
+    question: Optional[str] = None
+    snippet: Optional[str] = None
+    link: Optional[str] = None
+
+
+@dataclass
+class SearchHighlights:
+    """Answer-bearing SerpAPI blocks other than the organic results"""
+    answer_box: Optional[AnswerBox] = None
+    knowledge_graph: Optional[KnowledgeGraph] = None
+    top_stories: List[TopStory] = field(default_factory=list)
+    related_questions: List[RelatedQuestion] = field(default_factory=list)
+
+    @classmethod
+    def from_serpapi(cls, data: Dict[str, Any], max_items: int = 3) -> "SearchHighlights":
+        """Extract the highlight blocks from a raw SerpAPI response"""
+        highlights = cls()
+
+        if isinstance(box := data.get("answer_box"), dict):
+            answer = box.get("answer") or box.get("result")
+            if not answer and isinstance(box.get("list"), list):
+                answer = " / ".join(str(item) for item in box["list"][:5])
+            highlights.answer_box = AnswerBox(
+                answer=answer,
+                title=box.get("title"),
+                snippet=box.get("snippet"),
+                link=box.get("link")
+            )
+
+        if isinstance(graph := data.get("knowledge_graph"), dict):
+            attributes = {
+                key: value for key, value in graph.items()
+                if isinstance(value, str) and key not in KNOWLEDGE_GRAPH_SKIP_KEYS
+                and not key.endswith(("_link", "_links"))
+            }
+            source = graph.get("source") if isinstance(graph.get("source"), dict) else {}
+            highlights.knowledge_graph = KnowledgeGraph(
+                title=graph.get("title"),
+                type=graph.get("type"),
+                description=graph.get("description"),
+                attributes=dict(list(attributes.items())[:8]),
+                link=source.get("link")
+            )
+
+        for story in (data.get("top_stories") or [])[:max_items]:
+            if isinstance(story, dict):
+                highlights.top_stories.append(TopStory(
+                    title=story.get("title"),
+                    source=story.get("source") if isinstance(story.get("source"), str) else None,
+                    date=story.get("date"),
+                    link=story.get("link")
+                ))
+
+        for question in (data.get("related_questions") or [])[:max_items]:
+            if isinstance(question, dict) and question.get("question"):
+                highlights.related_questions.append(RelatedQuestion(
+                    question=question.get("question"),
+                    snippet=question.get("snippet"),
+                    link=question.get("link")
+                ))
+
+        return highlights
+
+    def to_dict(self, budget: int = 1500) -> Dict[str, Any]:
+        """Serialise to a compact dict whose JSON size stays within budget characters
+
+        Empty fields are dropped; if the result is still too large, the least
+        useful items go first (related questions, then top stories, then
+        knowledge graph attributes) before long strings are truncated.
+        """
+        compact = _drop_empty(asdict(self))
+
+        def size() -> int:
+            return len(json.dumps(compact, ensure_ascii=False))
+
+        for key in ("related_questions", "top_stories"):
+            while size() > budget and compact.get(key):
+                compact[key].pop()
+                if not compact[key]:
+                    del compact[key]
+        graph = compact.get("knowledge_graph", {})
+        while size() > budget and graph.get("attributes"):
+            graph["attributes"].popitem()
+            if not graph["attributes"]:
+                del graph["attributes"]
+
+        limit = 400
+        while size() > budget and limit >= 25:
+            compact = _truncate_strings(compact, limit)
+            limit //= 2
+        return compact
+
+
+def _drop_empty(value: Any) -> Any:
+    """Recursively remove None values and empty containers"""
+    if isinstance(value, dict):
+        cleaned = {k: _drop_empty(v) for k, v in value.items()}
+        return {k: v for k, v in cleaned.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [v for v in (_drop_empty(v) for v in value) if v not in (None, "", [], {})]
+    return value
+
+
+def _truncate_strings(value: Any, limit: int) -> Any:
+    """Recursively shorten strings longer than limit, except links"""
+    if isinstance(value, dict):
+        return {k: v if k == "link" else _truncate_strings(v, limit) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_truncate_strings(v, limit) for v in value]
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit - 1] + "…"
+    return value
+
+
+def canonical_url(url: str) -> str:
+    """Reduce a URL to a canonical form for de-duplication"""
+    parts = urlsplit(url.strip())
+    host = parts.hostname or ""
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.startswith("utm_") and k not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("", host, path, urlencode(query), ""))
+
 
 class GoogleSearchTool:
     """Tool for performing Google searches using SerpAPI"""
@@ -18,7 +202,47 @@ class GoogleSearchTool:
         if not self.api_key:
             raise ValueError("SERPAPI_KEY environment variable is required")
         self.logger = logging.getLogger(__name__)
-        self.base_url = "https://serpapi.com/search"
+        self.base_url = os.getenv("SERPAPI_BASE_URL", "https://serpapi.com/search")
+        self.cache = self._create_cache()
+        self.batch_concurrency = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "4"))
+        self.highlights_budget = int(os.getenv("SEARCH_HIGHLIGHTS_BUDGET", "1500"))
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.page_fetcher = PageFetcher(
+            self._get_session,
+            max_bytes=int(os.getenv("PAGE_FETCH_MAX_BYTES", str(512 * 1024))),
+            max_concurrency=int(os.getenv("PAGE_FETCH_CONCURRENCY", "5")),
+            per_host=int(os.getenv("PAGE_FETCH_PER_HOST", "2")),
+            timeout=float(os.getenv("PAGE_FETCH_TIMEOUT", "8"))
+        )
+
+    def _create_cache(self) -> TieredCache:
+        """Create the search result cache from environment settings"""
+        ttl = float(os.getenv("SEARCH_CACHE_TTL", "21600"))
+        memory = TTLCache(
+            max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "256")),
+            ttl=ttl
+        )
+        disk = None
+        db_path = os.getenv("SEARCH_CACHE_DB", "search_cache.db")
+        if db_path:
+            try:
+                disk = SQLiteCache(db_path, ttl=ttl)
+            except sqlite3.Error as e:
+                self.logger.warning(f"Search cache disabled on disk: {str(e)}")
+        return TieredCache(memory, disk)
+
+    @staticmethod
+    def cache_key(query: str, num_results: int, start: int = 0) -> str:
+        """Build the cache key for a query, result count and page offset"""
+        return f"v{CACHE_VERSION}:{num_results}:{start}:{normalize_query(query)}"
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300)
+            )
+        return self._session
     
     def get_tool_spec(self) -> Dict[str, Any]:
         """Get the tool specification in MCP format"""
@@ -38,54 +262,229 @@ class GoogleSearchTool:
                         "default": 5,
                         "minimum": 1,
                         "maximum": 10
+                    },
+                    "fetch_pages": {
+                        "type": "integer",
+                        "description": "Fetch the top N result pages and attach query-relevant excerpts (max 5)",
+                        "default": 0,
+                        "minimum": 0,
+                        "maximum": 5
                     }
                 },
                 "required": ["query"]
             }
         }
+
+    def get_batch_tool_spec(self) -> Dict[str, Any]:
+        """Get the batch search tool specification in MCP format"""
+        return {
+            "name": "google_search_batch",
+            "description": "Run several Google searches (and/or result pages) at once and "
+                           "return one merged, de-duplicated ranking",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "queries": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Query variants to search (max 5)",
+                        "minItems": 1,
+                        "maxItems": 5
+                    },
+                    "pages": {
+                        "type": "integer",
+                        "description": "Result pages to fetch per query (max 3)",
+                        "default": 1,
+                        "minimum": 1,
+                        "maximum": 3
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": "Number of merged results to return (max 30)",
+                        "default": 10,
+                        "minimum": 1,
+                        "maximum": 30
+                    },
+                    "fetch_pages": {
+                        "type": "integer",
+                        "description": "Fetch the top N merged result pages and attach query-relevant excerpts (max 5)",
+                        "default": 0,
+                        "minimum": 0,
+                        "maximum": 5
+                    }
+                },
+                "required": ["queries"]
+            }
+        }
     
-    async def execute(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Execute a Google search and return results"""
+    async def execute(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute a Google search and return the organic results plus any highlights"""
         query = params.get("query")
         if not query:
             raise ValueError("Query parameter is required")
             
         num_results = min(params.get("num_results", 5), 10)
-        
+
+        payload = await self._cached_search(query, num_results)
+        results = await self._attach_excerpts(payload["results"], query, params.get("fetch_pages", 0))
+        return {**payload, "results": results}
+
+    async def execute_batch(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Fan several queries/pages out concurrently and merge them with reciprocal rank fusion"""
+        queries = params.get("queries")
+        if isinstance(queries, str):
+            queries = [queries]
+        queries = [q for q in (queries or []) if isinstance(q, str) and q.strip()]
+        if not queries:
+            raise ValueError("Queries parameter is required")
+
+        # Variants that normalise to the same key are searched only once
+        unique: Dict[str, str] = {}
+        for q in queries:
+            unique.setdefault(normalize_query(q), q)
+        unique_queries = list(unique.values())[:5]
+        pages = max(1, min(int(params.get("pages", 1)), 3))
+        max_results = max(1, min(int(params.get("max_results", 10)), 30))
+
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def run(query: str, page: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._cached_search(query, 10, start=page * 10)
+
+        jobs = [(query, page) for query in unique_queries for page in range(pages)]
+        outcomes = await asyncio.gather(
+            *(run(query, page) for query, page in jobs),
+            return_exceptions=True
+        )
+
+        rankings = []
+        failed = []
+        highlights = None
+        for (query, page), outcome in zip(jobs, outcomes):
+            if isinstance(outcome, Exception):
+                self.logger.warning(f"Batch search failed for {query!r} (page {page + 1}): {outcome}")
+                failed.append({"query": query, "page": page + 1, "error": str(outcome)})
+            else:
+                rankings.append((page * 10, outcome["results"]))
+                # Keep the highlights of the first query that has any
+                if highlights is None and outcome.get("highlights"):
+                    highlights = outcome["highlights"]
+
+        if not rankings:
+            raise ValueError(f"All batch searches failed: {failed[0]['error']}")
+
+        merged = self.merge_rankings(rankings, max_results)
+        merged = await self._attach_excerpts(merged, unique_queries[0], params.get("fetch_pages", 0))
+        response: Dict[str, Any] = {"queries": unique_queries, "results": merged}
+        if highlights:
+            response["highlights"] = highlights
+        if failed:
+            response["failed"] = failed
+        return response
+
+    @staticmethod
+    def merge_rankings(rankings: List[Any], max_results: int) -> List[Dict[str, Any]]:
+        """Merge ranked result lists by reciprocal rank fusion, de-duplicating by canonical URL
+
+        rankings is a list of (rank_offset, results) pairs; rank_offset places later
+        pages of the same query below its first page.
+        """
+        merged: Dict[str, Dict[str, Any]] = {}
+        for offset, results in rankings:
+            for rank, result in enumerate(results, start=offset + 1):
+                link = result.get("link")
+                if not link:
+                    continue
+                key = canonical_url(link)
+                entry = merged.get(key)
+                if entry is None:
+                    entry = merged[key] = {
+                        "title": result.get("title"),
+                        "link": link,
+                        "snippet": result.get("snippet"),
+                        "score": 0.0,
+                        "hits": 0
+                    }
+                elif not entry["snippet"] and result.get("snippet"):
+                    entry["snippet"] = result.get("snippet")
+                entry["score"] += 1.0 / (RRF_K + rank)
+                entry["hits"] += 1
+
+        ranked = sorted(merged.values(), key=lambda e: e["score"], reverse=True)[:max_results]
+        for position, entry in enumerate(ranked, start=1):
+            entry["position"] = position
+            entry["score"] = round(entry["score"], 4)
+        return ranked
+
+    async def _attach_excerpts(self, results: List[Dict[str, Any]], query: str, fetch_pages: Any) -> List[Dict[str, Any]]:
+        """Fetch the top fetch_pages results and attach page excerpts"""
+        fetch_pages = max(0, min(int(fetch_pages or 0), 5))
+        if not fetch_pages or not results:
+            return results
+        fetched = await cassette.call(
+            "page_fetch",
+            {"links": [r.get("link") for r in results[:fetch_pages]], "query": query},
+            lambda: self.page_fetcher.fetch_excerpts(results[:fetch_pages], query)
+        )
+        return fetched + results[fetch_pages:]
+
+    async def _cached_search(self, query: str, num_results: int, start: int = 0) -> Dict[str, Any]:
+        """Run a search through the result cache"""
+        key = self.cache_key(query, num_results, start)
+        return await self.cache.get_or_fetch(key, lambda: cassette.call(
+            "search",
+            {"query": query, "num_results": num_results, "start": start},
+            lambda: self._search(query, num_results, start)
+        ))
+
+    async def _search(self, query: str, num_results: int, start: int = 0) -> Dict[str, Any]:
+        """Call SerpAPI and format the organic results and highlights"""
         search_params = {
             "q": query,
             "num": num_results,
             "api_key": self.api_key,
             "engine": "google"
         }
+        if start:
+            search_params["start"] = start
         
         url = f"{self.base_url}?{urlencode(search_params)}"
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise ValueError(f"SerpAPI request failed: {error_text}")
-                    
-                    data = await response.json()
-                    
-                    if "error" in data:
-                        raise ValueError(f"SerpAPI error: {data['error']}")
-                    
-                    organic_results = data.get("organic_results", [])
-                    formatted_results = []
-                    
-                    for result in organic_results[:num_results]:
-                        formatted_results.append({
-                            "title": result.get("title"),
-                            "link": result.get("link"),
-                            "snippet": result.get("snippet"),
-                            "position": result.get("position")
-                        })
-                    
-                    return formatted_results
-                    
+            session = self._get_session()
+            grant = await limiters.acquire(SERPAPI)
+            async with session.get(url) as response:
+                if response.status == 429:
+                    grant.throttled(parse_retry_after(response.headers.get("Retry-After")))
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise ValueError(f"SerpAPI request failed: {error_text}")
+                
+                data = await response.json()
+                
+                if "error" in data:
+                    raise ValueError(f"SerpAPI error: {data['error']}")
+                
+                organic_results = data.get("organic_results", [])
+                formatted_results = []
+                
+                for result in organic_results[:num_results]:
+                    formatted_results.append({
+                        "title": result.get("title"),
+                        "link": result.get("link"),
+                        "snippet": result.get("snippet"),
+                        "position": result.get("position")
+                    })
+                
+                payload: Dict[str, Any] = {"results": formatted_results}
+                # Later pages repeat the first page's answer blocks
+                if not start:
+                    highlights = SearchHighlights.from_serpapi(data).to_dict(self.highlights_budget)
+                    if highlights:
+                        payload["highlights"] = highlights
+                return payload
+                
         except aiohttp.ClientError as e:
             self.logger.error(f"Network error during search: {str(e)}")
             raise ValueError(f"Network error during search: {str(e)}")
@@ -94,4 +493,10 @@ class GoogleSearchTool:
             raise ValueError(f"Failed to parse search results: {str(e)}")
         except Exception as e:
             self.logger.error(f"Unexpected error during search: {str(e)}")
-            raise ValueError(f"Search failed: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"Search failed: {str(e)}")
+
+    async def close(self):
+        """Release the pooled session and the search cache"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self.cache.close()
@@ -1,14 +1,32 @@
 import os
+import asyncio
+import functools
 import logging
+import time
 import spotipy
+from concurrent.futures import ThreadPoolExecutor
 from spotipy.oauth2 import SpotifyOAuth
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
 from dataclasses import dataclass
-import time
 import json
+import re
+from mcp_llm_bridge.cache import TTLCache, normalize_query
+from mcp_llm_bridge.tools.spotify_auth import AtomicCacheFileHandler, SpotifyTokenManager
+from mcp_llm_bridge.tools.spotify_state import SpotifyStateCache
+from mcp_llm_bridge.cassette import cassette
+from mcp_llm_bridge.ratelimit import SPOTIFY, Priority, limiters, parse_retry_after, priority_scope
 
 logger = logging.getLogger(__name__)
 
+# 再生状態ポーリングの初回間隔・最大間隔（秒）
+POLL_INITIAL_INTERVAL = 0.1
+POLL_MAX_INTERVAL = 0.8
+
+# 1回の操作で扱うトラック数の上限
+MAX_BATCH_TRACKS = 20
+
+DEVICE_NOT_FOUND_MESSAGE = "デバイスが見つかりません。Spotifyアプリを開いて、デバイスを有効にしてください。"
+
 @dataclass
 class SpotifyTool:
     """Spotifyの操作を行うツール"""
@@ -44,10 +62,39 @@ class SpotifyTool:
                 client_id=self.client_id,
                 client_secret=self.client_secret,
                 redirect_uri=self.redirect_uri,
-                open_browser=True
+                # ヘッドレス環境ではfalseにして、認可URLを端末に表示させる
+                open_browser=os.getenv("SPOTIFY_OPEN_BROWSER", "true").lower() == "true",
+                cache_handler=AtomicCacheFileHandler(os.getenv("SPOTIFY_TOKEN_CACHE", ".cache"))
+            )
+            # トークンはメモリに保持し、期限前にバックグラウンドで更新する
+            self.token_manager = SpotifyTokenManager(
+                auth_manager,
+                refresh_margin=float(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", "300"))
             )
-            self.sp = spotipy.Spotify(auth_manager=auth_manager)
+            self.sp = spotipy.Spotify(auth_manager=self.token_manager)
             logger.info("Spotify client initialized successfully")
+
+            # spotipyは同期APIなので、専用のスレッドプールで実行してイベントループを止めない
+            self._executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("SPOTIFY_MAX_WORKERS", "4")),
+                thread_name_prefix="spotify"
+            )
+            self.playback_timeout = float(os.getenv("SPOTIFY_PLAYBACK_TIMEOUT", "5"))
+
+            # デバイス・再生状態のキャッシュ（ブリッジと共有）
+            self.state = SpotifyStateCache(
+                self._fetch_devices,
+                lambda: self._call(self.sp.current_playback),
+                ttl=float(os.getenv("SPOTIFY_STATE_TTL", "5")),
+                refresh_interval=float(os.getenv("SPOTIFY_STATE_REFRESH", "15"))
+            )
+            self._background_tasks = set()
+            self._warming: Optional[asyncio.Task] = None
+
+            # 検索クエリ→トラック一覧、トラックID→メタデータのキャッシュ
+            cache_ttl = float(os.getenv("SPOTIFY_SEARCH_CACHE_TTL", "3600"))
+            self.search_cache = TTLCache(max_entries=128, ttl=cache_ttl)
+            self.track_cache = TTLCache(max_entries=512, ttl=cache_ttl)
         except Exception as e:
             logger.error(f"Failed to initialize Spotify client: {str(e)}")
             raise
@@ -62,68 +109,255 @@ class SpotifyTool:
                 "properties": {
                     "action": {
                         "type": "string",
-                        "enum": ["search", "play", "pause", "current_track", "add_to_queue"],
+                        "enum": ["search", "tracks", "play", "pause", "current_track", "add_to_queue"],
                         "description": "実行するアクション"
                     },
                     "query": {
                         "type": "string",
                         "description": "検索クエリ（searchアクション用）"
                     },
+                    "limit": {
+                        "type": "integer",
+                        "description": "検索結果の件数（searchアクション用、1-10）",
+                        "minimum": 1,
+                        "maximum": 10,
+                        "default": 5
+                    },
                     "track_id": {
                         "type": "string",
-                        "description": "トラックID（play/add_to_queueアクション用）"
+                        "description": "トラックID（play/add_to_queue/tracksアクション用）"
+                    },
+                    "track_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "複数のトラックID（play/add_to_queue/tracksアクション用、最大20件）"
+                    },
+                    "context_uri": {
+                        "type": "string",
+                        "description": "アルバム・プレイリスト・アーティストのURIまたはURL（playアクション用）"
                     }
                 },
                 "required": ["action"]
             }
         }
 
-    def get_devices(self) -> List[Dict[str, Any]]:
-        """利用可能なデバイスのリストを取得"""
+    async def _call(self, method: Callable[..., Any], *args, **kwargs) -> Any:
+        """spotipyの同期メソッドをスレッドプールで実行"""
+        return await cassette.call(
+            "spotify",
+            {"method": getattr(method, "__name__", repr(method)), "args": args, "kwargs": kwargs},
+            lambda: self._run_limited(functools.partial(method, *args, **kwargs))
+        )
+
+    async def _run_limited(self, call: Callable[[], Any]) -> Any:
+        """レート制限を通してからスレッドプールで実行し、429なら呼び出しを止める"""
+        grant = await limiters.acquire(SPOTIFY)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        except spotipy.SpotifyException as e:
+            if e.http_status == 429:
+                grant.throttled(parse_retry_after((e.headers or {}).get("Retry-After")))
+            raise
+
+    async def wait_for_playback(
+        self,
+        predicate: Callable[[Dict[str, Any]], bool],
+        timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """current_playbackをポーリングし、条件を満たした時点の再生状態を返す
+
+        間隔は短く始めて徐々に延ばし、期限までに条件を満たさなければNoneを返す。
+        """
+        deadline = time.monotonic() + (self.playback_timeout if timeout is None else timeout)
+        interval = POLL_INITIAL_INTERVAL
+        while True:
+            try:
+                playback = await self._call(self.sp.current_playback)
+                self.state.set_playback(playback)
+                if playback and predicate(playback):
+                    return playback
+            except Exception as e:
+                logger.warning(f"Error polling playback state: {str(e)}")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, POLL_MAX_INTERVAL)
+
+    async def _fetch_devices(self) -> List[Dict[str, Any]]:
+        """/me/player/devicesを呼び出す（キャッシュを通さない）"""
+        devices = await self._call(self.sp.devices)
+        return devices.get('devices', [])
+
+    async def get_devices(self, max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """利用可能なデバイスのリストを取得（TTL内はキャッシュを使用）"""
         try:
-            devices = self.sp.devices()
-            return devices.get('devices', [])
+            return await self.state.devices(max_age)
         except Exception as e:
             logger.error(f"Error getting devices: {str(e)}")
             return []
 
-    def get_active_device(self) -> Optional[Dict[str, Any]]:
+    async def get_active_device(self) -> Optional[Dict[str, Any]]:
         """アクティブなデバイスを取得"""
-        devices = self.get_devices()
+        devices = await self.get_devices()
         return next((d for d in devices if d['is_active']), None)
 
-    def get_best_device(self) -> Optional[Dict[str, Any]]:
+    async def get_best_device(self) -> Optional[Dict[str, Any]]:
         """最適なデバイスを取得"""
-        devices = self.get_devices()
+        devices = await self.get_devices()
         if not devices:
             return None
 
         # アクティブなデバイスを優先
-        active_device = self.get_active_device()
+        active_device = next((d for d in devices if d['is_active']), None)
         if active_device:
             return active_device
 
         # 最初のデバイスを使用
         return devices[0]
 
-    def ensure_device_ready(self) -> Optional[Dict[str, Any]]:
-        """デバイスの準備を確認"""
-        device = self.get_best_device()
+    async def ensure_device_ready(self, force_play: bool = True, wait: bool = True) -> Optional[Dict[str, Any]]:
+        """デバイスの準備を確認（既にアクティブなら転送しない）"""
+        device = await self.get_best_device()
         if not device:
             return None
+        if device.get('is_active'):
+            return device
 
         try:
             # デバイスをアクティブ化
-            self.sp.transfer_playback(
+            await self._call(
+                self.sp.transfer_playback,
                 device_id=device['id'],
-                force_play=True  # 強制的にアクティブ化
+                force_play=force_play
             )
-            time.sleep(1)  # アクティベーションの待機
+            self.state.mark_active(device['id'])
+            if wait:
+                # アクティベーションの反映を待つ（反映されなくてもdevice_id指定で再生できる）
+                await self.wait_for_playback(
+                    lambda playback: (playback.get('device') or {}).get('id') == device['id'],
+                    timeout=min(2.0, self.playback_timeout)
+                )
             return device
         except Exception as e:
             logger.error(f"Error activating device: {str(e)}")
             return None
 
+    @staticmethod
+    def _is_playing_context(playback: Dict[str, Any], context_uri: str) -> bool:
+        """再生状態が指定のアルバム・プレイリストの再生中を示しているか"""
+        if not playback.get('is_playing'):
+            return False
+        context = playback.get('context')
+        return not context or context.get('uri') == context_uri
+
+    @staticmethod
+    def _is_playing_track(playback: Dict[str, Any], track_id: str) -> bool:
+        """再生状態が指定トラックの再生中を示しているか（トラックのリンク差し替えも考慮）"""
+        if not playback.get('is_playing'):
+            return False
+        item = playback.get('item')
+        if not item:
+            return True
+        linked_from = item.get('linked_from') or {}
+        return track_id in (item.get('id'), linked_from.get('id'))
+
+    def warm_device(self):
+        """playが続く見込みのときに、デバイス一覧の取得とアクティブ化を先に済ませておく"""
+        if self._warming is not None and not self._warming.done():
+            return
+
+        async def warm():
+            try:
+                with priority_scope(Priority.PREFETCH):
+                    await self.ensure_device_ready(force_play=False, wait=False)
+            except Exception as e:
+                logger.debug(f"Device warm-up failed: {str(e)}")
+
+        self._warming = asyncio.create_task(warm())
+        self._background_tasks.add(self._warming)
+        self._warming.add_done_callback(self._background_tasks.discard)
+
+    def start(self):
+        """トークンと再生状態のバックグラウンド更新を開始"""
+        self.token_manager.start()
+        self.state.start()
+
+    def close(self):
+        """バックグラウンド処理とスレッドプールを解放"""
+        self.token_manager.stop()
+        self.state.stop()
+        for task in self._background_tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _format_track(track: Dict[str, Any]) -> Dict[str, Any]:
+        """トラックオブジェクトを応答用の簡潔な形式に変換"""
+        return {
+            "id": track["id"],
+            "name": track["name"],
+            "artist": track["artists"][0]["name"],
+            "album": track["album"]["name"],
+            "url": track["external_urls"]["spotify"]
+        }
+
+    @staticmethod
+    def _parse_id(value: str, kind: str = "track") -> str:
+        """URI・URL・IDのいずれからでもSpotify IDを取り出す"""
+        value = value.strip()
+        if value.startswith(f"spotify:{kind}:"):
+            return value.split(":")[-1]
+        if match := re.search(rf"open\.spotify\.com/(?:intl-[a-z]+/)?{kind}/([A-Za-z0-9]+)", value):
+            return match.group(1)
+        return value
+
+    @staticmethod
+    def _parse_context_uri(value: str) -> str:
+        """アルバム・プレイリスト・アーティストのURLをURIに変換"""
+        value = value.strip()
+        if match := re.search(r"open\.spotify\.com/(?:intl-[a-z]+/)?(album|playlist|artist)/([A-Za-z0-9]+)", value):
+            return f"spotify:{match.group(1)}:{match.group(2)}"
+        if re.fullmatch(r"spotify:(album|playlist|artist):[A-Za-z0-9]+", value):
+            return value
+        raise ValueError(f"Unsupported context_uri: {value}")
+
+    def _track_ids(self, parameters: Dict[str, Any], action: str) -> List[str]:
+        """track_ids（リスト）またはtrack_idからIDのリストを取り出す"""
+        ids = parameters.get("track_ids") or []
+        if isinstance(ids, str):
+            ids = [ids]
+        if track_id := parameters.get("track_id"):
+            ids = [track_id] + list(ids)
+        ids = [self._parse_id(i) for i in ids if isinstance(i, str) and i.strip()]
+        if not ids:
+            raise ValueError(f"{action} action requires track_id or track_ids parameter")
+        # 順序を保って重複を除く
+        return list(dict.fromkeys(ids))[:MAX_BATCH_TRACKS]
+
+    async def search_tracks(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """楽曲を検索（正規化したクエリでキャッシュ）"""
+        key = f"{limit}:{normalize_query(query)}"
+        tracks = self.search_cache.get(key)
+        if tracks is None:
+            results = await self._call(self.sp.search, q=query, limit=limit)
+            tracks = [self._format_track(track) for track in results["tracks"]["items"] if track]
+            self.search_cache.set(key, tracks)
+            for track in tracks:
+                self.track_cache.set(track["id"], track)
+        return tracks
+
+    async def get_tracks(self, track_ids: List[str]) -> List[Dict[str, Any]]:
+        """複数トラックのメタデータを取得（未キャッシュ分だけを50件単位でまとめて取得）"""
+        missing = [track_id for track_id in track_ids if self.track_cache.get(track_id) is None]
+        for start in range(0, len(missing), 50):
+            results = await self._call(self.sp.tracks, missing[start:start + 50])
+            for track in results.get("tracks", []):
+                if track:
+                    self.track_cache.set(track["id"], self._format_track(track))
+        return [track for track_id in track_ids if (track := self.track_cache.get(track_id))]
+
     async def execute(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """ツールを実行する"""
         action = parameters.get("action")
@@ -134,47 +368,66 @@ class SpotifyTool:
                     query = parameters.get("query")
                     if not query:
                         raise ValueError("search action requires query parameter")
-                    results = self.sp.search(q=query, limit=5)
-                    tracks = []
-                    for track in results["tracks"]["items"]:
-                        tracks.append({
-                            "id": track["id"],
-                            "name": track["name"],
-                            "artist": track["artists"][0]["name"],
-                            "album": track["album"]["name"],
-                            "url": track["external_urls"]["spotify"]
-                        })
+                    limit = max(1, min(int(parameters.get("limit", 5)), 10))
+                    tracks = await self.search_tracks(query, limit)
+                    if tracks:
+                        # 検索の次はplayが来ることが多いので、デバイスを先に準備しておく
+                        self.warm_device()
                     return {"tracks": tracks}
 
+                case "tracks":
+                    track_ids = self._track_ids(parameters, action)
+                    return {"tracks": await self.get_tracks(track_ids)}
+
                 case "play":
-                    track_id = parameters.get("track_id")
-                    if not track_id:
-                        raise ValueError("play action requires track_id parameter")
+                    context_uri = parameters.get("context_uri")
+                    if context_uri:
+                        context_uri = self._parse_context_uri(context_uri)
+                        track_ids = []
+                    else:
+                        track_ids = self._track_ids(parameters, action)
+
+                    # 先行して始めたデバイス準備があれば、その完了を待ってから確認する
+                    if self._warming is not None and not self._warming.done():
+                        await asyncio.shield(self._warming)
 
                     # デバイスの準備
-                    device = self.ensure_device_ready()
+                    device = await self.ensure_device_ready()
                     if not device:
                         return {
-                            "error": "デバイスが見つかりません。Spotifyアプリを開いて、デバイスを有効にしてください。",
+                            "error": DEVICE_NOT_FOUND_MESSAGE,
                             "status": "device_not_found"
                         }
 
                     try:
-                        # 再生を開始
-                        self.sp.start_playback(
-                            device_id=device['id'],
-                            uris=[f"spotify:track:{track_id}"]
-                        )
+                        # 再生を開始（複数トラックは1回のリクエストでまとめて渡す）
+                        if context_uri:
+                            await self._call(
+                                self.sp.start_playback,
+                                device_id=device['id'],
+                                context_uri=context_uri
+                            )
+                            predicate = functools.partial(self._is_playing_context, context_uri=context_uri)
+                        else:
+                            await self._call(
+                                self.sp.start_playback,
+                                device_id=device['id'],
+                                uris=[f"spotify:track:{track_id}" for track_id in track_ids]
+                            )
+                            predicate = functools.partial(self._is_playing_track, track_id=track_ids[0])
                         
-                        # 再生状態を確認
-                        time.sleep(1)
-                        current = self.sp.current_playback()
-                        if current and current.get('is_playing'):
-                            return {
-                                "status": "playing",
-                                "track_id": track_id,
-                                "device": device['name']
-                            }
+                        # 再生状態を確認（is_playingになった時点で返す）
+                        current = await self.wait_for_playback(predicate)
+                        if current:
+                            self.state.set_playback(current)
+                            result = {"status": "playing", "device": device['name']}
+                            if context_uri:
+                                result["context_uri"] = context_uri
+                            else:
+                                result["track_id"] = track_ids[0]
+                                if len(track_ids) > 1:
+                                    result["track_ids"] = track_ids
+                            return result
                         else:
                             return {
                                 "error": "再生の開始を確認できませんでした",
@@ -189,54 +442,59 @@ class SpotifyTool:
 
                 case "pause":
                     try:
-                        device = self.get_active_device()
+                        device = await self.get_active_device()
                         if not device:
                             return {"error": "No active device available"}
                         
-                        self.sp.pause_playback(device_id=device['id'])
+                        await self._call(self.sp.pause_playback, device_id=device['id'])
+                        self.state.mark_paused()
                         return {"status": "paused"}
                     except Exception as e:
                         logger.error(f"Error pausing playback: {str(e)}")
                         return {"error": f"Failed to pause playback: {str(e)}"}
 
                 case "current_track":
-                    current = self.sp.current_user_playing_track()
+                    current = await self.state.playback(max_age=1.0)
                     if not current or not current.get("item"):
                         return {"status": "no_track_playing"}
-                    track = current["item"]
                     return {
                         "status": "playing" if current["is_playing"] else "paused",
-                        "track": {
-                            "id": track["id"],
-                            "name": track["name"],
-                            "artist": track["artists"][0]["name"],
-                            "album": track["album"]["name"],
-                            "url": track["external_urls"]["spotify"]
-                        }
+                        "track": self._format_track(current["item"])
                     }
 
                 case "add_to_queue":
-                    track_id = parameters.get("track_id")
-                    if not track_id:
-                        raise ValueError("add_to_queue action requires track_id parameter")
+                    track_ids = self._track_ids(parameters, action)
                     
-                    device = self.get_active_device()
+                    device = await self.get_active_device()
                     if not device:
                         return {"error": "No active device available"}
 
+                    # キューへの追加APIは1曲ずつ。順序を保つため1曲ずつ待ち、レート制限も1リクエストずつ通す
+                    added: List[str] = []
                     try:
-                        self.sp.add_to_queue(
-                            uri=f"spotify:track:{track_id}",
-                            device_id=device['id']
-                        )
-                        return {
-                            "status": "added_to_queue",
-                            "track_id": track_id,
-                            "device": device['name']
-                        }
+                        for track_id in track_ids:
+                            await self._call(
+                                self.sp.add_to_queue,
+                                uri=f"spotify:track:{track_id}",
+                                device_id=device['id']
+                            )
+                            added.append(track_id)
                     except Exception as e:
                         logger.error(f"Error adding to queue: {str(e)}")
-                        return {"error": f"Failed to add to queue: {str(e)}"}
+                        result = {"error": f"Failed to add to queue: {str(e)}"}
+                        if added:
+                            # 追加済みの曲を返し、再試行で同じ曲を二重に追加しないようにする
+                            result.update(status="partially_added_to_queue", track_ids=added, device=device['name'])
+                        return result
+
+                    result = {
+                        "status": "added_to_queue",
+                        "track_id": added[0],
+                        "device": device['name']
+                    }
+                    if len(added) > 1:
+                        result["track_ids"] = added
+                    return result
 
                 case _:
                     raise ValueError(f"Unknown action: {action}")
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+from spotipy.cache_handler import CacheHandler
+from spotipy.oauth2 import SpotifyOAuth
+
+logger = logging.getLogger(__name__)
+
+# この秒数を切ったトークンは使わずに同期で更新する
+EXPIRY_GRACE = 30
+
+
+class AtomicCacheFileHandler(CacheHandler):
+    """トークンを一時ファイルに書いてからos.replaceで置き換えるキャッシュ
+
+    書き込み途中で落ちても、既存のキャッシュファイルが壊れることはない。
+    """
+
+    def __init__(self, cache_path: str = ".cache"):
+        self.cache_path = cache_path
+
+    def get_cached_token(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"トークンキャッシュを読み込めませんでした: {str(e)}")
+            return None
+
+    def save_token_to_cache(self, token_info: Dict[str, Any]):
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        fd, temp_path = tempfile.mkstemp(prefix=".spotify-token-", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(token_info, f)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"トークンキャッシュを保存できませんでした: {str(e)}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+
+class SpotifyTokenManager:
+    """アクセストークンをメモリに保持し、期限前にバックグラウンドで更新するauth_manager
+
+    spotipy.Spotifyのauth_managerとして渡す。get_access_token()はメモリ上の
+    トークンを返すだけで、期限が近づいたトークンの更新とキャッシュファイルへの
+    保存はバックグラウンドスレッドで行う。
+    """
+
+    def __init__(self, oauth: SpotifyOAuth, refresh_margin: float = 300.0, retry_interval: float = 30.0):
+        self.oauth = oauth
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._token_info: Optional[Dict[str, Any]] = oauth.cache_handler.get_cached_token()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refresh_count = 0
+
+    @staticmethod
+    def _expires_in(token_info: Optional[Dict[str, Any]]) -> float:
+        if not token_info or "expires_at" not in token_info:
+            return 0.0
+        return token_info["expires_at"] - time.time()
+
+    def get_access_token(self, as_dict: bool = False):
+        """現在のアクセストークンを返す（期限切れの場合のみ同期で更新）"""
+        token_info = self._token_info
+        expires_in = self._expires_in(token_info)
+        if expires_in <= EXPIRY_GRACE:
+            token_info = self.refresh()
+        elif expires_in <= self.refresh_margin:
+            # まだ使えるので、そのまま返してバックグラウンドに更新させる
+            self._wake.set()
+        return token_info if as_dict else token_info["access_token"]
+
+    def refresh(self) -> Dict[str, Any]:
+        """トークンを更新する（同時に呼ばれても更新は1回）"""
+        with self._lock:
+            token_info = self._token_info
+            if self._expires_in(token_info) > self.refresh_margin:
+                return token_info
+            if token_info and token_info.get("refresh_token"):
+                token_info = self.oauth.refresh_access_token(token_info["refresh_token"])
+            else:
+                # キャッシュが無い場合は通常の認可フローに任せる
+                token_info = self.oauth.get_access_token(as_dict=True)
+            self._token_info = token_info
+            self.refresh_count += 1
+            logger.info("Spotifyのアクセストークンを更新しました")
+            return token_info
+
+    def start(self):
+        """バックグラウンド更新スレッドを開始"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="spotify-token-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """バックグラウンド更新スレッドを停止"""
+        self._stopped.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            wait = self._expires_in(self._token_info) - self.refresh_margin
+            if self._token_info is None:
+                # 初回の認可はユーザー操作が必要なので、最初の利用時に任せる
+                wait = self.retry_interval
+            if wait > 0:
+                self._wake.wait(wait)
+                self._wake.clear()
+                if self._stopped.is_set():
+                    return
+                if self._token_info is None or \
+                        self._expires_in(self._token_info) > self.refresh_margin:
+                    continue
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Spotifyトークンのバックグラウンド更新に失敗: {str(e)}")
+                self._wake.wait(self.retry_interval)
+                self._wake.clear()
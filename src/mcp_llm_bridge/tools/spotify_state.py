@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from mcp_llm_bridge.ratelimit import Priority, priority_scope
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyStateCache:
+    """Spotifyのデバイス一覧と再生状態をTTL付きで共有するキャッシュ
+
+    SpotifyToolとMCPLLMBridgeの両方がこのキャッシュを参照する。TTL内の読み出しは
+    APIを呼ばず、期限切れの読み出しは同時に来た要求を1回の取得にまとめる。
+    start()するとバックグラウンドで定期的に更新する。
+    """
+
+    def __init__(
+        self,
+        fetch_devices: Callable[[], Awaitable[List[Dict[str, Any]]]],
+        fetch_playback: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        ttl: float = 5.0,
+        refresh_interval: float = 15.0
+    ):
+        self._fetch_devices = fetch_devices
+        self._fetch_playback = fetch_playback
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._devices: Optional[List[Dict[str, Any]]] = None
+        self._devices_at = 0.0
+        self._playback: Optional[Dict[str, Any]] = None
+        self._playback_at = 0.0
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._refresher: Optional[asyncio.Task] = None
+
+    def _fresh(self, fetched_at: float, max_age: Optional[float]) -> bool:
+        return time.monotonic() - fetched_at < (self.ttl if max_age is None else max_age)
+
+    async def _coalesced(self, name: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """同じ種類の取得が進行中ならその結果を待つ"""
+        task = self._pending.get(name)
+        if task is None or task.done():
+            task = asyncio.ensure_future(fetch())
+            self._pending[name] = task
+        return await asyncio.shield(task)
+
+    async def devices(self, max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """デバイス一覧を取得（TTL内ならキャッシュを返す）"""
+        if self._devices is not None and self._fresh(self._devices_at, max_age):
+            return self._devices
+
+        async def fetch():
+            devices = await self._fetch_devices()
+            self._devices = devices
+            self._devices_at = time.monotonic()
+            return devices
+
+        return await self._coalesced("devices", fetch)
+
+    async def playback(self, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """再生状態を取得（TTL内ならキャッシュを返す）"""
+        if self._playback_at and self._fresh(self._playback_at, max_age):
+            return self._playback
+
+        async def fetch():
+            playback = await self._fetch_playback()
+            self.set_playback(playback)
+            return playback
+
+        return await self._coalesced("playback", fetch)
+
+    def set_playback(self, playback: Optional[Dict[str, Any]]):
+        """取得済みの再生状態でキャッシュを更新"""
+        self._playback = playback
+        self._playback_at = time.monotonic()
+        device = (playback or {}).get("device")
+        if device and self._devices is not None:
+            self._mark_active(device.get("id"))
+
+    def mark_active(self, device_id: str):
+        """転送が完了したデバイスをアクティブとして記録"""
+        self._mark_active(device_id)
+
+    def _mark_active(self, device_id: Optional[str]):
+        if not device_id or self._devices is None:
+            return
+        self._devices = [
+            {**device, "is_active": device.get("id") == device_id}
+            for device in self._devices
+        ]
+
+    def mark_paused(self):
+        """一時停止を反映"""
+        if self._playback:
+            self._playback = {**self._playback, "is_playing": False}
+            self._playback_at = time.monotonic()
+
+    def invalidate(self):
+        """キャッシュを破棄して次回の読み出しで再取得させる"""
+        self._devices_at = 0.0
+        self._playback_at = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ブリッジ向けの再生状態の要約（APIは呼ばない）"""
+        playback = self._playback or {}
+        return {
+            "is_playing": bool(playback.get("is_playing")),
+            "current_track_id": (playback.get("item") or {}).get("id"),
+            "current_device": (playback.get("device") or {}).get("name")
+        }
+
+    def start(self):
+        """バックグラウンド更新を開始"""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        # 定期更新はターン中の呼び出しより後回しにする
+        with priority_scope(Priority.BACKGROUND):
+            await self._refresh_forever()
+
+    async def _refresh_forever(self):
+        while True:
+            try:
+                await asyncio.gather(self.devices(max_age=0), self.playback(max_age=0))
+            except Exception as e:
+                logger.warning(f"Spotify状態のバックグラウンド更新に失敗: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def stop(self):
+        """バックグラウンド更新と進行中の取得を止める"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
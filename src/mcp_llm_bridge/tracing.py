@@ -0,0 +1,306 @@
+"""
+ターン単位のスパン計測
+process_message・think・ツール操作・MCP呼び出し・音声合成の所要時間とトークン数を
+スパンとして記録し、OpenTelemetry(OTLP/JSON)互換の形式でJSONLファイルに書き出す。
+ターン（ルートスパン）が終わるたびにクリティカルパスの要約をログに出す。
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import json
+import logging
+import atexit
+import os
+import queue
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "mcp-llm-bridge"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_UNSET = object()
+# 書き込みスレッドを止める合図
+_STOP = object()
+
+
+@dataclass
+class Span:
+    """1区間の計測結果"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "OK"
+    status_message: str = ""
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSONのスパン表現に変換"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()
+            ],
+            "status": {"code": f"STATUS_CODE_{self.status}"}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class JsonlSpanExporter:
+    """スパンを1行1件のOTLP/JSON（resourceSpans）として追記する
+
+    export()はキューに積むだけで、ファイルへの書き込みは別スレッドで行う
+    （ログのQueueListenerと同じく、イベントループ上ではディスクI/Oをしない）。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        # 変換はスパンの終了時点の内容で行い、JSON化と書き込みだけを別スレッドに任せる
+        self._queue.put(span.to_otlp())
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        file = None
+        try:
+            while True:
+                otlp_span = self._queue.get()
+                try:
+                    if otlp_span is _STOP:
+                        return
+                    if file is None:
+                        directory = os.path.dirname(os.path.abspath(self.path))
+                        os.makedirs(directory, exist_ok=True)
+                        # 行バッファリングなので、書き出したスパンはすぐにファイルへ反映される
+                        file = open(self.path, "a", encoding="utf-8", buffering=1)
+                    record = {
+                        "resourceSpans": [{
+                            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                            "scopeSpans": [{"scope": {"name": __name__}, "spans": [otlp_span]}]
+                        }]
+                    }
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except Exception as e:
+                    logger.warning(f"スパンの書き出しに失敗: {str(e)}")
+                finally:
+                    self._queue.task_done()
+        finally:
+            if file is not None:
+                file.close()
+
+    def flush(self):
+        """キューに積んだスパンがすべて書き出されるまで待つ"""
+        self._queue.join()
+
+    def close(self):
+        """残りのスパンを書き出してから書き込みスレッドを止める"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+
+def critical_path(root: Span, spans: List[Span]) -> List[Span]:
+    """ルートスパンの終了から遡り、最後に終わった子スパンをたどった経路を返す"""
+    children: Dict[str, List[Span]] = {}
+    for span in spans:
+        if span.parent_id and span.end_ns is not None:
+            children.setdefault(span.parent_id, []).append(span)
+
+    def walk(span: Span) -> List[Span]:
+        path = [span]
+        cursor = span.end_ns
+        steps = []
+        for child in sorted(children.get(span.span_id, []), key=lambda s: s.end_ns, reverse=True):
+            if child.end_ns <= cursor:
+                steps.append(child)
+                cursor = child.start_ns
+        for child in reversed(steps):
+            path.extend(walk(child))
+        return path
+
+    return walk(root)
+
+
+def record_usage(span: Span, completion: Any):
+    """OpenAIのcompletion.usageからトークン数をスパンに記録"""
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "completion_tokens_details", None)
+    span.set_attributes({
+        "llm.usage.prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "llm.usage.completion_tokens": getattr(usage, "completion_tokens", None),
+        "llm.usage.reasoning_tokens": getattr(details, "reasoning_tokens", None),
+        "llm.usage.total_tokens": getattr(usage, "total_tokens", None)
+    })
+
+
+class Tracer:
+    """スパンを記録し、ターンごとに要約するトレーサー
+
+    スパンの親子関係はcontextvarsで引き継ぐので、asyncioのタスクをまたいでも
+    作成時点のスパンが親になる。親の無いスパンが1ターン（1トレース）になる。
+    """
+
+    def __init__(
+        self,
+        exporter: Optional[JsonlSpanExporter] = None,
+        exporter_factory: Optional[Callable[[], Optional[JsonlSpanExporter]]] = None
+    ):
+        self.exporter = exporter
+        # 環境変数は.envの読み込み後に参照したいので、最初のスパン終了時に作る
+        self._exporter_factory = exporter_factory
+        self._traces: Dict[str, List[Span]] = {}
+        self.last_summary: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name: str, parent: Any = _UNSET, **attributes) -> Iterator[Span]:
+        """スパンを開始し、ブロックを抜けたら終了する（例外はERRORとして記録）
+
+        parentを渡すと、現在のコンテキストではなくそのスパンを親にする
+        （バックグラウンドの処理をターンに紐づける場合など）。
+        """
+        parent_span = self.current_span() if parent is _UNSET else parent
+        span = Span(
+            name=name,
+            trace_id=parent_span.trace_id if parent_span else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent_span.span_id if parent_span else None
+        )
+        span.set_attributes(attributes)
+        if span.parent_id is None:
+            self._traces[span.trace_id] = []
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "ERROR"
+            span.status_message = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self._end(span)
+
+    def _end(self, span: Span):
+        span.end_ns = time.time_ns()
+        if self._exporter_factory is not None:
+            self.exporter = self._exporter_factory()
+            self._exporter_factory = None
+        if self.exporter is not None:
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                logger.warning(f"スパンの書き出しに失敗: {str(e)}")
+
+        spans = self._traces.get(span.trace_id)
+        if spans is None:
+            # ターンが終わった後に終了したスパン（音声再生など）は書き出しのみ
+            return
+        if span.parent_id is not None:
+            spans.append(span)
+            return
+        del self._traces[span.trace_id]
+        self.last_summary = self.summarize(span, spans)
+        logger.info(f"ターンの所要時間: {self.format_summary(self.last_summary)}")
+
+    @staticmethod
+    def summarize(root: Span, spans: List[Span]) -> Dict[str, Any]:
+        """ターンのクリティカルパスとトークン数を集計"""
+        tokens: Dict[str, int] = {}
+        for span in spans:
+            for key, value in span.attributes.items():
+                if key.startswith("llm.usage.") and isinstance(value, int):
+                    name = key[len("llm.usage."):]
+                    tokens[name] = tokens.get(name, 0) + value
+        path = critical_path(root, spans)
+        return {
+            "trace_id": root.trace_id,
+            "name": root.name,
+            "total_ms": round(root.duration_ms, 1),
+            "critical_path": [
+                {"name": span.name, "duration_ms": round(span.duration_ms, 1)}
+                for span in path[1:]
+            ],
+            "tokens": tokens
+        }
+
+    @staticmethod
+    def format_summary(summary: Dict[str, Any]) -> str:
+        steps = " → ".join(f"{step['name']} {step['duration_ms']:.0f}ms" for step in summary["critical_path"])
+        text = f"合計 {summary['total_ms']:.0f}ms"
+        if steps:
+            text += f"（{steps}）"
+        if summary["tokens"]:
+            text += " トークン: " + ", ".join(f"{k}={v}" for k, v in summary["tokens"].items())
+        return text
+
+    def flush(self):
+        """書き出し待ちのスパンをファイルに反映する"""
+        if self.exporter is not None:
+            self.exporter.flush()
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+def _exporter_from_env() -> Optional[JsonlSpanExporter]:
+    """TRACE_FILEが空ならファイルへの書き出しを行わない"""
+    path = os.getenv("TRACE_FILE", "traces.jsonl")
+    return JsonlSpanExporter(path) if path else None
+
+
+tracer = Tracer(exporter_factory=_exporter_from_env)
+atexit.register(tracer.close)
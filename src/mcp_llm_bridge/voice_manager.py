@@ -1,27 +1,89 @@
 import os
-import tempfile
+import re
+import json
+import io
+import hashlib
+import asyncio
 import logging
-import requests
+import contextlib
+import contextvars
+import aiohttp
 import pygame
-import atexit
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional
+from mcp_llm_bridge.cache import DiskLRUCache
+from mcp_llm_bridge.tracing import tracer
+from mcp_llm_bridge.cassette import cassette, encode_bytes, decode_bytes
+from mcp_llm_bridge.ratelimit import NIJIVOICE, Priority, limiters, parse_retry_after, priority_scope
+from mcp_llm_bridge.deadline import DeadlineExceeded, remaining_budget
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_VOICE_ACTOR_ID = "1fc717fe-ebf9-402b-9d8c-c59cda93d5dc"
+DOWNLOAD_CHUNK_BYTES = 16 * 1024
+
+# 文末とみなす位置（句点・感嘆符・疑問符・改行、英文のピリオド＋空白）
+SENTENCE_END = re.compile(r"(?<=[。！？!?…\n])|(?<=\.)(?=\s)")
+# 長すぎる文を区切る位置の候補
+SOFT_BREAK = re.compile(r"(?<=[、，,；;：:）)」』])|\s")
+# 日本語の文字（かな・漢字・全角記号）。これらの間は空白なしでつなぐ
+CJK_CHAR = re.compile(r"[\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def split_sentences(text: str, max_chars: int = 120) -> List[str]:
+    """読み上げ用にテキストを文単位・長さ上限付きのチャンクへ分割する
+
+    最初のチャンクは1文だけにして、最初の音声が出るまでの時間を短くする。
+    2つ目以降は上限を超えない範囲で短い文をまとめ、リクエスト数を抑える。
+    """
+    pieces: List[str] = []
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            # 上限内で最後の区切り（読点・空白など）で切る。無ければ上限で切る
+            cut = max_chars
+            for match in SOFT_BREAK.finditer(sentence, 1, max_chars):
+                cut = match.end() if match.group() else match.start()
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+
+    chunks: List[str] = []
+    for piece in pieces:
+        # 英文などは単語がつながらないよう空白を挟む（日本語の側がある境界では挟まない）
+        separator = "" if chunks and (CJK_CHAR.match(chunks[-1][-1]) or CJK_CHAR.match(piece[0])) else " "
+        if len(chunks) > 1 and len(chunks[-1]) + len(separator) + len(piece) <= max_chars:
+            chunks[-1] += separator + piece
+        else:
+            chunks.append(piece)
+    return [chunk for chunk in chunks if chunk]
+
 class VoiceManager:
-    """音声出力を管理するクラス"""
-    
+    """音声出力を管理するクラス
+
+    speak()は発話をキューに積んで即座に戻る。合成と再生はバックグラウンドの
+    ワーカーが1件ずつ行うため、テキストの応答は音声を待たずに返せる。
+    """
+
     def __init__(self):
         """音声マネージャーの初期化"""
-        self.api_base_url = os.getenv("NIJIVOICE_API_BASE_URL")
-        self.voice_actor_id = os.getenv("VOICE_ACTOR_ID")
+        self.api_base_url = os.getenv("NIJIVOICE_API_BASE_URL", "https://api.nijivoice.com/api/platform/v1")
+        self.voice_actor_id = os.getenv("VOICE_ACTOR_ID", DEFAULT_VOICE_ACTOR_ID)
         self.api_key = os.getenv("NIJIVOICE_API_KEY")
         self.voice_mode = os.getenv("VOICE_MODE", "true").lower() == "true"
-        self._temp_files = []  # 一時ファイルのリストを保持
-        
-        # 終了時に一時ファイルを削除するための登録
-        atexit.register(self._cleanup_temp_files)
-        
+        self.speed = os.getenv("VOICE_SPEED", "1.0")
+        self.audio_format = "mp3"
+        self.request_timeout = float(os.getenv("VOICE_REQUEST_TIMEOUT", "30"))
+        self.chunk_chars = int(os.getenv("VOICE_CHUNK_CHARS", "120"))
+        self.synth_concurrency = int(os.getenv("VOICE_SYNTH_CONCURRENCY", "3"))
+        self.cache = self._create_cache()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._prewarm: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Task] = None
+
         # Pygameの初期化
         try:
             pygame.mixer.init()
@@ -34,134 +96,292 @@ class VoiceManager:
         """音声出力が有効かどうかを確認"""
         return self.voice_mode and self.api_key is not None
 
-    def process_text(self, text: str) -> Optional[str]:
-        """テキストを音声に変換して再生"""
-        if not self.is_voice_enabled():
+    def _create_cache(self) -> Optional[DiskLRUCache]:
+        """合成済み音声のディスクキャッシュを作成（VOICE_CACHE_DIRが空なら無効）"""
+        cache_dir = os.getenv("VOICE_CACHE_DIR", "voice_cache")
+        if not cache_dir:
             return None
-            
-        logger.debug(f"Processing text: {text}")
-        logger.debug(f"Voice enabled: {self.is_voice_enabled()} (mode: {self.voice_mode}, api_key: {'set' if self.api_key else 'not set'})")
-        
+        max_bytes = int(os.getenv("VOICE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
         try:
-            # APIリクエストを送信
-            url = "https://api.nijivoice.com/api/platform/v1/voice-actors/1fc717fe-ebf9-402b-9d8c-c59cda93d5dc/generate-voice"
-            headers = {
-                "x-api-key": self.api_key,
-                "accept": "application/json",
-                "content-type": "application/json"
-            }
-            payload = {
-                "script": text,
-                "speed": "1.0",
-                "format": "mp3"
-            }
-            
-            logger.debug(f"Sending request to {url}")
-            logger.debug(f"Headers: {headers}")
-            logger.debug(f"Payload: {payload}")
-            
-            response = requests.post(url, headers=headers, json=payload)
-            logger.debug(f"Response status code: {response.status_code}")
-            logger.debug(f"Response headers: {response.headers}")
-            logger.debug(f"Response content type: {response.headers.get('content-type')}")
-            
-            if response.status_code == 200:
-                response_json = response.json()
-                logger.debug(f"JSON response: {response_json}")
-                
-                if audio_url := response_json.get("generatedVoice", {}).get("audioFileUrl"):
-                    logger.debug(f"Found audio URL: {audio_url}")
-                    
-                    # 音声データをダウンロード
-                    audio_response = requests.get(audio_url)
-                    if audio_response.status_code == 200:
-                        audio_data = audio_response.content
-                        logger.debug("Successfully downloaded audio data")
-                        
-                        # データサイズの確認
-                        if len(audio_data) > 0:
-                            logger.debug("Data size check passed")
-                            
-                            # 一時ファイルを作成
-                            temp_file = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
-                            temp_file.write(audio_data)
-                            temp_file.close()
-                            self._temp_files.append(temp_file.name)  # 一時ファイルを記録
-                            
-                            logger.debug(f"Temporary file created at: {temp_file.name}")
-                            
-                            # 音声を再生
-                            try:
-                                pygame.mixer.music.load(temp_file.name)
-                                pygame.mixer.music.play()
-                                while pygame.mixer.music.get_busy():
-                                    pygame.time.Clock().tick(10)
-                            except Exception as e:
-                                logger.error(f"Error playing audio: {str(e)}")
-                                raise
-                            
-                text = text[:497] + "..."
-            
-            return audio_data
-                
-        except Exception as e:
-            logger.error(f"Error generating voice: {str(e)}")
+            return DiskLRUCache(cache_dir, max_bytes=max_bytes, suffix=f".{self.audio_format}")
+        except OSError as e:
+            logger.warning(f"音声キャッシュを初期化できませんでした: {str(e)}")
             return None
-    
-    def play_voice(self, voice_data: bytes) -> bool:
-        """音声データを再生"""
-        if not self.verify_mp3_data(voice_data):
-            logger.error("Invalid MP3 data received")
-            return False
-            
-        temp_file_path = None
-        try:
-            # 一時ファイルを作成して音声データを保存
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False, mode='wb') as temp_file:
-                temp_file.write(voice_data)
-                temp_file_path = temp_file.name
-            
-            logger.debug(f"Temporary file created at: {temp_file_path}")
-            
-            # 既存の再生を停止
+
+    def cache_key(self, text: str) -> str:
+        """テキスト・ボイスアクター・速度・形式から音声キャッシュのキーを作る"""
+        material = json.dumps([text, self.voice_actor_id, str(self.speed), self.audio_format], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """音声キャッシュのヒット率などを返す"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.stats()}
+
+    def prewarm(self, phrases: Iterable[str]):
+        """定型文をバックグラウンドで合成してキャッシュに入れておく"""
+        if self.cache is None or not self.is_voice_enabled():
+            return
+        chunks = list(dict.fromkeys(
+            chunk for phrase in phrases for chunk in split_sentences(phrase, self.chunk_chars)
+        ))
+        self._prewarm = asyncio.create_task(self._run_prewarm(chunks))
+
+    async def _run_prewarm(self, chunks: List[str]):
+        # ターンの読み上げより後回しにする
+        with priority_scope(Priority.BACKGROUND):
+            await self._prewarm_chunks(chunks)
+
+    async def _prewarm_chunks(self, chunks: List[str]):
+        missing = [chunk for chunk in chunks if self.cache_key(chunk) not in self.cache]
+        for chunk in missing:
+            try:
+                await self.synthesize(chunk)
+            except Exception as e:
+                logger.warning(f"定型文の事前合成に失敗: {str(e)}")
+        if missing:
+            logger.info(f"定型文を{len(missing)}件事前合成しました")
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """使い回すHTTPセッションを取得"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                connector=aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+            )
+        return self._session
+
+    def speak(self, text: str, preempt: bool = False):
+        """発話をキューに追加して即座に戻る
+
+        preempt=Trueの場合は、再生中・待機中の発話を破棄してこの発話を優先する。
+        """
+        if not text or not self.is_voice_enabled():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            # ワーカーは複数のターンをまたいで動くので、最初に呼んだターンの期限や
+            # レート制限の優先度（contextvars）を引き継がないよう空のコンテキストで起動する
+            self._worker = asyncio.create_task(self._run_worker(), context=contextvars.Context())
+        if preempt:
+            self._drop_pending()
+        # 再生はターンの後も続くので、発話を依頼したスパンを親として一緒に渡す
+        self._queue.put_nowait((text, tracer.current_span()))
+
+    def _drop_pending(self):
+        """待機中の発話を捨て、再生中の発話を止める"""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self._queue.task_done()
+        if self._current is not None and not self._current.done():
+            self._current.cancel()
+        # ミキサーを初期化できていない場合は止める再生も無い
+        if pygame.mixer.get_init():
             pygame.mixer.music.stop()
-            pygame.mixer.music.unload()
-            
-            # 音声を再生
-            pygame.mixer.music.load(temp_file_path)
-            pygame.mixer.music.play()
-            
-            # 再生が終わるまで待機
-            while pygame.mixer.music.get_busy():
-                pygame.time.wait(100)
-            
-            # 再生完了後、少し待機してからファイルを削除
-            time.sleep(0.5)
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error playing voice: {str(e)}")
-            return False
-            
-        finally:
-            # 一時ファイルを削除（リトライ付き）
-            if temp_file_path and os.path.exists(temp_file_path):
-                for _ in range(3):  # 最大3回リトライ
-                    try:
-                        os.unlink(temp_file_path)
-                        logger.debug("Temporary file deleted successfully")
-                        break
-                    except Exception as e:
-                        logger.error(f"Error deleting temporary file: {str(e)}")
-                        time.sleep(0.5)  # 0.5秒待機してリトライ
-
-    def _cleanup_temp_files(self):
-        """プログラム終了時に一時ファイルを削除する"""
-        for path in self._temp_files:
-            if os.path.exists(path):
+
+    async def _run_worker(self):
+        """キューの発話を順に合成・再生するワーカー"""
+        while True:
+            text, parent = await self._queue.get()
+            self._current = asyncio.create_task(self._process_utterance(text, parent))
+            try:
+                await self._current
+            except asyncio.CancelledError:
+                # 割り込まれた発話のキャンセルはワーカー自体の停止ではない
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as e:
+                logger.error(f"音声出力でエラー: {str(e)}")
+            finally:
+                self._current = None
+                self._queue.task_done()
+
+    async def _process_utterance(self, text: str, parent) -> int:
+        with tracer.span("tts.utterance", parent=parent, **{"tts.chars": len(text)}) as span:
+            played = await self.process_text(text)
+            span.set_attribute("tts.chunks_played", played)
+            return played
+
+    async def wait_until_idle(self):
+        """キューの発話がすべて終わるまで待つ"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def process_text(self, text: str) -> int:
+        """テキストを文ごとに合成しながら順番に再生し、再生したチャンク数を返す
+
+        チャンクの合成は同時実行数の上限付きで先行して進め、再生は常に先頭から
+        順に行う。1つ目のチャンクを再生している間に2つ目以降が合成される。
+        """
+        if not self.is_voice_enabled():
+            return 0
+
+        chunks = split_sentences(text, self.chunk_chars)
+        semaphore = asyncio.Semaphore(self.synth_concurrency)
+
+        async def render(chunk: str) -> Optional[bytes]:
+            async with semaphore:
+                return await self.synthesize(chunk)
+
+        tasks = [asyncio.create_task(render(chunk)) for chunk in chunks]
+        played = 0
+        try:
+            for index, task in enumerate(tasks):
                 try:
-                    os.remove(path)
+                    audio_data = await task
+                except asyncio.CancelledError:
+                    raise
                 except Exception as e:
-                    logger.error(f"Failed to remove temp file {path}: {str(e)}")
-        self._temp_files.clear()
+                    logger.error(f"チャンク{index + 1}/{len(tasks)}の音声合成に失敗: {str(e)}")
+                    continue
+                if audio_data:
+                    span = tracer.current_span()
+                    if played == 0 and span is not None:
+                        span.set_attribute("tts.first_audio_ms", round(span.duration_ms, 1))
+                    await self.play_audio(audio_data)
+                    played += 1
+        finally:
+            for task in tasks:
+                task.cancel()
+        return played
+
+    async def synthesize(self, text: str) -> Optional[bytes]:
+        """音声データを返す（キャッシュに無ければ合成してキャッシュする）
+
+        同じテキストの合成が進行中なら、その結果を待つ。
+        """
+        # 事前合成などターンに属さない合成は計測しない
+        traced = tracer.span("tts.synthesize", **{"tts.chars": len(text)}) \
+            if tracer.current_span() is not None else contextlib.nullcontext()
+        with traced as span:
+            audio_data = await self._synthesize_cached(text)
+            if span is not None:
+                span.set_attribute("tts.bytes", len(audio_data or b""))
+            return audio_data
+
+    async def _synthesize_cached(self, text: str) -> Optional[bytes]:
+        if self.cache is None:
+            return await self._synthesize_remote(text)
+
+        key = self.cache_key(text)
+        audio_data = await asyncio.to_thread(self.cache.get, key)
+        if audio_data:
+            span = tracer.current_span()
+            if span is not None and span.name == "tts.synthesize":
+                span.set_attribute("tts.cache_hit", True)
+            return audio_data
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._synthesize_and_store(key, text))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _synthesize_and_store(self, key: str, text: str) -> Optional[bytes]:
+        audio_data = await self._synthesize_remote(text)
+        if audio_data:
+            try:
+                await asyncio.to_thread(self.cache.set, key, audio_data)
+            except Exception as e:
+                logger.warning(f"音声キャッシュへの保存に失敗: {str(e)}")
+        return audio_data
+
+    async def _synthesize_remote(self, text: str) -> Optional[bytes]:
+        """にじボイスAPIで音声を合成し、音声データを返す（カセットの記録・再生を通す）"""
+        return await cassette.call(
+            "voice",
+            {"text": text, "actor": self.voice_actor_id, "speed": self.speed, "format": self.audio_format},
+            lambda: self._request_synthesis(text),
+            encode=encode_bytes,
+            decode=decode_bytes
+        )
+
+    def _request_timeout_within_turn(self) -> aiohttp.ClientTimeout:
+        """ターンの中の合成はターンの残り時間まで（読み上げのワーカーはターンの期限を引き継がない）
+
+        aiohttpはtotal=0をタイムアウト無しとして扱うので、残りが無ければ要求を送らない。
+        """
+        budget = remaining_budget(self.request_timeout)
+        if budget <= 0:
+            raise DeadlineExceeded("ターンの期限を過ぎたため音声合成を実行しませんでした")
+        return aiohttp.ClientTimeout(total=budget)
+
+    async def _request_synthesis(self, text: str) -> Optional[bytes]:
+        url = f"{self.api_base_url}/voice-actors/{self.voice_actor_id}/generate-voice"
+        headers = {
+            "x-api-key": self.api_key,
+            "accept": "application/json",
+            "content-type": "application/json"
+        }
+        payload = {
+            "script": text,
+            "speed": self.speed,
+            "format": self.audio_format
+        }
+
+        session = self._get_session()
+        timeout = self._request_timeout_within_turn()
+        grant = await limiters.acquire(NIJIVOICE)
+        async with session.post(url, headers=headers, json=payload, timeout=timeout) as response:
+            if response.status == 429:
+                grant.throttled(parse_retry_after(response.headers.get("Retry-After")))
+            if response.status != 200:
+                logger.error(f"Voice generation failed: {response.status} {await response.text()}")
+                return None
+            response_json = await response.json()
+
+        audio_url = response_json.get("generatedVoice", {}).get("audioFileUrl")
+        if not audio_url:
+            logger.error("Voice generation response has no audio URL")
+            return None
+
+        # 音声データをメモリ上のバッファへストリーミングでダウンロード
+        timeout = self._request_timeout_within_turn()
+        async with session.get(audio_url, timeout=timeout) as audio_response:
+            if audio_response.status != 200:
+                logger.error(f"Audio download failed: {audio_response.status}")
+                return None
+            with io.BytesIO() as buffer:
+                async for block in audio_response.content.iter_chunked(DOWNLOAD_CHUNK_BYTES):
+                    buffer.write(block)
+                audio_data = buffer.getvalue()
+        return audio_data or None
+
+    async def play_audio(self, audio_data: bytes):
+        """音声データをメモリから再生し、再生が終わるまで（イベントループを止めずに）待つ
+
+        ディスクを経由せずにファイルライクオブジェクトから読み込み、再生が終わったら
+        （中断された場合も）すぐにpygameとバッファの両方から解放する。
+        """
+        with io.BytesIO(audio_data) as buffer, tracer.span("tts.play", **{"tts.bytes": len(audio_data)}):
+            try:
+                pygame.mixer.music.load(buffer, self.audio_format)
+                pygame.mixer.music.play()
+                while pygame.mixer.music.get_busy():
+                    await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error playing audio: {str(e)}")
+                raise
+            finally:
+                pygame.mixer.music.stop()
+                pygame.mixer.music.unload()
+
+    async def close(self):
+        """ワーカーとHTTPセッションを停止"""
+        if self.cache is not None:
+            logger.info(f"音声キャッシュ: {self.cache_stats()}")
+        if self._prewarm is not None:
+            self._prewarm.cancel()
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        if self._worker is not None:
+            self._worker.cancel()
+        if self._current is not None:
+            self._current.cancel()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
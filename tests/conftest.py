@@ -0,0 +1,6 @@
+import os
+
+# テスト中はトレースをファイルに書き出さない
+os.environ.setdefault("TRACE_FILE", "")
+# 大きなツール結果はメモリ上にだけ保持する
+os.environ.setdefault("BLOB_STORE_DIR", "")
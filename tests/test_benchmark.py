@@ -0,0 +1,47 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+import bench  # noqa: E402
+from fake_servers import FakeOpenAIServer  # noqa: E402
+
+def test_zipf_workload_favours_top_ranked_topics():
+    import random
+    workload = bench.ZipfWorkload(50, 1.2, random.Random(1))
+    queries = [workload.next_query() for _ in range(2000)]
+    assert queries.count("「話題0001」について教えて") > queries.count("「話題0010」について教えて") > 0
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert bench.percentile(values, 50) == 50.0
+    assert bench.percentile(values, 99) == 99.0
+    assert bench.percentile([3.0], 95) == 3.0
+
+def test_fake_openai_plans_search_then_answers():
+    plan = FakeOpenAIServer.plan("ユーザーからの質問:\n「話題0003」について教えて")
+    assert plan["current_phase"]["operations"][0]["parameters"]["query"] == "話題0003"
+    final = FakeOpenAIServer.plan("ユーザーからの質問:\n「話題0003」について\n前回の実行結果:\n[]")
+    assert final["task_completed"] and "話題0003" in final["final_response"]
+
+@pytest.mark.asyncio
+async def test_benchmark_runs_end_to_end(monkeypatch):
+    # ベンチマークが書き換える環境変数をテスト後に元へ戻す
+    for key in bench.ENV_KEYS:
+        monkeypatch.setenv(key, "")
+    args = bench.parse_args([
+        "--sessions", "3", "--turns", "4", "--topics", "5",
+        "--llm-latency-ms", "0", "--search-latency-ms", "0", "--voice-latency-ms", "0", "--play-ms", "0"
+    ])
+    report = await bench.run_benchmark(args)
+
+    assert report["turns"] == 12 and report["errors"] == 0
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
+    # 1ターンは思考2回（計画と最終応答）
+    assert report["upstream_requests"]["openai"] == 24
+    # 計画は推論モデル、検索後の要約は高速モデル
+    assert report["openai_models"] == {"o1-mini": 12, "gpt-4o": 12}
+    # 話題は5種類しかないので、検索の多くはキャッシュから返る
+    assert report["upstream_requests"]["serpapi"] < 12
+    assert report["cache"]["search"]["hit_rate"] > 0
+    assert "p95" in bench.format_report(report)
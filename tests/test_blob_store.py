@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from mcp_llm_bridge.tools.blob_store import BlobStore, digest
+
+ROWS = [
+    {"id": i, "title": f"商品{i}", "price": 100.0 * i, "category": "本" if i % 2 else "CD", "note": None}
+    for i in range(1, 201)
+]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("BLOB_INLINE_MAX_CHARS", "1000")
+    return BlobStore(str(tmp_path))
+
+
+def test_digest_reports_counts_column_stats_and_top_items():
+    summary = digest(ROWS, top=3)
+    assert summary["count"] == 200
+    assert summary["columns"]["price"] == {"non_null": 200, "min": 100.0, "max": 20000.0, "mean": 10050.0}
+    assert summary["columns"]["category"]["distinct"] == 2
+    assert summary["columns"]["note"] == {"non_null": 0, "distinct": 0, "top": []}
+    assert [row["id"] for row in summary["top"]] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_large_results_are_replaced_by_handle_and_digest(store):
+    results = [
+        {"operation_type": "database_query", "success": True, "result": ROWS, "error": None},
+        {"operation_type": "spotify", "success": True, "result": {"status": "paused"}, "error": None},
+    ]
+    compacted = await store.compact_results(results)
+    assert compacted[1] == results[1]
+    blob = compacted[0]["result"]
+    assert blob["blob"].startswith("blob:") and blob["digest"]["count"] == 200
+    assert len(json.dumps(compacted, ensure_ascii=False)) < len(json.dumps(results, ensure_ascii=False)) / 5
+    # 同じ内容は同じハンドルになる
+    assert (await store.compact(list(ROWS)))["blob"] == blob["blob"]
+    assert results[0]["result"] is ROWS
+
+
+@pytest.mark.asyncio
+async def test_blob_read_slices_items_and_selects_fields(store, tmp_path):
+    handle = await store.put({"results": ROWS, "highlights": {}})
+    page = await store.execute({"handle": handle, "start": 10, "limit": 2, "fields": ["id", "price"]})
+    assert page == {
+        "handle": handle, "total": 200, "start": 10, "key": "results",
+        "items": [{"id": 11, "price": 1100.0}, {"id": 12, "price": 1200.0}]
+    }
+    # 新しいストア（再起動後）でもディスクから読み出せる
+    reopened = BlobStore(str(tmp_path))
+    assert (await reopened.execute({"handle": handle, "limit": 1}))["items"][0]["id"] == 1
+
+
+@pytest.mark.asyncio
+async def test_blob_read_rejects_unknown_handles(store):
+    with pytest.raises(ValueError):
+        await store.execute({"handle": "blob:0000"})
+    with pytest.raises(ValueError):
+        await store.execute({"handle": "not-a-handle"})
+
+
+@pytest.mark.asyncio
+async def test_blob_read_slices_objects_without_lists(store):
+    profile = {f"field{i}": "説明" * 40 for i in range(60)}
+    handle = (await store.compact(profile))["blob"]
+    page = await store.execute({"handle": handle})
+    assert page["chars"] == len(json.dumps(profile, ensure_ascii=False))
+    assert len(page["json"]) == 2000 and page["json"].startswith('{"field0"')
+    assert len((await store.execute({"handle": handle, "limit": 10000}))["json"]) == 4000
+    # リストでないキーはその値だけを読む
+    field = await store.execute({"handle": handle, "key": "field3"})
+    assert field["key"] == "field3" and json.loads(field["json"]) == profile["field3"]
+    with pytest.raises(ValueError):
+        await store.execute({"handle": handle, "key": "missing"})
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+import pytest
+from openai.types.chat import ChatCompletion
+
+from mcp_llm_bridge.cassette import (
+    Cassette, CassetteMiss, cassette, decode_bytes, decode_completion, encode_bytes, encode_completion
+)
+from mcp_llm_bridge.tools.database import DatabaseQueryTool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+
+@pytest.fixture
+def global_cassette():
+    yield cassette
+    cassette.configure("off")
+
+
+def counting(value, calls):
+    async def fn():
+        calls.append(value)
+        return value
+    return fn
+
+
+@pytest.mark.asyncio
+async def test_replay_returns_recorded_responses_without_calling(tmp_path):
+    path = str(tmp_path / "c.jsonl.gz")
+    calls = []
+    recorder = Cassette("record", path)
+    assert await recorder.call("search", {"q": "a"}, counting({"hits": 1}, calls)) == {"hits": 1}
+    assert await recorder.call("voice", {"text": "b"}, counting(b"\x00\x01", calls), encode_bytes, decode_bytes) == b"\x00\x01"
+    recorder.close()
+
+    player = Cassette("replay", path, time_scale=0)
+    assert await player.call("voice", {"text": "b"}, counting(None, calls), encode_bytes, decode_bytes) == b"\x00\x01"
+    assert await player.call("search", {"q": "a"}, counting(None, calls)) == {"hits": 1}
+    assert calls == [{"hits": 1}, b"\x00\x01"]
+    assert player.stats()["replayed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_replay_scales_recorded_timing(tmp_path):
+    path = str(tmp_path / "c.jsonl.gz")
+    recorder = Cassette("record", path)
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "ok"
+    await recorder.call("think", {"p": 1}, slow)
+    recorder.close()
+
+    player = Cassette("replay", path, time_scale=0.5)
+    start = time.perf_counter()
+    assert await player.call("think", {"p": 1}, slow) == "ok"
+    assert 0.04 <= time.perf_counter() - start < 0.09
+
+
+@pytest.mark.asyncio
+async def test_recorded_errors_are_raised_again(tmp_path):
+    path = str(tmp_path / "c.jsonl.gz")
+    recorder = Cassette("record", path)
+
+    async def fail():
+        raise TimeoutError("応答なし")
+    with pytest.raises(TimeoutError):
+        await recorder.call("human", {"question": "?"}, fail)
+    recorder.close()
+
+    player = Cassette("replay", path, time_scale=0)
+    with pytest.raises(TimeoutError, match="応答なし"):
+        await player.call("human", {"question": "?"}, fail)
+
+
+@pytest.mark.asyncio
+async def test_unmatched_requests_fall_back_to_recorded_order(tmp_path):
+    path = str(tmp_path / "c.jsonl.gz")
+    recorder = Cassette("record", path)
+    await recorder.call("think", {"prompt": "v1-1"}, counting("first", []))
+    await recorder.call("think", {"prompt": "v1-2"}, counting("second", []))
+    recorder.close()
+
+    player = Cassette("replay", path, time_scale=0)
+    # プロンプトが変わっていても、同じ種類の記録を記録順に使う
+    assert await player.call("think", {"prompt": "v2-1"}, counting(None, [])) == "first"
+    assert await player.call("think", {"prompt": "v1-2"}, counting(None, [])) == "second"
+    # 使い切った要求は最後の応答を繰り返す
+    assert await player.call("think", {"prompt": "v1-2"}, counting(None, [])) == "second"
+    with pytest.raises(CassetteMiss):
+        await player.call("think", {"prompt": "v2-3"}, counting(None, []))
+    assert player.stats() == {"recorded": 0, "replayed": 3, "repeats": 1, "fallbacks": 1, "misses": 1}
+
+
+def test_completion_round_trip():
+    completion = ChatCompletion.model_validate({
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "o1-mini",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{}"}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+    })
+    restored = decode_completion(encode_completion(completion))
+    assert restored.choices[0].message.content == "{}"
+    assert restored.usage.total_tokens == 5
+
+
+@pytest.mark.asyncio
+async def test_database_queries_replay_without_the_database(tmp_path, global_cassette):
+    db_path = str(tmp_path / "shop.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE products (id INTEGER, title TEXT)")
+        conn.execute("INSERT INTO products VALUES (1, 'りんご')")
+    tool = DatabaseQueryTool(db_path)
+    cassette_path = str(tmp_path / "c.jsonl.gz")
+
+    global_cassette.configure("record", cassette_path)
+    recorded = await tool.execute({"query": "SELECT * FROM products"})
+    global_cassette.configure("replay", cassette_path, time_scale=0)
+    os.remove(db_path)
+    assert await tool.execute({"query": "SELECT * FROM products"}) == recorded == [{"id": 1, "title": "りんご"}]
+
+
+@pytest.mark.asyncio
+async def test_recorded_benchmark_replays_offline(tmp_path, monkeypatch, global_cassette):
+    import bench
+    import replay
+    for key in bench.ENV_KEYS:
+        monkeypatch.setenv(key, "")
+    path = str(tmp_path / "bench.jsonl.gz")
+    await bench.run_benchmark(bench.parse_args([
+        "--sessions", "1", "--turns", "3", "--topics", "2", "--record", path,
+        "--llm-latency-ms", "0", "--search-latency-ms", "0", "--voice-latency-ms", "0", "--play-ms", "0"
+    ]))
+
+    report = await replay.replay(replay.parse_args([path, "--time-scale", "0"]))
+    assert len(report["turns"]) == 3
+    assert report["cassette_stats"]["misses"] == 0
+    assert report["cassette_stats"]["fallbacks"] == 0
+    assert report["cassette_stats"]["replayed"] > 0
@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from mcp_llm_bridge.bridge import MCPLLMBridge, NO_PARTIAL_RESULT_MESSAGE, PARTIAL_RESULT_PREFIX
+from mcp_llm_bridge.config import DeadlineConfig, IntentConfig, RetrievalConfig
+from mcp_llm_bridge.deadline import DeadlineExceeded, current_deadline, deadline_scope, paused, remaining_budget, run_within
+from mcp_llm_bridge.intent import IntentRouter
+from mcp_llm_bridge.schemas import ExecutionResult, Operation, TaskPhase, ThinkingResponse
+from mcp_llm_bridge.tools import BlobStore
+
+
+@pytest.mark.asyncio
+async def test_run_within_cancels_work_past_the_deadline():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with deadline_scope(0.05):
+        with pytest.raises(DeadlineExceeded):
+            await run_within(slow(), "think")
+        # 期限を過ぎた後の段階は始めない
+        with pytest.raises(DeadlineExceeded):
+            await run_within(slow(), "tool.google_search")
+    assert cancelled == [True]
+    assert current_deadline() is None
+
+
+@pytest.mark.asyncio
+async def test_own_timeouts_are_not_reported_as_deadline():
+    async def times_out():
+        raise TimeoutError("upstream")
+
+    with deadline_scope(10):
+        with pytest.raises(TimeoutError) as excinfo:
+            await run_within(times_out(), "tool.spotify")
+    assert not isinstance(excinfo.value, DeadlineExceeded)
+
+
+@pytest.mark.asyncio
+async def test_budget_is_shared_with_tasks_and_paused_for_user_input():
+    with deadline_scope(1.0) as deadline:
+        assert remaining_budget(30) <= 1.0
+        assert await asyncio.create_task(asyncio.sleep(0, result=current_deadline())) is deadline
+        before = deadline.at
+        with paused():
+            await asyncio.sleep(0.05)
+        assert deadline.at - before >= 0.05
+    assert remaining_budget(30) == 30
+
+
+def make_bridge(think, execute_phase, turn_seconds):
+    """外部サービスに接続しない最小限のブリッジ"""
+    bridge = object.__new__(MCPLLMBridge)
+    bridge.config = SimpleNamespace(
+        deadline=DeadlineConfig(turn_seconds=turn_seconds, min_stage_seconds=0.0),
+        retrieval=RetrievalConfig()
+    )
+    bridge.llm_client = SimpleNamespace(start_turn=lambda: None)
+    bridge.thinking_client = SimpleNamespace(
+        start_turn=lambda: None,
+        add_user_message=lambda message: None,
+        add_assistant_message=lambda message: None,
+        think=think
+    )
+    bridge.intent_router = IntentRouter(IntentConfig(enabled=False))
+    bridge.blob_store = BlobStore("")
+    bridge.voice_manager = None
+    bridge.is_task_completed = False
+    bridge._execute_phase = execute_phase
+    return bridge
+
+
+@pytest.mark.asyncio
+async def test_turn_answers_with_collected_results_when_deadline_passes():
+    search = TaskPhase(
+        phase_number=1,
+        operations=[Operation(type="google_search", parameters={"query": "FF11 AA BGM"})],
+        description="検索"
+    )
+
+    async def think(context, tool_result=None, iteration=0):
+        if iteration == 0:
+            return ThinkingResponse(current_phase=search, needs_tool=True, task_completed=False)
+        await run_within(asyncio.sleep(10), "think")
+
+    async def execute_phase(phase):
+        results = {"results": [{"title": "Fighters of the Crystal", "snippet": "AA戦のBGM"}]}
+        return [ExecutionResult(operation_type="google_search", success=True, result=results, error=None)]
+
+    bridge = make_bridge(think, execute_phase, turn_seconds=0.2)
+    response = await asyncio.wait_for(bridge.process_message("FF11のAA戦のBGMは？"), 2)
+    assert response.startswith(PARTIAL_RESULT_PREFIX)
+    assert "Fighters of the Crystal" in response
+
+
+def test_best_effort_skips_failures_and_user_answers():
+    bridge = object.__new__(MCPLLMBridge)
+    results = [
+        {"operation_type": "database_query", "success": True, "result": [{"name": "A", "price": 1200}], "error": None},
+        {"operation_type": "human_interaction", "success": True, "result": {"response": "はい"}, "error": None},
+        {"operation_type": "google_search", "success": False, "result": None, "error": "timeout"},
+    ]
+    response = bridge._format_best_effort(results)
+    assert "データベースから1件見つかりました。" in response and "name: A, price: 1200" in response
+    assert "はい" not in response
+    assert bridge._format_best_effort(results[1:]) == NO_PARTIAL_RESULT_MESSAGE
@@ -0,0 +1,85 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from mcp_llm_bridge.config import HedgingConfig, LLMConfig
+from mcp_llm_bridge.hedging import HedgePolicy
+from mcp_llm_bridge.thinking_client import ThinkingClient
+
+REASONING_MODEL = LLMConfig(api_key="k", model="o1-mini")
+FAST_MODEL = LLMConfig(api_key="k", model="gpt-4o")
+VALID = json.dumps({"needs_tool": False, "task_completed": True, "final_response": "できました"})
+
+
+def completion(content, tokens=100):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=tokens, completion_tokens=0, total_tokens=tokens)
+    )
+
+
+def make_client(responses, **hedging):
+    """モデルごとに (遅延秒数, 応答本文) を返す思考クライアント"""
+    client = ThinkingClient(REASONING_MODEL, FAST_MODEL, hedging=HedgingConfig(enabled=True, **hedging))
+    calls = []
+
+    async def create(route, prompt):
+        calls.append(route.config.model)
+        delay, content = responses[route.config.model]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            calls.append(f"cancelled:{route.config.model}")
+            raise
+        return completion(content)
+
+    client._create_completion = create
+    return client, calls
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged_and_loser_cancelled():
+    client, calls = make_client({"o1-mini": (5.0, VALID), "gpt-4o": (0.01, VALID)}, initial_delay_s=0.05)
+    response = await client.think("東京の天気を調べて")
+    assert response.final_response == "できました"
+    assert calls == ["o1-mini", "gpt-4o", "cancelled:o1-mini"]
+    stats = client.hedging.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1 and stats["hedge_rate"] == 1.0
+    assert stats["extra_requests"] == 1 and stats["extra_tokens"] > 0
+
+
+@pytest.mark.asyncio
+async def test_fast_response_is_not_hedged():
+    client, calls = make_client({"o1-mini": (0.01, VALID), "gpt-4o": (0.01, VALID)}, initial_delay_s=1.0)
+    await client.think("東京の天気を調べて")
+    assert calls == ["o1-mini"]
+    assert client.hedging.stats()["hedged"] == 0
+
+
+@pytest.mark.asyncio
+async def test_first_unparseable_response_does_not_win():
+    client, calls = make_client({"o1-mini": (0.15, VALID), "gpt-4o": (0.01, "JSONではない応答")}, initial_delay_s=0.05)
+    response = await client.think("東京の天気を調べて")
+    assert response.final_response == "できました"
+    assert calls == ["o1-mini", "gpt-4o"]
+    stats = client.hedging.stats()
+    assert stats["hedge_wins"] == 0 and stats["extra_tokens"] == 100
+
+
+@pytest.mark.asyncio
+async def test_hedging_is_opt_in():
+    client = ThinkingClient(REASONING_MODEL, FAST_MODEL)
+    assert client._hedge_route(client.router.choose(0, "q")) is None
+
+
+def test_hedge_delay_follows_latency_percentile():
+    policy = HedgePolicy(HedgingConfig(enabled=True, percentile=0.9, min_samples=10, initial_delay_s=10.0, min_delay_s=0.5))
+    assert policy.delay("o1-mini") == 10.0
+    for seconds in range(1, 11):
+        policy.observe("o1-mini", float(seconds))
+    assert policy.delay("o1-mini") == 9.0
+    for _ in range(10):
+        policy.observe("gpt-4o", 0.1)
+    assert policy.delay("gpt-4o") == 0.5
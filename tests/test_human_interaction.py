@@ -4,6 +4,9 @@ from mcp_llm_bridge.thinking_client import ThinkingResponse, ThinkingClient
 from mcp_llm_bridge.bridge import MCPLLMBridge
 from mcp_llm_bridge.config import BridgeConfig, LLMConfig
 import json
+import asyncio
+import os
+from mcp_llm_bridge.tools import HumanTool, QueueInputChannel, StdinInputChannel
 
 @pytest.fixture
 def mock_completion():
@@ -52,4 +55,134 @@ async def test_bridge_human_interaction():
     assert "だれですか" in response
 
     # コンテキストが保持されていることを確認
-    assert "安倍なつみ" in bridge.context_memory.get("human_answer", "")
\ No newline at end of file
+    assert "安倍なつみ" in bridge.context_memory.get("human_answer", "")
+
+@pytest.mark.asyncio
+async def test_human_tool_answers_through_queue_channel():
+    channel = QueueInputChannel()
+    tool = HumanTool(channel)
+
+    task = asyncio.create_task(tool.execute({"question": "好きな色は？"}))
+    question_id, question = await channel.next_question()
+    assert question == "好きな色は？"
+    assert channel.answer(question_id, "青")
+
+    result = json.loads(await task)
+    assert result == {"result": {"answer": "青", "success": True}}
+    assert channel.pending_count == 0
+
+@pytest.mark.asyncio
+async def test_human_tool_many_pending_questions_without_threads():
+    channel = QueueInputChannel()
+    tool = HumanTool(channel)
+    tasks = [asyncio.create_task(tool.execute({"question": f"質問{i}"})) for i in range(1000)]
+    await asyncio.sleep(0)
+    assert channel.pending_count == 1000
+
+    while not channel.outgoing.empty():
+        question_id, question = channel.outgoing.get_nowait()
+        channel.answer(question_id, question.replace("質問", "回答"))
+
+    results = [json.loads(r)["result"]["answer"] for r in await asyncio.gather(*tasks)]
+    assert results == [f"回答{i}" for i in range(1000)]
+
+@pytest.mark.asyncio
+async def test_human_tool_timeout_uses_default_or_aborts():
+    channel = QueueInputChannel()
+    tool = HumanTool(channel)
+
+    result = json.loads(await tool.execute({"question": "続けますか？", "timeout": 0.05, "default_answer": "はい"}))
+    assert result == {"result": {"answer": "はい", "success": True, "timed_out": True}}
+
+    result = json.loads(await tool.execute({"question": "お名前は？", "timeout": 0.05}))
+    assert result["success"] is False
+    assert "回答がありませんでした" in result["error"]
+    assert channel.pending_count == 0
+
+@pytest.mark.asyncio
+async def test_stdin_channel_reads_lines_from_event_loop(capsys):
+    read_fd, write_fd = os.pipe()
+    channel = StdinInputChannel(fd=read_fd)
+    try:
+        task = asyncio.create_task(channel.ask("年齢は？"))
+        await asyncio.sleep(0.01)
+        os.write(write_fd, "二十歳\n".encode())
+        assert await asyncio.wait_for(task, 1) == "二十歳"
+        assert "🤖 年齢は？" in capsys.readouterr().out
+
+        # タイムアウトしても読み取りの登録は解除される
+        with pytest.raises(asyncio.TimeoutError):
+            await channel.ask("もう一度？", timeout=0.05)
+        os.write(write_fd, "遅れた回答\n".encode())
+        task = asyncio.create_task(channel.ask("最後の質問？"))
+        await asyncio.sleep(0.01)
+        os.write(write_fd, "最後の回答\n".encode())
+        assert await asyncio.wait_for(task, 1) == "最後の回答"
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+@pytest.mark.asyncio
+async def test_human_tool_form_returns_typed_answers_in_one_round():
+    channel = QueueInputChannel()
+    tool = HumanTool(channel)
+    task = asyncio.create_task(tool.execute({"questions": [
+        {"id": "genre", "question": "ジャンルは？", "choices": ["ロック", "ジャズ"]},
+        {"id": "count", "question": "何曲？", "type": "number"},
+        {"id": "shuffle", "question": "シャッフルする？", "type": "boolean"},
+        {"question": "ほかに希望は？"}
+    ]}))
+
+    question_id, form = await channel.next_question()
+    assert len(form) == 4 and "1) ロック" in form[0]
+    channel.answer(question_id, ["2", "3", "はい", "特になし"])
+
+    result = json.loads(await task)
+    assert result == {"result": {
+        "answers": {"genre": "ジャズ", "count": 3, "shuffle": True, "q4": "特になし"},
+        "success": True
+    }}
+    assert channel.outgoing.empty()
+
+@pytest.mark.asyncio
+async def test_human_tool_form_reasks_invalid_answers_and_applies_defaults():
+    channel = QueueInputChannel()
+    tool = HumanTool(channel)
+    task = asyncio.create_task(tool.execute({"questions": [
+        {"id": "genre", "question": "ジャンルは？", "choices": ["ロック", "ジャズ"]},
+        {"id": "mood", "question": "気分は？", "default": "おまかせ"}
+    ], "timeout": 0.3}))
+
+    question_id, _ = await channel.next_question()
+    channel.answer(question_id, ["クラシック"])
+    retry_id, retry = await channel.next_question()
+    assert "番号か選択肢" in retry
+    channel.answer(retry_id, "ロック")
+
+    result = json.loads(await task)["result"]
+    assert result["answers"] == {"genre": "ロック", "mood": "おまかせ"}
+    assert result["defaulted"] == ["mood"]
+
+@pytest.mark.asyncio
+async def test_human_tool_form_without_answer_or_default_fails():
+    tool = HumanTool(QueueInputChannel())
+    result = json.loads(await tool.execute({"questions": [{"id": "name", "question": "お名前は？"}], "timeout": 0.05}))
+    assert result["success"] is False
+    assert "お名前は？" in result["error"]
+
+@pytest.mark.asyncio
+async def test_human_tool_form_timeout_returns_typed_defaults():
+    tool = HumanTool(QueueInputChannel())
+    result = json.loads(await tool.execute({"questions": [
+        {"id": "genre", "question": "ジャンルは？", "choices": ["ロック", "ジャズ"], "default": "2"},
+        {"id": "count", "question": "何曲？", "type": "number", "default": "3"},
+        {"id": "volume", "question": "音量は？", "type": "number", "default": 40},
+        {"id": "shuffle", "question": "シャッフルする？", "type": "boolean"}
+    ], "timeout": 0.05, "default_answer": "はい"}))["result"]
+    assert result["answers"] == {"genre": "ジャズ", "count": 3, "volume": 40, "shuffle": True}
+    assert result["defaulted"] == ["genre", "count", "volume", "shuffle"]
+
+    invalid = json.loads(await tool.execute({"questions": [
+        {"id": "count", "question": "何曲？", "type": "number", "default": "たくさん"}
+    ], "timeout": 0.05}))
+    assert invalid["success"] is False and "何曲？" in invalid["error"]
@@ -0,0 +1,94 @@
+import pytest
+
+from mcp_llm_bridge.config import IntentConfig
+from mcp_llm_bridge.intent import CURRENT_TRACK, PAUSE, PLAY, IntentRouter
+from mcp_llm_bridge.schemas import ExecutionResult
+
+
+def spotify_result(result, success=True):
+    return [ExecutionResult(operation_type="spotify", success=success, result=result, error=None)]
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("音楽止めて", PAUSE),
+    ("止めて", PAUSE),
+    ("一時停止", PAUSE),
+    ("Spotifyを一時停止して", PAUSE),
+    ("pause spotify", PAUSE),
+    ("今何の曲？", CURRENT_TRACK),
+    ("この曲なに", CURRENT_TRACK),
+    ("What's playing?", CURRENT_TRACK),
+    ("ＴＲＦのEZ DO DANCEをSpotifyで再生して", PLAY),
+    ("play Bohemian Rhapsody on Spotify", PLAY),
+    ("「Lemon」を流して", PLAY),
+])
+def test_simple_commands_take_the_fast_path(text, intent):
+    assert IntentRouter().match(text).intent == intent
+
+
+@pytest.mark.parametrize("text", [
+    "車を止めて",  # 音楽の話かどうか分からない
+    "動画を一時停止して",
+    "タイマーを一時停止",
+    "小室哲哉のtrfあるやん。なんでもいいから有名な曲1つスポティファイでかけてよ",
+    "なんでもいいから有名な曲をかけて",
+    "今の曲を止めて次の曲を再生して",
+    "Spotifyで再生を止める方法を教えて",
+    "NHK党の決めセリフをググって教えて",
+    "音楽を再生して",
+    "電話をかけて",
+    "トイレを流して",
+    "エアコンかけて",
+    "ニュースを流して",
+    "YouTubeの動画を再生して",
+    "Lemonを再生して",  # 音楽の手がかりが無い
+    "米津玄師のLemonを再生して",  # 「XのY」だけでは音楽か分からない
+    "今日の予定を聞かせて",
+    "子供の声を聞かせて",
+    "ボイスメモの最新を再生して",
+])
+def test_other_requests_fall_through_to_the_planner(text):
+    assert IntentRouter().match(text) is None
+
+
+def test_only_the_latest_utterance_is_matched():
+    router = IntentRouter()
+    text = "【会話の要約】\nユーザーの入力: 音楽止めて\n\nユーザーの入力: 東京の天気は？"
+    assert router.match(text) is None
+    assert router.match("会話の要約: 天気の話\n\nユーザーの入力: 今何の曲").intent == CURRENT_TRACK
+
+
+def test_play_searches_then_plays_the_top_track():
+    path = IntentRouter().route("trfの曲を再生して")
+    first = path.start()
+    assert first.current_phase.operations[0].parameters == {"action": "search", "query": "trf", "limit": 1}
+
+    track = {"id": "t1", "name": "EZ DO DANCE", "artist": "TRF"}
+    second = path.next(spotify_result({"tracks": [track]}))
+    assert second.current_phase.operations[0].parameters == {"action": "play", "track_id": "t1"}
+
+    done = path.next(spotify_result({"status": "playing", "track_id": "t1"}))
+    assert done.task_completed and done.final_response == "TRFの「EZ DO DANCE」を再生しました！"
+
+
+def test_play_reports_missing_tracks_and_hands_errors_to_the_planner():
+    path = IntentRouter().route("存在しない曲名を再生して")
+    path.start()
+    assert "見つかりませんでした" in path.next(spotify_result({"tracks": []})).final_response
+
+    path = IntentRouter().route("pause")
+    path.start()
+    assert path.next(spotify_result({"error": "No active device available"})) is None
+    assert path.next(spotify_result(None, success=False)) is None
+
+
+def test_current_track_response():
+    path = IntentRouter().route("今何の曲")
+    assert path.next(spotify_result({"status": "no_track_playing"})).final_response == "今は何も再生していません。"
+    paused = path.next(spotify_result({"status": "paused", "track": {"name": "Song", "artist": "Band"}}))
+    assert paused.final_response == "Bandの「Song」が一時停止中です。"
+
+
+def test_fast_path_can_be_disabled():
+    assert IntentRouter(IntentConfig(enabled=False)).route("音楽止めて") is None
+    assert IntentRouter(IntentConfig(min_confidence=0.95)).match("音楽止めて") is None
@@ -0,0 +1,70 @@
+import logging
+import pytest
+from mcp_llm_bridge import logging_config
+from mcp_llm_bridge.logging_config import Payload, PayloadSampler, parse_module_levels, setup_logging, shutdown_logging
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append((record.name, record.getMessage()))
+
+@pytest.fixture
+def captured(monkeypatch):
+    monkeypatch.setenv("LOG_LEVELS", "test.noisy=WARNING,test.verbose=DEBUG")
+    monkeypatch.setenv("LOG_PAYLOAD_MAX_CHARS", "20")
+    root = logging.getLogger()
+    previous_level = root.level
+    handler = ListHandler()
+    setup_logging(level="INFO", handlers=[handler])
+    yield handler
+    shutdown_logging()
+    root.removeHandler(logging_config._queue_handler)
+    logging_config._queue_handler = None
+    root.setLevel(previous_level)
+    for name in ("test.noisy", "test.verbose"):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    Payload.max_chars = 2000
+
+def test_records_flow_through_queue_with_module_levels(captured):
+    logging.getLogger("test.app").info("起動しました")
+    logging.getLogger("test.app").debug("表示されない")
+    logging.getLogger("test.noisy").info("抑制される")
+    logging.getLogger("test.verbose").debug("詳細")
+    shutdown_logging()
+
+    assert captured.messages == [("test.app", "起動しました"), ("test.verbose", "詳細")]
+
+def test_suppressed_payloads_are_never_built(captured):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"messages": ["x" * 100]}
+
+    logging.getLogger("test.app").debug("payload: %s", Payload(build))
+    assert calls == []
+
+    logging.getLogger("test.app").info("payload: %s", Payload(build))
+    shutdown_logging()
+    assert calls == [1]
+    message = captured.messages[0][1]
+    assert message.startswith('payload: {"messages": ["xx')
+    assert "文字省略" in message
+
+def test_payload_sampler_keeps_configured_fraction():
+    sampler = PayloadSampler(rate=0.25)
+    records = [
+        logging.LogRecord("test", logging.INFO, __file__, 1, "p: %s", (Payload("x"),), None)
+        for _ in range(8)
+    ]
+    plain = logging.LogRecord("test", logging.INFO, __file__, 1, "plain", None, None)
+    assert sum(sampler.filter(record) for record in records) == 2
+    assert sampler.filter(plain)
+
+def test_parse_module_levels():
+    assert parse_module_levels("a=DEBUG, b.c = warning,bad,d=15,e=NOPE") == {
+        "a": logging.DEBUG, "b.c": logging.WARNING, "d": 15
+    }
@@ -0,0 +1,101 @@
+import asyncio
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from mcp_llm_bridge.tools.page_fetch import PageFetcher, TextExtractor, select_excerpt
+
+ARTICLE = """
+<html><head><title>FF11 BGM</title><script>var ignored = "Fighters of the Crystal";</script></head>
+<body>
+<nav>ホーム | サイトマップ</nav>
+<p>ヴァナ・ディールの音楽について紹介します。</p>
+<p>AAとの戦闘では「Fighters of the Crystal」が流れます。</p>
+<footer>Copyright</footer>
+</body></html>
+"""
+
+@pytest.fixture
+async def page_server():
+    state = {"active": 0, "peak": 0}
+
+    async def article(request):
+        return web.Response(text=ARTICLE, content_type="text/html")
+
+    async def huge(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+        await response.prepare(request)
+        for _ in range(200):
+            await response.write(b"<p>" + b"x" * 1021 + b"</p>")
+        return response
+
+    async def slow(request):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.05)
+        state["active"] -= 1
+        return web.Response(text="<p>slow page</p>", content_type="text/html")
+
+    async def image(request):
+        return web.Response(body=b"\x89PNG", content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/article", article)
+    app.router.add_get("/huge", huge)
+    app.router.add_get("/slow/{n}", slow)
+    app.router.add_get("/image", image)
+    server = TestServer(app)
+    await server.start_server()
+    server.state = state
+    yield server
+    await server.close()
+
+@pytest.fixture
+async def session():
+    async with aiohttp.ClientSession() as session:
+        yield session
+
+def test_extractor_handles_split_chunks():
+    extractor = TextExtractor()
+    for i in range(0, len(ARTICLE), 7):
+        extractor.feed(ARTICLE[i:i + 7])
+    extractor.close()
+
+    assert extractor.title == "FF11 BGM"
+    assert "AAとの戦闘では「Fighters of the Crystal」が流れます。" in extractor.blocks
+    assert not any("ignored" in block or "サイトマップ" in block for block in extractor.blocks)
+
+def test_select_excerpt_prefers_relevant_blocks():
+    blocks = ["はじめに", "AAとの戦闘BGMはFighters of the Crystal", "関係のない話"]
+    assert select_excerpt(blocks, "AA 戦闘 BGM", 100) == blocks[1]
+    assert len(select_excerpt(["y" * 500], "nothing", 100)) <= 100
+
+@pytest.mark.asyncio
+async def test_fetch_excerpts_over_local_server(page_server, session):
+    fetcher = PageFetcher(lambda: session)
+    results = [
+        {"title": "article", "link": str(page_server.make_url("/article"))},
+        {"title": "missing", "link": str(page_server.make_url("/missing"))},
+        {"title": "image", "link": str(page_server.make_url("/image"))},
+    ]
+    enriched = await fetcher.fetch_excerpts(results, "AA 戦闘 BGM")
+
+    assert "Fighters of the Crystal" in enriched[0]["excerpt"]
+    assert enriched[1]["fetch_error"] == "HTTP 404"
+    assert "image/png" in enriched[2]["fetch_error"]
+    assert "excerpt" not in results[0]
+
+@pytest.mark.asyncio
+async def test_fetch_stops_at_byte_cap(page_server, session):
+    fetcher = PageFetcher(lambda: session, max_bytes=8 * 1024, excerpt_chars=100000)
+    extractor = await fetcher._stream_text(str(page_server.make_url("/huge")))
+    assert sum(len(block) for block in extractor.blocks) <= 8 * 1024
+
+@pytest.mark.asyncio
+async def test_per_host_limit(page_server, session):
+    fetcher = PageFetcher(lambda: session, per_host=2, max_concurrency=10)
+    results = [{"link": str(page_server.make_url(f"/slow/{i}"))} for i in range(6)]
+    enriched = await fetcher.fetch_excerpts(results, "slow")
+
+    assert all(r["excerpt"] == "slow page" for r in enriched)
+    assert page_server.state["peak"] <= 2
@@ -0,0 +1,124 @@
+import asyncio
+import time
+import pytest
+
+from mcp_llm_bridge.config import RateLimitConfig
+from mcp_llm_bridge.ratelimit import (
+    Priority, RateLimiter, RateLimiterRegistry, TokenBucket, current_priority, estimate_tokens, priority_scope
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=4.0, clock=clock)
+    bucket.consume(4, clock())
+    assert bucket.delay(1, clock()) == pytest.approx(0.5)
+    clock.now += 1.0
+    assert bucket.delay(2, clock()) == 0.0
+    # 容量を超える量は満杯になるまで待てば通す
+    assert bucket.delay(10, clock()) == pytest.approx(1.0)
+    bucket.consume(6, clock())
+    assert bucket.level == pytest.approx(-4.0)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("こんにちは") == 5
+
+
+@pytest.mark.asyncio
+async def test_unlimited_limiter_does_not_wait():
+    limiter = RateLimiter("openai")
+    start = time.perf_counter()
+    for _ in range(100):
+        await limiter.acquire(1000)
+    assert time.perf_counter() - start < 0.05
+    assert limiter.stats()["acquired"] == 100
+
+
+@pytest.mark.asyncio
+async def test_interactive_calls_go_ahead_of_background_work():
+    limiter = RateLimiter("serpapi", RateLimitConfig(requests_per_minute=1200, burst_seconds=0))  # 50msに1回
+    await limiter.acquire()
+    order = []
+
+    async def call(name, priority):
+        with priority_scope(priority):
+            await limiter.acquire()
+        order.append(name)
+
+    background = [asyncio.create_task(call(f"bg{i}", Priority.BACKGROUND)) for i in range(3)]
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(call("turn", Priority.INTERACTIVE))
+    await asyncio.gather(*background, interactive)
+
+    assert order[0] == "turn"
+    assert order[1:] == ["bg0", "bg1", "bg2"]
+    stats = limiter.stats()
+    assert stats["queued"] == 4 and stats["waiting"] == 0
+    assert stats["wait_ms_max"] >= 150
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_releases_its_place():
+    limiter = RateLimiter("nijivoice", RateLimitConfig(requests_per_minute=1200, burst_seconds=0))
+    await limiter.acquire()
+    first = asyncio.create_task(limiter.acquire())
+    second = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    first.cancel()
+    start = time.perf_counter()
+    await second
+    assert time.perf_counter() - start < 0.09
+
+
+@pytest.mark.asyncio
+async def test_throttled_upstream_pauses_calls():
+    limiter = RateLimiter("spotify")
+    grant = await limiter.acquire()
+    grant.throttled(0.1)
+    start = time.perf_counter()
+    await limiter.acquire()
+    assert time.perf_counter() - start >= 0.09
+    assert limiter.stats()["throttled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_token_quota_is_settled_with_actual_usage():
+    limiter = RateLimiter("openai", RateLimitConfig(tokens_per_minute=60000))  # 1000トークン/秒
+    grant = await limiter.acquire(100)
+    grant.settle(1000)
+    assert limiter.tokens.level == pytest.approx(0.0, abs=5)
+    start = time.perf_counter()
+    await limiter.acquire(200)
+    assert time.perf_counter() - start >= 0.15
+
+
+@pytest.mark.asyncio
+async def test_priority_is_inherited_by_tasks():
+    async def read():
+        return current_priority()
+
+    with priority_scope(Priority.BACKGROUND):
+        task = asyncio.create_task(read())
+    assert await task == Priority.BACKGROUND
+    assert current_priority() == Priority.INTERACTIVE
+
+
+def test_registry_keeps_state_for_unchanged_config():
+    registry = RateLimiterRegistry()
+    registry.configure({"openai": RateLimitConfig(requests_per_minute=60)})
+    limiter = registry.get("openai")
+    registry.configure({"openai": RateLimitConfig(requests_per_minute=60)})
+    assert registry.get("openai") is limiter
+    registry.configure({"openai": RateLimitConfig(requests_per_minute=120)})
+    assert registry.get("openai") is not limiter
+    assert registry.get("serpapi").unlimited
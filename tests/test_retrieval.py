@@ -0,0 +1,65 @@
+from mcp_llm_bridge.config import LLMConfig, RetrievalConfig
+from mcp_llm_bridge.retrieval import BM25Index, SessionMemory, select_results, tokenize
+from mcp_llm_bridge.thinking_client import ThinkingClient
+
+
+def result(operation_type, value):
+    return {"operation_type": operation_type, "success": True, "result": value, "error": None}
+
+
+def test_tokenize_splits_words_and_japanese_bigrams():
+    assert tokenize("FF11のＢＧＭ") == ["ff11", "の", "bgm"]
+    assert tokenize("戦闘曲を再生") == ["戦闘", "闘曲", "曲を", "を再", "再生"]
+
+
+def test_bm25_ranks_matching_documents_first():
+    index = BM25Index()
+    index.add("weather", "東京の天気は晴れ")
+    index.add("music", "FF11 AA戦のBGM Fighters of the Crystal")
+    index.add("shop", "商品の価格一覧")
+    hits = index.search("AA戦のBGMを再生", 2)
+    assert hits[0][0] == "music"
+    assert "weather" not in [doc_id for doc_id, _ in hits]
+    assert index.search("BGM", 5, exclude=["music"]) == []
+
+
+def test_memory_skips_duplicates_and_omitted_stubs():
+    memory = SessionMemory(RetrievalConfig())
+    first = memory.add_result(result("google_search", {"title": "Fighters of the Crystal"}))
+    assert memory.add_result(result("google_search", {"title": "Fighters of the Crystal"})) is first
+    assert memory.add_result({"operation_type": "google_search", "success": True, "omitted": "…"}) is None
+    assert len(memory.items) == 1
+
+
+def test_select_results_keeps_relevant_and_latest_results():
+    results = [
+        result("google_search", {"title": "FF11 AA戦のBGM Fighters of the Crystal"}),
+        result("database_query", [{"name": "商品A", "price": 1200}]),
+        result("google_search", {"title": "東京の天気"}),
+        result("database_query", {"blob": "blob:abc", "chars": 9000, "digest": {"count": 200}}),
+        result("spotify", {"status": "playing"}),
+    ]
+    selected = select_results(results, "AA戦のBGMを再生して", k=1, keep_last=1)
+    assert selected[0] == results[0]
+    assert selected[-1] == results[-1]
+    assert selected[2] == {"operation_type": "google_search", "success": True, "omitted": "東京の天気"}
+    # 省略してもハンドルは残し、blob_readで読み直せるようにする
+    assert selected[3]["blob"] == "blob:abc" and "digest" not in selected[3]
+    assert select_results(results[:2], "BGM", k=1, keep_last=1) == results[:2]
+
+
+def test_summary_recalls_older_relevant_context():
+    client = ThinkingClient(LLMConfig(api_key="test", model="test"), retrieval=RetrievalConfig(top_k=2, recent_messages=2))
+    client.add_user_message("ユーザーの入力: FF11のAA戦のBGMを調べて")
+    client.add_tool_result([result("google_search", {"title": "Fighters of the Crystal", "snippet": "AA戦のBGM"})])
+    client.add_assistant_message("AA戦のBGMはFighters of the Crystalです。")
+    for question, answer in (("東京の天気は？", "晴れです。"), ("おすすめの本は？", "こちらの本です。")):
+        client.add_user_message(f"ユーザーの入力: {question}")
+        client.add_assistant_message(answer)
+
+    summary = client.get_conversation_summary("さっきのAA戦のBGMを再生して")
+    assert "関連する過去の情報" in summary
+    assert "Fighters of the Crystal" in summary
+    assert "東京の天気" not in summary
+    # queryなしでは従来通り直近5件の会話
+    assert "東京の天気" in client.get_conversation_summary()
@@ -0,0 +1,56 @@
+from mcp_llm_bridge.config import LLMConfig, RoutingConfig
+from mcp_llm_bridge.router import FAST, REASONING, ModelRouter
+
+REASONING_MODEL = LLMConfig(api_key="k", model="o1-mini")
+FAST_MODEL = LLMConfig(api_key="k", model="gpt-4o")
+
+
+def make_router(**overrides):
+    return ModelRouter(REASONING_MODEL, FAST_MODEL, RoutingConfig(**overrides))
+
+
+def test_planning_uses_reasoning_and_summary_uses_fast_model():
+    router = make_router()
+    assert router.choose(0, "東京の天気を調べて").tier == REASONING
+    assert router.choose(1, "東京の天気を調べて", '[{"result": "晴れ"}]').tier == FAST
+
+
+def test_remaining_phases_and_large_results_stay_on_reasoning_model():
+    router = make_router(max_reasoning_calls_per_turn=5)
+    assert router.choose(1, "q", "[]", remaining_phases=1).tier == REASONING
+    assert router.choose(1, "q", "結果" * 5000).tier == REASONING
+
+
+def test_slow_reasoning_model_is_skipped_for_simple_questions():
+    router = make_router(latency_target_s=5.0)
+    route = router.choose(0, "こんにちは")
+    router.observe(route, 12.0)
+    router.start_turn()
+    assert router.choose(0, "こんにちは").tier == FAST
+    # 長い質問は遅くても推論モデルで計画する
+    assert router.choose(0, "詳しく比較して" * 30).tier == REASONING
+    assert router.latency(REASONING) == 12.0
+
+
+def test_reasoning_budget_is_per_turn():
+    router = make_router(max_reasoning_calls_per_turn=1)
+    assert router.choose(0, "q").tier == REASONING
+    assert router.choose(1, "q", "[]", remaining_phases=2).tier == FAST
+    router.start_turn()
+    assert router.choose(0, "q").tier == REASONING
+
+
+def test_fast_model_failure_falls_back_to_reasoning_for_the_turn():
+    router = make_router(max_reasoning_calls_per_turn=5)
+    route = router.choose(1, "q", "[]")
+    assert route.tier == FAST
+    router.record_failure(route)
+    assert router.choose(2, "q", "[]").tier == REASONING
+    router.start_turn()
+    assert router.choose(1, "q", "[]").tier == FAST
+
+
+def test_routing_disabled_without_a_distinct_fast_model():
+    assert ModelRouter(REASONING_MODEL, REASONING_MODEL).choose(1, "q", "[]").tier == REASONING
+    assert ModelRouter(REASONING_MODEL, None).choose(1, "q", "[]").tier == REASONING
+    assert make_router(enabled=False).choose(1, "q", "[]").tier == REASONING
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import pytest
+from mcp_llm_bridge.cache import SQLiteCache, TieredCache, TTLCache, normalize_query
+from mcp_llm_bridge.tools.search import GoogleSearchTool, SearchHighlights, canonical_url
+
+@pytest.fixture
+async def search_tool(monkeypatch, tmp_path):
+    monkeypatch.setenv("SERPAPI_KEY", "test-key")
+    monkeypatch.setenv("SEARCH_CACHE_DB", str(tmp_path / "search_cache.db"))
+    tool = GoogleSearchTool()
+    yield tool
+    await tool.close()
+
+def test_normalize_query_folds_case_width_and_whitespace():
+    assert normalize_query("  ＦＦ１１　ＢＧＭ ") == "ff11 bgm"
+    assert normalize_query("Ff11\tBgm") == "ff11 bgm"
+    assert normalize_query("ｶﾀｶﾅ") == normalize_query("カタカナ")
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(ttl=-1)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_new_instance(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    first = TieredCache(TTLCache(), SQLiteCache(db_path))
+    await first.set("key", [{"title": "t"}])
+    first.close()
+
+    second = TieredCache(TTLCache(), SQLiteCache(db_path))
+    assert await second.get("key") == [{"title": "t"}]
+    assert second.disk_hits == 1
+    second.close()
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_are_coalesced(search_tool):
+    calls = []
+
+    async def fake_search(query, num_results, start=0):
+        calls.append((query, num_results))
+        await asyncio.sleep(0.05)
+        return {"results": [{"title": query}]}
+
+    search_tool._search = fake_search
+    results = await asyncio.gather(
+        search_tool.execute({"query": "FF11 BGM"}),
+        search_tool.execute({"query": "ｆｆ１１　ｂｇｍ"}),
+        search_tool.execute({"query": "ff11  bgm"}),
+    )
+
+    assert len(calls) == 1
+    assert all(r == {"results": [{"title": "FF11 BGM"}]} for r in results)
+    assert search_tool.cache.stats()["coalesced"] == 2
+
+    await search_tool.execute({"query": "ff11 bgm"})
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_waiters_refetch_when_the_leading_search_is_cancelled(search_tool):
+    calls = []
+
+    async def fake_search(query, num_results, start=0):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return {"results": [{"title": query}]}
+
+    search_tool._search = fake_search
+    leader = asyncio.create_task(search_tool.execute({"query": "FF11 BGM"}))
+    await asyncio.sleep(0.01)
+    waiter = asyncio.create_task(search_tool.execute({"query": "FF11 BGM"}))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    assert await asyncio.wait_for(waiter, 2) == {"results": [{"title": "FF11 BGM"}]}
+    assert leader.cancelled()
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_failed_search_is_not_cached(search_tool):
+    calls = []
+
+    async def failing_search(query, num_results, start=0):
+        calls.append(query)
+        raise ValueError("boom")
+
+    search_tool._search = failing_search
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await search_tool.execute({"query": "q"})
+    assert len(calls) == 2
+
+def test_canonical_url_ignores_tracking_and_cosmetic_differences():
+    assert canonical_url("https://www.example.com/a/?utm_source=x&b=2&a=1#top") == \
+        canonical_url("http://example.com/a?a=1&b=2")
+    assert canonical_url("https://example.com/a") != canonical_url("https://example.com/b")
+
+def test_merge_rankings_fuses_and_deduplicates():
+    first = [
+        {"title": "A", "link": "https://a.example/", "snippet": "a"},
+        {"title": "B", "link": "https://b.example/", "snippet": "b"},
+    ]
+    second = [
+        {"title": "B", "link": "https://www.b.example/?utm_medium=x", "snippet": "b"},
+        {"title": "C", "link": "https://c.example/", "snippet": "c"},
+    ]
+    merged = GoogleSearchTool.merge_rankings([(0, first), (0, second)], max_results=10)
+
+    assert [r["title"] for r in merged] == ["B", "A", "C"]
+    assert merged[0]["hits"] == 2
+    assert [r["position"] for r in merged] == [1, 2, 3]
+
+@pytest.mark.asyncio
+async def test_execute_batch_fans_out_queries_and_pages(search_tool):
+    calls = []
+
+    async def fake_search(query, num_results, start=0):
+        calls.append((query, start))
+        if query == "broken":
+            raise ValueError("quota exceeded")
+        return {"results": [
+            {"title": f"{query}-{start}", "link": f"https://{query}.example/{start}", "snippet": ""}
+        ]}
+
+    search_tool._search = fake_search
+    result = await search_tool.execute_batch({
+        "queries": ["alpha", "ALPHA", "beta", "broken"],
+        "pages": 2,
+        "max_results": 3
+    })
+
+    assert sorted(calls) == [
+        ("alpha", 0), ("alpha", 10), ("beta", 0), ("beta", 10), ("broken", 0), ("broken", 10)
+    ]
+    assert result["queries"] == ["alpha", "beta", "broken"]
+    assert len(result["results"]) == 3
+    assert {f["query"] for f in result["failed"]} == {"broken"}
+
+@pytest.mark.asyncio
+async def test_execute_batch_requires_queries(search_tool):
+    with pytest.raises(ValueError):
+        await search_tool.execute_batch({"queries": []})
+
+SERPAPI_RESPONSE = {
+    "answer_box": {"type": "organic_result", "answer": "Fighters of the Crystal", "title": "AA BGM",
+                   "link": "https://example.com/aa"},
+    "knowledge_graph": {"title": "ファイナルファンタジーXI", "type": "ゲーム", "description": "MMORPG",
+                        "release_date": "2002年5月16日", "developer_links": [{"text": "x"}],
+                        "source": {"name": "Wikipedia", "link": "https://ja.wikipedia.org/wiki/FF11"}},
+    "top_stories": [{"title": f"news {i}", "source": "paper", "link": f"https://n.example/{i}"}
+                    for i in range(5)],
+    "related_questions": [{"question": f"question {i}?", "snippet": "s" * 300} for i in range(4)],
+}
+
+def test_highlights_are_extracted_from_serpapi_response():
+    highlights = SearchHighlights.from_serpapi(SERPAPI_RESPONSE).to_dict(budget=10000)
+
+    assert highlights["answer_box"]["answer"] == "Fighters of the Crystal"
+    assert highlights["knowledge_graph"]["attributes"] == {"release_date": "2002年5月16日"}
+    assert highlights["knowledge_graph"]["link"] == "https://ja.wikipedia.org/wiki/FF11"
+    assert len(highlights["top_stories"]) == 3
+    assert len(highlights["related_questions"]) == 3
+
+def test_highlights_respect_size_budget():
+    highlights = SearchHighlights.from_serpapi(SERPAPI_RESPONSE).to_dict(budget=400)
+
+    assert len(json.dumps(highlights, ensure_ascii=False)) <= 400
+    assert highlights["answer_box"]["answer"] == "Fighters of the Crystal"
+    assert "related_questions" not in highlights
+
+def test_empty_highlights_serialise_to_empty_dict():
+    assert SearchHighlights.from_serpapi({"organic_results": []}).to_dict() == {}
+
+@pytest.mark.asyncio
+async def test_execute_against_local_serpapi(monkeypatch, tmp_path):
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    async def search(request):
+        assert request.query["q"] == "FF11 AA BGM"
+        return web.json_response({
+            **SERPAPI_RESPONSE,
+            "organic_results": [
+                {"title": "t", "link": "https://example.com/", "snippet": "s", "position": 1}
+            ]
+        })
+
+    app = web.Application()
+    app.router.add_get("/search", search)
+    server = TestServer(app)
+    await server.start_server()
+    monkeypatch.setenv("SERPAPI_KEY", "test-key")
+    monkeypatch.setenv("SERPAPI_BASE_URL", str(server.make_url("/search")))
+    monkeypatch.setenv("SEARCH_CACHE_DB", "")
+    tool = GoogleSearchTool()
+    try:
+        result = await tool.execute({"query": "FF11 AA BGM", "num_results": 3})
+    finally:
+        await tool.close()
+        await server.close()
+
+    assert result["results"][0]["link"] == "https://example.com/"
+    assert result["highlights"]["answer_box"]["answer"] == "Fighters of the Crystal"
@@ -0,0 +1,268 @@
+import asyncio
+import time
+import pytest
+from mcp_llm_bridge.ratelimit import SPOTIFY, limiters
+from mcp_llm_bridge.tools.spotify import SpotifyTool
+
+class FakeSpotify:
+    """spotipy.Spotifyの代わりに使う同期スタブ"""
+
+    def __init__(self, playing_after=0.2):
+        self.playing_after = playing_after
+        self.started_at = None
+        self.calls = []
+
+    def devices(self):
+        self.calls.append("devices")
+        time.sleep(0.05)  # 同期HTTP呼び出しの代わり
+        return {"devices": [{"id": "dev1", "name": "PC", "is_active": True}]}
+
+    def transfer_playback(self, device_id, force_play=True):
+        self.calls.append("transfer_playback")
+
+    def start_playback(self, device_id=None, uris=None, context_uri=None):
+        self.calls.append("start_playback")
+        self.started_at = time.monotonic()
+
+    def current_playback(self):
+        self.calls.append("current_playback")
+        playing = self.started_at is not None and time.monotonic() - self.started_at >= self.playing_after
+        return {
+            "is_playing": playing,
+            "device": {"id": "dev1"},
+            "item": {"id": "track1"} if playing else None
+        }
+
+@pytest.fixture
+def spotify_tool(monkeypatch):
+    monkeypatch.setenv("SPOTIFY_CLIENT_ID", "client-id")
+    monkeypatch.setenv("SPOTIFY_CLIENT_SECRET", "client-secret")
+    tool = SpotifyTool()
+    yield tool
+    tool.close()
+
+@pytest.mark.asyncio
+async def test_play_returns_as_soon_as_playback_is_confirmed(spotify_tool):
+    spotify_tool.sp = FakeSpotify(playing_after=0.2)
+
+    start = time.monotonic()
+    result = await spotify_tool.execute({"action": "play", "track_id": "track1"})
+    elapsed = time.monotonic() - start
+
+    assert result == {"status": "playing", "track_id": "track1", "device": "PC"}
+    assert elapsed < 1.5
+
+@pytest.mark.asyncio
+async def test_spotify_calls_do_not_block_event_loop(spotify_tool):
+    spotify_tool.sp = FakeSpotify()
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    await asyncio.gather(*(spotify_tool.get_devices() for _ in range(4)))
+    task.cancel()
+
+    assert ticks >= 3
+
+@pytest.mark.asyncio
+async def test_play_reports_failure_after_deadline(spotify_tool):
+    spotify_tool.sp = FakeSpotify(playing_after=60)
+    spotify_tool.playback_timeout = 0.3
+
+    result = await spotify_tool.execute({"action": "play", "track_id": "track1"})
+
+    assert result["status"] == "playback_failed"
+
+@pytest.mark.asyncio
+async def test_device_list_is_fetched_once_and_active_device_not_transferred(spotify_tool):
+    fake = FakeSpotify()
+    spotify_tool.sp = fake
+
+    await spotify_tool.execute({"action": "play", "track_id": "track1"})
+    await spotify_tool.get_active_device()
+
+    assert fake.calls.count("devices") == 1
+    assert "transfer_playback" not in fake.calls
+    assert spotify_tool.state.snapshot() == {
+        "is_playing": True, "current_track_id": "track1", "current_device": None
+    }
+
+@pytest.mark.asyncio
+async def test_search_warms_inactive_device(spotify_tool):
+    fake = FakeSpotify()
+    fake.devices = lambda: {"devices": [{"id": "dev1", "name": "PC", "is_active": False}]}
+    fake.search = lambda q, limit: {"tracks": {"items": [{
+        "id": "track1", "name": "EZ DO DANCE", "artists": [{"name": "TRF"}],
+        "album": {"name": "EZ DO DANCE"}, "external_urls": {"spotify": "https://open.spotify.com/track/track1"}
+    }]}}
+    spotify_tool.sp = fake
+
+    await spotify_tool.execute({"action": "search", "query": "TRF"})
+    await spotify_tool._warming
+
+    assert fake.calls.count("transfer_playback") == 1
+    assert (await spotify_tool.get_active_device())["id"] == "dev1"
+
+def make_track(track_id):
+    return {
+        "id": track_id, "name": f"song {track_id}", "artists": [{"name": "TRF"}],
+        "album": {"name": "album"}, "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"}
+    }
+
+@pytest.mark.asyncio
+async def test_search_results_are_cached_by_normalised_query(spotify_tool):
+    fake = FakeSpotify()
+    searches = []
+
+    def search(q, limit):
+        searches.append(q)
+        return {"tracks": {"items": [make_track("t1"), make_track("t2")]}}
+
+    fake.search = search
+    spotify_tool.sp = fake
+
+    first = await spotify_tool.execute({"action": "search", "query": "TRF 有名曲"})
+    second = await spotify_tool.execute({"action": "search", "query": "ｔｒｆ　有名曲"})
+
+    assert first == second
+    assert searches == ["TRF 有名曲"]
+
+@pytest.mark.asyncio
+async def test_tracks_resolves_only_uncached_ids_in_one_call(spotify_tool):
+    fake = FakeSpotify()
+    lookups = []
+
+    def tracks(ids):
+        lookups.append(list(ids))
+        return {"tracks": [make_track(i) for i in ids]}
+
+    fake.tracks = tracks
+    spotify_tool.sp = fake
+    spotify_tool.track_cache.set("t1", spotify_tool._format_track(make_track("t1")))
+
+    result = await spotify_tool.execute({
+        "action": "tracks",
+        "track_ids": ["t1", "spotify:track:t2", "https://open.spotify.com/track/t3?si=x"]
+    })
+
+    assert [t["id"] for t in result["tracks"]] == ["t1", "t2", "t3"]
+    assert lookups == [["t2", "t3"]]
+
+@pytest.mark.asyncio
+async def test_play_multiple_tracks_and_queue_in_one_operation(spotify_tool):
+    fake = FakeSpotify(playing_after=0)
+    started = []
+    queued = []
+    fake.start_playback = lambda device_id=None, uris=None, context_uri=None: (
+        started.append(uris or context_uri), setattr(fake, "started_at", time.monotonic())
+    )
+    fake.add_to_queue = lambda uri, device_id=None: queued.append(uri)
+    spotify_tool.sp = fake
+
+    played = await spotify_tool.execute({"action": "play", "track_ids": ["track1", "t2", "track1"]})
+    queued_result = await spotify_tool.execute({"action": "add_to_queue", "track_ids": ["t3", "t4"]})
+    album = await spotify_tool.execute({
+        "action": "play", "context_uri": "https://open.spotify.com/album/abc123"
+    })
+
+    assert started[0] == ["spotify:track:track1", "spotify:track:t2"]
+    assert played["track_ids"] == ["track1", "t2"]
+    assert queued == ["spotify:track:t3", "spotify:track:t4"]
+    assert queued_result["track_ids"] == ["t3", "t4"]
+    assert started[1] == "spotify:album:abc123"
+    assert album["status"] == "playing"
+
+@pytest.mark.asyncio
+async def test_queue_failure_reports_tracks_already_added(spotify_tool, monkeypatch):
+    fake = FakeSpotify()
+    queued = []
+
+    def add_to_queue(uri, device_id=None):
+        if uri.endswith("t5"):
+            raise RuntimeError("boom")
+        queued.append(uri)
+
+    fake.add_to_queue = add_to_queue
+    spotify_tool.sp = fake
+    grants = []
+    acquire = limiters.acquire
+
+    async def counting_acquire(name, *args, **kwargs):
+        grants.append(name)
+        return await acquire(name, *args, **kwargs)
+
+    monkeypatch.setattr(limiters, "acquire", counting_acquire)
+    result = await spotify_tool.execute({"action": "add_to_queue", "track_ids": ["t3", "t4", "t5", "t6"]})
+
+    assert queued == ["spotify:track:t3", "spotify:track:t4"]
+    assert result["track_ids"] == ["t3", "t4"] and "boom" in result["error"]
+    # 1曲ごとにレート制限を通す（デバイスの確認を除いて3回）
+    assert grants.count(SPOTIFY) - fake.calls.count("devices") == 3
+
+class FakeOAuth:
+    """SpotifyOAuthの代わりに使うスタブ"""
+
+    def __init__(self, cache_handler, lifetime=3600):
+        self.cache_handler = cache_handler
+        self.lifetime = lifetime
+        self.refreshes = 0
+
+    def refresh_access_token(self, refresh_token):
+        self.refreshes += 1
+        token_info = {
+            "access_token": f"token-{self.refreshes}",
+            "refresh_token": refresh_token,
+            "expires_at": time.time() + self.lifetime
+        }
+        self.cache_handler.save_token_to_cache(token_info)
+        return token_info
+
+def test_atomic_cache_handler_round_trip(tmp_path):
+    import os
+    from mcp_llm_bridge.tools.spotify_auth import AtomicCacheFileHandler
+
+    handler = AtomicCacheFileHandler(str(tmp_path / ".cache"))
+    assert handler.get_cached_token() is None
+    handler.save_token_to_cache({"access_token": "a"})
+
+    assert handler.get_cached_token() == {"access_token": "a"}
+    assert oct(os.stat(tmp_path / ".cache").st_mode & 0o777) == "0o600"
+    assert os.listdir(tmp_path) == [".cache"]
+
+def test_token_manager_serves_valid_token_without_refresh(tmp_path):
+    from mcp_llm_bridge.tools.spotify_auth import AtomicCacheFileHandler, SpotifyTokenManager
+
+    handler = AtomicCacheFileHandler(str(tmp_path / ".cache"))
+    handler.save_token_to_cache({"access_token": "cached", "refresh_token": "r", "expires_at": time.time() + 3600})
+    oauth = FakeOAuth(handler)
+    manager = SpotifyTokenManager(oauth, refresh_margin=300)
+
+    assert manager.get_access_token() == "cached"
+    assert oauth.refreshes == 0
+
+def test_token_manager_refreshes_in_background_before_expiry(tmp_path):
+    from mcp_llm_bridge.tools.spotify_auth import AtomicCacheFileHandler, SpotifyTokenManager
+
+    handler = AtomicCacheFileHandler(str(tmp_path / ".cache"))
+    handler.save_token_to_cache({"access_token": "old", "refresh_token": "r", "expires_at": time.time() + 120})
+    oauth = FakeOAuth(handler)
+    manager = SpotifyTokenManager(oauth, refresh_margin=300)
+
+    # 期限まで余裕があるうちは古いトークンをすぐ返す
+    assert manager.get_access_token() == "old"
+    manager.start()
+    try:
+        for _ in range(100):
+            if manager.refresh_count:
+                break
+            time.sleep(0.01)
+    finally:
+        manager.stop()
+
+    assert manager.get_access_token() == "token-1"
+    assert handler.get_cached_token()["access_token"] == "token-1"
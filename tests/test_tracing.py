@@ -0,0 +1,98 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from types import SimpleNamespace
+from mcp_llm_bridge.tracing import JsonlSpanExporter, Tracer, record_usage
+
+@pytest.fixture
+def tracer(tmp_path):
+    tracer = Tracer(JsonlSpanExporter(str(tmp_path / "traces.jsonl")))
+    yield tracer
+    tracer.close()
+
+def read_spans(path):
+    spans = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        record = json.loads(line)
+        spans.extend(record["resourceSpans"][0]["scopeSpans"][0]["spans"])
+    return spans
+
+@pytest.mark.asyncio
+async def test_spans_nest_across_tasks_and_export_otlp_jsonl(tracer, tmp_path):
+    async def tool(name):
+        with tracer.span(f"tool.{name}"):
+            await asyncio.sleep(0.01)
+
+    with tracer.span("process_message") as root:
+        with tracer.span("think") as think:
+            record_usage(think, SimpleNamespace(usage=SimpleNamespace(
+                prompt_tokens=120, completion_tokens=80, total_tokens=200,
+                completion_tokens_details=SimpleNamespace(reasoning_tokens=64)
+            )))
+        await asyncio.gather(asyncio.create_task(tool("google_search")), tool("database_query"))
+
+    tracer.flush()
+    spans = {span["name"]: span for span in read_spans(tmp_path / "traces.jsonl")}
+    assert set(spans) == {"process_message", "think", "tool.google_search", "tool.database_query"}
+    assert "parentSpanId" not in spans["process_message"]
+    for name in ("think", "tool.google_search", "tool.database_query"):
+        assert spans[name]["parentSpanId"] == root.span_id
+        assert spans[name]["traceId"] == root.trace_id
+    attributes = {a["key"]: a["value"] for a in spans["think"]["attributes"]}
+    assert attributes["llm.usage.reasoning_tokens"] == {"intValue": "64"}
+    assert spans["think"]["status"] == {"code": "STATUS_CODE_OK"}
+
+    assert tracer.last_summary["tokens"] == {
+        "prompt_tokens": 120, "completion_tokens": 80, "reasoning_tokens": 64, "total_tokens": 200
+    }
+
+def test_summary_follows_critical_path(tracer):
+    with tracer.span("process_message"):
+        with tracer.span("think"):
+            time.sleep(0.02)
+        with tracer.span("tool.google_search"):
+            with tracer.span("page_fetch"):
+                time.sleep(0.01)
+        with tracer.span("think"):
+            time.sleep(0.02)
+
+    summary = tracer.last_summary
+    assert [step["name"] for step in summary["critical_path"]] == [
+        "think", "tool.google_search", "page_fetch", "think"
+    ]
+    assert summary["total_ms"] >= 50
+    assert "think" in tracer.format_summary(summary)
+
+def test_export_writes_off_the_calling_thread(tracer, tmp_path, monkeypatch):
+    writers = []
+    real_dumps = json.dumps
+
+    def recording_dumps(*args, **kwargs):
+        writers.append(threading.current_thread().name)
+        return real_dumps(*args, **kwargs)
+
+    monkeypatch.setattr("mcp_llm_bridge.tracing.json.dumps", recording_dumps)
+    with tracer.span("process_message"):
+        pass
+    tracer.flush()
+    assert writers == ["span-exporter"]
+    assert [span["name"] for span in read_spans(tmp_path / "traces.jsonl")] == ["process_message"]
+
+def test_errors_are_recorded_and_late_spans_only_exported(tracer, tmp_path):
+    with tracer.span("process_message") as root:
+        with pytest.raises(ValueError):
+            with tracer.span("tool.database_query"):
+                raise ValueError("bad sql")
+    # ターン終了後に終わるスパン（音声再生など）
+    with tracer.span("tts.utterance", parent=root):
+        pass
+
+    tracer.flush()
+    spans = {span["name"]: span for span in read_spans(tmp_path / "traces.jsonl")}
+    assert spans["tool.database_query"]["status"] == {
+        "code": "STATUS_CODE_ERROR", "message": "ValueError: bad sql"
+    }
+    assert spans["tts.utterance"]["parentSpanId"] == root.span_id
+    assert tracer.last_summary["critical_path"][0]["name"] == "tool.database_query"
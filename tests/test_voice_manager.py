@@ -0,0 +1,233 @@
+import asyncio
+import io
+import tempfile
+import time
+import wave
+import pygame
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from mcp_llm_bridge.cache import DiskLRUCache
+from mcp_llm_bridge.deadline import current_deadline, deadline_scope
+from mcp_llm_bridge.ratelimit import Priority, current_priority, priority_scope
+from mcp_llm_bridge.voice_manager import VoiceManager, split_sentences
+
+@pytest.fixture
+async def nijivoice_server():
+    """にじボイスAPIの代わりに使うローカルサーバー"""
+    state = {"scripts": [], "delay": 0.05}
+
+    async def generate(request):
+        payload = await request.json()
+        state["scripts"].append(payload["script"])
+        index = len(state["scripts"]) - 1
+        await asyncio.sleep(state["delay"])
+        return web.json_response({
+            "generatedVoice": {"audioFileUrl": str(request.url.with_path(f"/audio/{index}"))}
+        })
+
+    async def audio(request):
+        index = int(request.match_info["index"])
+        return web.Response(body=f"audio:{state['scripts'][index]}".encode(), content_type="audio/mpeg")
+
+    app = web.Application()
+    app.router.add_post("/v1/voice-actors/{actor}/generate-voice", generate)
+    app.router.add_get("/audio/{index}", audio)
+    server = TestServer(app)
+    await server.start_server()
+    server.state = state
+    yield server
+    await server.close()
+
+@pytest.fixture
+async def voice_manager(monkeypatch, tmp_path, nijivoice_server):
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    monkeypatch.setenv("VOICE_CACHE_DIR", str(tmp_path / "voice_cache"))
+    monkeypatch.setenv("NIJIVOICE_API_KEY", "test-key")
+    monkeypatch.setenv("NIJIVOICE_API_BASE_URL", str(nijivoice_server.make_url("/v1")))
+    manager = VoiceManager()
+    played = []
+
+    async def fake_play(audio_data):
+        played.append(audio_data.decode())
+        await asyncio.sleep(0.1)
+
+    manager.play_audio = fake_play
+    manager.played = played
+    yield manager
+    await manager.close()
+
+@pytest.mark.asyncio
+async def test_speak_returns_immediately_and_plays_in_background(voice_manager):
+    start = time.monotonic()
+    voice_manager.speak("こんにちは")
+    assert time.monotonic() - start < 0.01
+
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+    assert voice_manager.played == ["audio:こんにちは"]
+
+@pytest.mark.asyncio
+async def test_utterances_queue_in_order(voice_manager):
+    voice_manager.speak("一つ目")
+    voice_manager.speak("二つ目")
+
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+    assert voice_manager.played == ["audio:一つ目", "audio:二つ目"]
+
+@pytest.mark.asyncio
+async def test_preempt_drops_current_and_pending_utterances(voice_manager):
+    voice_manager.speak("古い応答")
+    voice_manager.speak("待機中の応答")
+    await asyncio.sleep(0.01)
+    voice_manager.speak("新しい応答", preempt=True)
+
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+    assert voice_manager.played == ["audio:新しい応答"]
+
+@pytest.mark.asyncio
+async def test_preempt_without_mixer_still_queues_utterance(voice_manager, monkeypatch):
+    def stop():
+        raise pygame.error("mixer not initialized")
+
+    monkeypatch.setattr(pygame.mixer, "get_init", lambda: None)
+    monkeypatch.setattr(pygame.mixer.music, "stop", stop)
+    voice_manager.speak("新しい応答", preempt=True)
+
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+    assert voice_manager.played == ["audio:新しい応答"]
+
+@pytest.mark.asyncio
+async def test_worker_does_not_inherit_the_first_turn_deadline(voice_manager):
+    seen = []
+    original_synthesize = voice_manager.synthesize
+
+    async def synthesize(text):
+        seen.append((current_deadline(), current_priority()))
+        return await original_synthesize(text)
+
+    voice_manager.synthesize = synthesize
+    with deadline_scope(0.05), priority_scope(Priority.BACKGROUND):
+        voice_manager.speak("一つ目")
+        await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+    await asyncio.sleep(0.1)  # 最初のターンの期限を過ぎる
+    with deadline_scope(90):
+        voice_manager.speak("二つ目")
+        await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+
+    assert voice_manager.played == ["audio:一つ目", "audio:二つ目"]
+    assert seen == [(None, Priority.INTERACTIVE)] * 2
+
+def test_split_sentences_keeps_first_sentence_short():
+    text = "はい。今日は晴れです！明日は雨でしょう。週末はどうなるかな？"
+    chunks = split_sentences(text, max_chars=20)
+    assert chunks[0] == "はい。"
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 20 for chunk in chunks)
+
+def test_split_sentences_breaks_long_sentences():
+    text = "これはとても長い文で、読点で区切られていて、さらに続きがあります。"
+    chunks = split_sentences(text, max_chars=12)
+    assert chunks[0].endswith("、")
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 12 for chunk in chunks)
+
+    english = "Hello there. This is a test."
+    assert split_sentences(english, max_chars=100) == ["Hello there.", "This is a test."]
+
+def test_split_sentences_keeps_spaces_between_english_sentences():
+    english = "Hello there. This is a test. And more text here."
+    assert split_sentences(english, max_chars=100) == ["Hello there.", "This is a test. And more text here."]
+    # 長い文を空白で切った後にまとめても単語はつながらない
+    chunks = split_sentences("One two three four five six seven eight nine ten.", max_chars=20)
+    assert " ".join(chunks) == "One two three four five six seven eight nine ten."
+    mixed = "はい。Spotifyで再生します。Enjoy the music. 次の曲です。"
+    assert split_sentences(mixed, max_chars=100) == ["はい。", "Spotifyで再生します。Enjoy the music.次の曲です。"]
+
+@pytest.mark.asyncio
+async def test_chunks_play_in_order_while_later_chunks_render(voice_manager, nijivoice_server):
+    nijivoice_server.state["delay"] = 0.2
+    voice_manager.chunk_chars = 8
+    start = time.monotonic()
+    first_played = []
+    original_play = voice_manager.play_audio
+
+    async def timed_play(audio_data):
+        first_played.append(time.monotonic() - start)
+        await original_play(audio_data)
+
+    voice_manager.play_audio = timed_play
+    voice_manager.speak("一文目。二文目です。三文目です。")
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 5)
+
+    assert voice_manager.played == ["audio:一文目。", "audio:二文目です。", "audio:三文目です。"]
+    # 最初のチャンクは1回分の合成時間で再生が始まる
+    assert first_played[0] < 0.35
+    # 合成は並行して進むので、全体は直列（合成3回＋再生3回）より短い
+    assert first_played[-1] < 0.2 * 3 + 0.1 * 2
+
+def test_disk_lru_cache_evicts_by_total_bytes_and_survives_restart(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=10, suffix=".mp3")
+    cache.set("a", b"aaaa")
+    cache.set("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"  # aはbより最近使われた
+    cache.set("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.total_bytes == 8
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.mp3", "c.mp3"]
+
+    reopened = DiskLRUCache(str(tmp_path), max_bytes=10, suffix=".mp3")
+    assert reopened.get("c") == b"cccc"
+    assert reopened.total_bytes == 8
+
+@pytest.mark.asyncio
+async def test_repeated_phrases_are_served_from_cache(voice_manager, nijivoice_server):
+    voice_manager.speak("もう一度どうぞ。")
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+    voice_manager.speak("もう一度どうぞ。")
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+
+    assert voice_manager.played == ["audio:もう一度どうぞ。"] * 2
+    assert nijivoice_server.state["scripts"] == ["もう一度どうぞ。"]
+    stats = voice_manager.cache_stats()
+    assert stats["hits"] == 1 and stats["hit_rate"] == 0.5
+
+    # 速度が変われば別の音声としてキャッシュする
+    key = voice_manager.cache_key("もう一度どうぞ。")
+    voice_manager.speed = "1.5"
+    assert voice_manager.cache_key("もう一度どうぞ。") != key
+    voice_manager.speak("もう一度どうぞ。")
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+    assert len(nijivoice_server.state["scripts"]) == 2
+
+@pytest.mark.asyncio
+async def test_prewarm_synthesizes_canned_phrases_once(voice_manager, nijivoice_server):
+    voice_manager.prewarm(["申し訳ありません。応答を生成できませんでした。", "申し訳ありません。結果を取得できませんでした。"])
+    voice_manager.speak("申し訳ありません。")
+    await asyncio.wait_for(voice_manager._prewarm, 2)
+    await asyncio.wait_for(voice_manager.wait_until_idle(), 2)
+
+    # 共通の「申し訳ありません。」は進行中の合成を共有して1回だけ合成される
+    assert sorted(nijivoice_server.state["scripts"]) == sorted([
+        "申し訳ありません。", "応答を生成できませんでした。", "結果を取得できませんでした。"
+    ])
+
+@pytest.mark.asyncio
+async def test_play_audio_reads_from_memory_without_temp_files(monkeypatch, tmp_path):
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    monkeypatch.setenv("NIJIVOICE_API_KEY", "test-key")
+    monkeypatch.setenv("VOICE_CACHE_DIR", "")
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    manager = VoiceManager()
+    manager.audio_format = "wav"
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(22050)
+        wav.writeframes(b"\0\0" * 2205)
+
+    await asyncio.wait_for(manager.play_audio(buffer.getvalue()), 2)
+    assert list(tmp_path.iterdir()) == []
+    await manager.close()